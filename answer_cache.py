@@ -0,0 +1,133 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by question embedding: a new question whose cosine
+    similarity to a cached one (in the same namespace) is >= threshold gets
+    the cached answer. LRU eviction beyond max_entries, optional TTL, and
+    optional persistence to <path>.npz across restarts.
+    """
+
+    def __init__(self, threshold=0.9, max_entries=512, ttl_seconds=None, path=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self._entries = OrderedDict()   # id -> {"namespace", "question", "answer", "created"}
+        self._vectors = {}              # id -> unit-norm float32 vector
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expired = 0
+
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    @staticmethod
+    def _unit(vector):
+        v = np.asarray(vector, dtype="float32").reshape(-1)
+        n = np.linalg.norm(v)
+        return v / n if n else v
+
+    def _expire(self, now):
+        if self.ttl_seconds is None:
+            return
+        stale = [i for i, e in self._entries.items() if now - e["created"] > self.ttl_seconds]
+        for i in stale:
+            del self._entries[i], self._vectors[i]
+        self.expired += len(stale)
+
+    def lookup(self, vector, namespace: str):
+        """Cached answer for the closest question in namespace, or None."""
+        v = self._unit(vector)
+        with self._lock:
+            self._expire(time.time())
+            ids = [i for i, e in self._entries.items() if e["namespace"] == namespace]
+            if ids:
+                sims = np.stack([self._vectors[i] for i in ids]) @ v
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    metrics.count("answer_cache_hits")
+                    return self._entries[ids[best]]["answer"]
+            self.misses += 1
+            metrics.count("answer_cache_misses")
+            return None
+
+    def store(self, vector, question: str, answer: str, namespace: str):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "namespace": namespace,
+                "question": question,
+                "answer": answer,
+                "created": time.time(),
+            }
+            self._vectors[entry_id] = self._unit(vector)
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries beyond max_entries."""
+        while len(self._entries) > self.max_entries:
+            old_id, _ = self._entries.popitem(last=False)
+            del self._vectors[old_id]
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+    def save(self):
+        """Write vectors + entries (as JSON) to <path>.npz via temp file + rename."""
+        if not self.path:
+            return
+        with self._lock:
+            ids = list(self._entries)
+            meta = [self._entries[i] for i in ids]
+            vectors = np.stack([self._vectors[i] for i in ids]) if ids else np.empty((0, 0), "float32")
+
+        tmp = f"{self.path}.tmp.npz"
+        np.savez(tmp, vectors=vectors, meta=np.array(json.dumps(meta)))
+        os.replace(tmp, f"{self.path}.npz")
+
+    def load(self):
+        """Read <path>.npz (saved least recently used first), trimmed to max_entries."""
+        try:
+            with np.load(f"{self.path}.npz", allow_pickle=False) as data:
+                vectors = data["vectors"]
+                meta = json.loads(str(data["meta"]))
+        except (OSError, ValueError, KeyError):
+            return
+
+        with self._lock:
+            for entry, vector in zip(meta, vectors):
+                self._entries[self._next_id] = entry
+                self._vectors[self._next_id] = vector
+                self._next_id += 1
+            self._expire(time.time())
+            self._evict()
@@ -1,20 +1,23 @@
-from transformers import pipeline
+import threading
+from collections import defaultdict
 
-# Load once
-flan = pipeline(
-    "text2text-generation",
-    model="google/flan-t5-base",
-    device=-1   # CPU (-1), or 0 if you have GPU
+import metrics
+from generation import (   # shared Flan-T5
+    generate_text, generate_texts, get_profile, profile_kwargs, prompt_budgets, token_lengths, truncate_tokens
 )
 
-def summarize_context(context: str, max_chars: int = 1200) -> str:
-    """
-    Summarizes long retrieved context into a shorter passage
-    to fit Flan-T5 input size (≤ 512 tokens).
-    """
-    context = context[:3000]  # truncate to avoid overflow
+# Sentences whose word sets overlap at least this much (Jaccard) are packed once.
+DEDUP_JACCARD = 0.8
+# The former rule summarized every context over this many characters; kept
+# only to count the summarization passes the token-aware packer avoids.
+SUMMARIZE_OVER_CHARS = 1200
 
-    prompt = f"""
+_stats = defaultdict(int)
+_stats_lock = threading.Lock()
+
+
+def _summary_prompt(context: str) -> str:
+    return f"""
     Summarize the following text in a clear way using bullet points (4–6 bullets).
     - Each bullet point should be a complete sentence.
     - Avoid repetition.
@@ -23,59 +26,163 @@ def summarize_context(context: str, max_chars: int = 1200) -> str:
     Text: {context}
     """
 
-    summary = flan(
-        prompt,
-        max_length=200,
-        min_length=60,
-        do_sample=True,
-        temperature=0.7,
-        top_p=0.9,
-        top_k=50,
-        repetition_penalty=2.0
-    )[0]['generated_text']
+
+def _answer_prompt(question: str, context: str) -> str:
+    return f"""
+    You are a helpful study assistant.
+    Question: {question}
+    Context: {context}
+
+    Write the answer as 4–6 bullet points:
+    - Each bullet should be short and clear.
+    - Do not repeat the same idea.
+    - Keep it precise and relevant to the question.
+    """
+
+
+def _count(name: str, value=1):
+    with _stats_lock:
+        _stats[name] += value
+    metrics.count(f"context_{name}", value)
+
+
+def packing_stats() -> dict:
+    """Contexts packed, summarization passes run / skipped, truncations and sentences deduped / dropped."""
+    with _stats_lock:
+        stats = dict(_stats)
+    needed = stats.get("summaries_run", 0) + stats.get("summaries_skipped", 0)
+    stats["summary_skip_rate"] = round(stats.get("summaries_skipped", 0) / needed, 3) if needed else None
+    return stats
+
+
+def _dedupe(sentences: list[str]) -> list[str]:
+    """Sentences in order, without exact or near duplicates of an earlier one."""
+    kept, kept_words = [], []
+    for s in sentences:
+        words = set(s.lower().split())
+        if not words:
+            continue
+        if any(len(words & w) / len(words | w) >= DEDUP_JACCARD for w in kept_words):
+            continue
+        kept.append(s)
+        kept_words.append(words)
+    return kept
+
+
+def _pack(sentences: list[str], budget: int) -> dict:
+    """
+    Greedily keep the sentences (best first) whose tokens fit in budget
+    (the context tokens left in the prompt, question included). fits is
+    False when even the best sentence does not fit.
+    """
+    unique = _dedupe(sentences)
+    kept, used = [], 0
+    for sentence, n in zip(unique, token_lengths(unique)):
+        if used + n <= budget:
+            kept.append(sentence)
+            used += n
+    _count("contexts")
+    _count("sentences_deduped", len(sentences) - len(unique))
+    _count("sentences_dropped", len(unique) - len(kept))
+    return {
+        "context": " ".join(kept),
+        "fits": kept[:1] == unique[:1],
+        "unique": unique,
+        "tokens": used,
+        "budget": budget,
+        "raw_chars": len(" ".join(sentences)),
+    }
+
+
+def pack_context(question: str, sentences: list[str]) -> dict:
+    """
+    Fill the answer prompt's token budget with the retrieved sentences
+    (best first), skipping near-duplicates and sentences that no longer
+    fit. Returns context, fits (False: the best sentence alone is over
+    budget), the deduplicated sentences and the tokens used.
+    """
+    return _pack(sentences, prompt_budgets([_answer_prompt(question, "")])[0])
+
+
+def _resolve(packed: dict, profile) -> str | None:
+    """Context to answer from: packed, token-truncated (profiles without summaries), or None to summarize."""
+    if packed["fits"]:
+        if packed["raw_chars"] > SUMMARIZE_OVER_CHARS:
+            _count("summaries_skipped")
+        return packed["context"]
+    if not get_profile(profile)["summarize"]:
+        _count("truncated")
+        return truncate_tokens(" ".join(packed["unique"]), packed["budget"])   # budget left after the question
+    _count("summaries_run")
+    return None
+
+
+def _summary_source(packed: dict) -> str:
+    """The deduplicated sentences, cut to what the summary prompt can take."""
+    return truncate_tokens(" ".join(packed["unique"]), prompt_budgets([_summary_prompt("")])[0])
+
+
+def summarize_context(context: str, max_chars: int = 1200, profile=None) -> str:
+    """
+    Summarizes long retrieved context into a shorter passage
+    to fit Flan-T5 input size (≤ 512 tokens).
+    """
+    context = truncate_tokens(context, prompt_budgets([_summary_prompt("")])[0])
+    summary = generate_text(
+        _summary_prompt(context),
+        **profile_kwargs(profile, "summary")
+    )
 
     return summary
 
 
-def refine_answer(question: str, sentences: list[str]) -> str:
+def refine_answer(question: str, sentences: list[str], profile=None) -> str:
     """
     Refines retrieved sentences into a student-friendly bullet-point answer.
-    Uses summarization first to handle long contexts.
+    The sentences are packed into the prompt's token budget; only when the
+    best one alone cannot fit is the context summarized first (if the
+    generation profile allows the extra pass; otherwise it is truncated).
     """
 
-    # Step 1: Build context
-    raw_context = " ".join(sentences)
+    # Step 1: Pack the context into the token budget
+    packed = pack_context(question, sentences)
 
-    # Step 2: Summarize if too long
-    if len(raw_context) > 1200:
-        context = summarize_context(raw_context)
-    else:
-        context = raw_context
+    # Step 2: Summarize only if it still cannot fit
+    context = _resolve(packed, profile)
+    if context is None:
+        summary = summarize_context(" ".join(packed["unique"]), profile=profile)
+        context = truncate_tokens(summary, packed["budget"])
 
     # Step 3: Final Q&A refinement in bullet points
-    prompt = f"""
-    You are a helpful study assistant.
-    Question: {question}
-    Context: {context}
+    return generate_text(
+        _answer_prompt(question, context),
+        **profile_kwargs(profile, "answer")
+    )
 
-    Write the answer as 4–6 bullet points:
-    - Each bullet should be short and clear.
-    - Do not repeat the same idea.
-    - Keep it precise and relevant to the question.
-    """
 
-    output = flan(
-        prompt,
-        max_length=220,
-        min_length=80,
-        do_sample=True,
-        temperature=0.7,
-        top_p=0.9,
-        top_k=50,
-        repetition_penalty=2.0
+def refine_answers(questions: list[str], sentence_lists: list[list[str]], batch_size: int = 8,
+                   profile=None) -> list[str]:
+    """
+    Batched refine_answer: contexts are packed per question, the few that
+    still need a summary go through Flan-T5 in one batched pass, then all
+    final answers in another.
+    """
+    budgets = prompt_budgets([_answer_prompt(q, "") for q in questions])
+    packed = [_pack(sentences, budget) for sentences, budget in zip(sentence_lists, budgets)]
+    contexts = [_resolve(p, profile) for p in packed]
+
+    long_ids = [i for i, c in enumerate(contexts) if c is None]
+    summaries = generate_texts(
+        [_summary_prompt(_summary_source(packed[i])) for i in long_ids],
+        batch_size=batch_size, **profile_kwargs(profile, "summary")
     )
+    for i, summary in zip(long_ids, summaries):
+        contexts[i] = truncate_tokens(summary, packed[i]["budget"])
 
-    return output[0]['generated_text']
+    return generate_texts(
+        [_answer_prompt(q, c) for q, c in zip(questions, contexts)],
+        batch_size=batch_size, **profile_kwargs(profile, "answer")
+    )
 
 
 
@@ -1,5 +1,11 @@
+import hashlib
+import os
+
 import streamlit as st
-from assistant import StudyAssistant
+from document_registry import DocumentRegistry
+from study_client import StudyClient, StudyServiceError
+from generation import GENERATION_PROFILES, DEFAULT_PROFILE
+import metrics
 
 st.set_page_config(page_title="Personalized Study Assistant", layout="wide")
 
@@ -9,34 +15,83 @@ st.title("📘 Personalized Study Assistant")
 st.sidebar.header("Upload Study Materials")
 uploaded_pdfs = st.sidebar.file_uploader("Upload PDFs", type=["pdf"], accept_multiple_files=True)
 
-# Initialize session storage for multiple assistants
-if "assistants" not in st.session_state:
-    st.session_state.assistants = {}   # key: filename, value: StudyAssistant
-if "active_pdf" not in st.session_state:
-    st.session_state.active_pdf = None
+STUDENT_ID = "student1"
+SERVER_URL = os.environ.get("STUDYBOT_SERVER_URL")
+# With STUDYBOT_CORPUS_DIR set, uploaded documents persist there across restarts.
+CORPUS_DIR = os.environ.get("STUDYBOT_CORPUS_DIR")
+
+
+@st.cache_resource
+def get_registry():
+    """Documents loaded once per process and shared by every browser session."""
+    return DocumentRegistry(corpus_dir=CORPUS_DIR)
+
+
+# With STUDYBOT_SERVER_URL set, the session talks to a shared server.py instead.
+registry = None if SERVER_URL else get_registry()
+if SERVER_URL and "assistant" not in st.session_state:
+    st.session_state.assistant = StudyClient(SERVER_URL, student_id=STUDENT_ID)
+if "submitted" not in st.session_state:
+    st.session_state.submitted = set()   # (filename, sha256) of uploads this session already handed over
 
-# Process uploaded PDFs
+# Process uploaded PDFs: queued for the background worker (registry) or sent to the server
 if uploaded_pdfs:
     for pdf in uploaded_pdfs:
-        filename = pdf.name
-        if filename not in st.session_state.assistants:
-            with open(filename, "wb") as f:
-                f.write(pdf.read())
-            sa = StudyAssistant(student_id="student1")
-            sa.build_from_pdf(filename, cache_base=filename.replace(".pdf", "_cache"))
-            st.session_state.assistants[filename] = sa
-    st.sidebar.success("✅ PDFs processed successfully!")
-
-# Select active PDF
-if st.session_state.assistants:
-    st.session_state.active_pdf = st.sidebar.selectbox(
-        "Choose active study material:",
-        list(st.session_state.assistants.keys())
+        filename, data = pdf.name, pdf.getvalue()
+        upload_key = (filename, hashlib.sha256(data).hexdigest())   # a changed file under the same name is new
+        if upload_key in st.session_state.submitted:
+            continue
+        with open(filename, "wb") as f:
+            f.write(data)
+        cache_base = None if CORPUS_DIR else filename.replace(".pdf", "_cache")   # corpus: its own segment
+        try:
+            if registry and filename in registry.documents:
+                registry.replace(filename, filename, cache_base=cache_base)   # new version of a loaded PDF
+            elif registry:
+                registry.submit(filename, cache_base=cache_base, doc_id=filename)
+            elif filename in st.session_state.assistant.documents:   # loaded on the server by another session
+                st.session_state.assistant.replace_pdf(filename, filename, cache_base=filename.replace(".pdf", "_cache"))
+            else:
+                st.session_state.assistant.add_pdf(filename, cache_base=filename.replace(".pdf", "_cache"), doc_id=filename)
+        except (ValueError, StudyServiceError) as e:
+            st.sidebar.error(f"❌ {e}")
+        st.session_state.submitted.add(upload_key)
+
+if registry:
+    # Ingestion progress, refreshed every second without rerunning the page;
+    # the page reruns once when a newly ready document changes the corpus.
+    @st.fragment(run_every=1.0)
+    def ingest_status():
+        for job in registry.jobs():
+            if job["status"] == "error":
+                st.error(f"❌ {job['doc_id']}: {job['error']}")
+            elif job["status"] != "ready":
+                p = job["progress"] or {}
+                done, total = p.get("pages_done", 0), p.get("num_pages") or 1
+                st.progress(min(done / total, 1.0), text=f"⏳ {job['doc_id']}: {done}/{p.get('num_pages', '?')} pages")
+        if st.session_state.get("registry_version", 0) != registry.version:
+            st.session_state.registry_version = registry.version
+            st.rerun()
+
+    with st.sidebar:
+        ingest_status()
+
+assistant = registry.assistant if registry else st.session_state.assistant
+
+# Select which study materials to search (default: all of them)
+active_assistant = assistant if assistant is not None and assistant.documents else None
+active_docs = None
+if active_assistant:
+    selected = st.sidebar.multiselect(
+        "Search in study material:",
+        list(assistant.documents.keys()),
+        default=list(assistant.documents.keys())
     )
+    active_docs = selected or None
 
-active_assistant = (
-    st.session_state.assistants[st.session_state.active_pdf]
-    if st.session_state.active_pdf else None
+# Speed vs depth of generated answers and quizzes
+profile = st.sidebar.selectbox(
+    "Answer style:", list(GENERATION_PROFILES), index=list(GENERATION_PROFILES).index(DEFAULT_PROFILE)
 )
 
 # Tabs for features
@@ -46,15 +101,23 @@ with tab1:
     st.header("💬 Ask Your Questions")
     user_q = st.text_input("Enter your question:")
     if st.button("Get Answer") and user_q and active_assistant:
-        ans = active_assistant.rag_answer(user_q)
         st.markdown("### 📘 Answer")
-        st.markdown(ans)
+        placeholder = st.empty()
+        ans = ""
+        for piece in active_assistant.rag_answer_stream(
+            user_q, doc_ids=active_docs, profile=profile, student_id=STUDENT_ID
+        ):
+            ans += piece
+            placeholder.markdown(ans + "▌")
+        placeholder.markdown(ans)
 
 with tab2:
     st.header("📝 Practice Quiz")
     quiz_topic = st.text_input("Enter a topic for quiz:")
     if st.button("Generate Quiz") and quiz_topic and active_assistant:
-        quiz = active_assistant.generate_quiz(quiz_topic)
+        quiz = active_assistant.generate_quiz(
+            quiz_topic, doc_ids=active_docs, profile=profile, student_id=STUDENT_ID
+        )
 
         # Show MCQ
         st.subheader("MCQ")
@@ -84,10 +147,29 @@ with tab2:
         st.subheader("Short Question")
         st.write(quiz["short_question"]["short_question"])
 
+# Diagnostics: per-stage timings and counters. Recording is process-wide and
+# set at start-up (STUDYBOT_METRICS=1); the checkbox only shows this session the panel.
+with st.sidebar.expander("🔧 Diagnostics"):
+    if not metrics.is_enabled():
+        st.info("Metrics are off. Start the app with STUDYBOT_METRICS=1 to record them.")
+    elif st.checkbox("Show metrics"):
+        snap = metrics.snapshot()
+        if snap["spans"]:
+            st.dataframe(
+                [{"stage": name, **s} for name, s in sorted(snap["spans"].items(), key=lambda kv: -kv[1]["total_ms"])],
+                hide_index=True
+            )
+        if snap["counters"]:
+            st.json(snap["counters"])
+        st.download_button("Prometheus", metrics.to_prometheus(), file_name="studybot_metrics.prom")
+        st.download_button("JSON lines", metrics.to_jsonl(), file_name="studybot_metrics.jsonl")
+        if st.button("Reset metrics"):
+            metrics.reset()
+
 with tab3:
     st.header("📊 Progress Dashboard")
     if active_assistant:
-        progress = active_assistant.track_progress()
+        progress = active_assistant.track_progress(STUDENT_ID)
         st.metric("Total Q&A", progress["total_qa"])
         st.metric("Total Quiz Attempts", progress["total_quiz"])
         st.metric("Quiz Accuracy", f"{progress['accuracy']}%")
@@ -1,142 +1,915 @@
-from data_ingestion import extract_text_from_pdf, count_pdf_pages
-from text_processing import adaptive_chunking
-from embeddings import generate_embeddings
+import copy
+import hashlib
+import os
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+from ingest_pipeline import stream_pdf_into_index, stream_pages_into_index
 from vector_store import (
-    build_faiss_index, search_best_sentences,
-    save_index, load_index, save_chunks, load_chunks
+    search_chunks, search_best_sentences, search_best_sentences_batch, reconstruct_rows, mmr_select,
+    IndexSequence, merge_sentence_index, set_search_params, index_bytes_per_vector, clone_index,
+    copy_sentence_index, select_index_ranges, select_sentence_ranges, needs_training, trainable_setup, index_setup,
+    save_index, load_index, save_chunks, load_chunks, save_chunk_pages, load_chunk_pages,
+    save_sentence_index, load_sentence_index
 )
-from answer_refiner import refine_answer   # bullet-point answers
-from quiz_generator import generate_mcq, generate_short_question
+from chunk_store import ChunkSequence
+from lexical_index import (
+    retrieve_sentences, build_lexical_index, merge_lexical_index, copy_lexical_index, select_lexical_ranges,
+    save_lexical_index, load_lexical_index, RETRIEVAL_MODES
+)
+from answer_refiner import refine_answer, refine_answers   # bullet-point answers
 from student_tracking import log_qa, log_quiz, get_progress, init_db
+from embeddings import embed_query, embed_texts
+from generation import (
+    generate_text, generate_texts, stream_generate, profile_kwargs, get_profile, count_tokens, DEFAULT_PROFILE
+)
+from answer_cache import SemanticAnswerCache
+from quiz_pool import get_quiz_pool, generate_quiz_item, generate_quiz_items
+from quiz_generator import generate_quiz_set
+import ingest_cache
+import metrics
+
+# Chunks nearest to a quiz topic that are checked for a pre-generated item.
+QUIZ_POOL_SEARCH_K = 10
+# Quiz sets pick their chunks by MMR from this many candidates per item.
+QUIZ_SET_CANDIDATES_PER_ITEM = 3
+# remove_document compacts the corpus once this fraction of its rows belongs to removed documents.
+COMPACT_DEAD_FRACTION = 0.25
+# Documents are searched as separate index parts; more parts than this are compacted into one.
+COMPACT_MAX_PARTS = 16
+# Indexes that need training (IVF, int8, PQ) are compacted, i.e. retrained with
+# nlist recomputed, once the corpus has this many times the rows of its largest
+# part, or enough rows for the setup that part fell back from (e.g. pq_min_train()).
+COMPACT_GROWTH_FACTOR = 2
+
+
+def _rag_prompt(question: str, context: str) -> str:
+    return f"""
+        You are a study assistant.
+        Question: {question}
+        Context: {context}
+
+        Write a clear, student-friendly answer in 4–6 bullet points.
+        - Each bullet point should explain one important idea.
+        - Avoid repetition.
+        - Stay precise and grounded in the context.
+        """
 
 
 class StudyAssistant:
-    def __init__(self, student_id="default"):
+    def __init__(self, student_id="default", index_mode="flat", storage="float32", answer_cache=None, quiz_pool=None,
+                 profile=DEFAULT_PROFILE, retrieval_mode="dense"):
         self.chunks = None
         self.index = None
+        self.index_mode = index_mode  # "flat" (exact), "ivf" or "hnsw" (approximate)
+        self.storage = storage        # "float32", "float16", "int8" or "pq" vectors
+        self.sentence_index = None
+        self.chunk_pages = None    # (first_page, last_page) per chunk, for citing sources
+        # One corpus index for all loaded documents: chunk_docs[i] is the doc id
+        # of chunk row i; documents maps doc id -> its contiguous chunk range.
+        self.chunk_docs = None
+        self.documents = {}
+        # Rows of removed documents stay in the indexes, skipped by every
+        # search, until compact() drops them.
+        self._dead_rows = 0
+        self._live_rows = None     # cached chunk rows of the remaining documents
+        # Set by open_corpus: documents persist as one cache segment each.
+        self.corpus_dir = None
+        self._segments = {}        # doc id -> cache base of its segment
+        self._base_rows = {}       # doc id -> first row within its segment, for documents in a base segment
+        self.ingest_report = None  # pages, chunks and per-page timings of the last build
+        # "precomputed" uses the ingest-time sentence index;
+        # "two_stage" re-embeds the retrieved chunks' sentences per query.
+        self.sentence_mode = "precomputed"
+        # BM25 chunks/sentences next to the FAISS indexes; retrieval_mode is
+        # "dense", "lexical" or "hybrid" (see lexical_index).
+        self.lexical_index = None
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{retrieval_mode}'; choose from {RETRIEVAL_MODES}.")
+        self.retrieval_mode = retrieval_mode
+        self._retrieval = defaultdict(lambda: {"queries": 0, "lexical_hits": 0, "seconds": deque(maxlen=1000)})
         self.student_id = student_id
+        self.cache_status = None  # "hit" / "miss" / "stale" after build_from_pdf with a cache
+        # Answers to near-duplicate questions, keyed by query embedding; pass a
+        # SemanticAnswerCache(path=...) to keep it across restarts.
+        self.answer_cache = answer_cache if answer_cache is not None else SemanticAnswerCache()
+        # Pre-generated quiz items per chunk, filled in the background after each PDF loads.
+        self.quiz_pool = quiz_pool if quiz_pool is not None else get_quiz_pool()
+        # Generation profile ("fast" / "balanced" / "thorough") for requests that do not pick one.
+        get_profile(profile)
+        self.profile = profile
         init_db()  # initialize DB when assistant starts
 
-    def build_from_pdf(self, pdf_path: str, cache_base: str | None = None):
+    @metrics.timed("ingest")
+    def build_from_pdf(self, pdf_path: str, cache_base: str | None = None, on_progress=None, doc_id=None):
         """
-        Build chunks + FAISS index from a PDF.
-        Optionally cache to disk (cache_base without extension).
+        Build chunks + FAISS index from a PDF, replacing anything loaded before.
+        Optionally cache to disk (cache_base without extension). The cache is
+        keyed by the PDF content hash + chunking/embedding settings, so an
+        unchanged PDF is loaded from disk instead of being rebuilt.
+        Pages stream through chunking and embedding in batches, so memory
+        stays flat; on_progress(dict) is called after every batch.
         """
-        text = extract_text_from_pdf(pdf_path)
-        num_pages = count_pdf_pages(pdf_path)
-        self.chunks = adaptive_chunking(text, num_pages)
+        doc_id = doc_id or os.path.basename(pdf_path)
+        cache_base, sha256 = self._cache_base_for(pdf_path, cache_base)
+        doc = self._load_or_build(pdf_path, cache_base, on_progress, sha256)
+        self._set_single_document(doc_id, doc)
+        self._save_corpus(doc_id, cache_base)
+        self._fill_quiz_pool(doc_id)
+
+    @metrics.timed("ingest")
+    def build_from_pages(self, pages, num_pages: int, doc_id="pages", on_progress=None):
+        """
+        Build from already-extracted text instead of a PDF (e.g. another
+        source, or a synthetic benchmark corpus), replacing anything loaded
+        before. pages yields (page_no, text) or (page_no, text, seconds);
+        num_pages picks the chunking tier. Not cached.
+        """
+        sha256 = hashlib.sha256()
 
-        emb = generate_embeddings(self.chunks)
-        self.index = build_faiss_index(emb)
+        def hashed_pages():
+            for page in pages:
+                sha256.update(page[1].encode("utf-8"))
+                yield page[0], page[1], page[2] if len(page) > 2 else 0.0
 
-        # optional caching
+        doc = stream_pages_into_index(
+            hashed_pages(), num_pages, on_progress=on_progress, index_mode=self.index_mode, storage=self.storage
+        )
+        self.ingest_report = doc["report"]
+        doc["sha256"] = sha256.hexdigest()
+        self._set_single_document(doc_id, doc)
+        self._save_corpus()
+        self._fill_quiz_pool(doc_id)
+
+    @metrics.timed("ingest")
+    def add_pdf(self, pdf_path: str, cache_base: str | None = None, on_progress=None, doc_id=None) -> str:
+        """
+        Add a PDF to the corpus index next to the documents already loaded
+        (same caching as build_from_pdf). Returns its doc id.
+        """
+        doc_id = doc_id or os.path.basename(pdf_path)
+        if doc_id in self.documents:
+            raise ValueError(f"Document '{doc_id}' is already loaded.")
+
+        cache_base, sha256 = self._cache_base_for(pdf_path, cache_base)
+        doc = self._load_or_build(pdf_path, cache_base, on_progress, sha256)
+        self._add_document(doc_id, doc)
+        self._save_corpus(doc_id, cache_base)
+        self._fill_quiz_pool(doc_id)
+        self._maybe_compact()
+        return doc_id
+
+    @metrics.timed("ingest")
+    def replace_pdf(self, doc_id: str, pdf_path: str, cache_base: str | None = None, on_progress=None) -> bool:
+        """
+        Swap a loaded document for a new version of its PDF under the same
+        doc id, without rebuilding the rest of the corpus. Returns False
+        (and does nothing) when the PDF content is unchanged. The new
+        version is built before the old one is dropped, so a failed build
+        leaves the corpus as it was.
+        """
+        if doc_id not in self.documents:
+            raise KeyError(f"Unknown document: '{doc_id}'")
+        cache_base, sha256 = self._cache_base_for(pdf_path, cache_base)
+        if sha256 == self.documents[doc_id]["sha256"]:
+            return False
+
+        doc = self._load_or_build(pdf_path, cache_base, on_progress, sha256)
+        self._drop_document(doc_id)
+        self._add_document(doc_id, doc)
+        self._save_corpus(doc_id, cache_base)
+        self._fill_quiz_pool(doc_id)
+        self._maybe_compact()
+        return True
+
+    def remove_document(self, doc_id: str):
+        """
+        Drop a document in time proportional to its size: its rows stay in
+        the indexes as dead rows that every search skips, and the corpus is
+        compacted once COMPACT_DEAD_FRACTION of its rows are dead.
+        """
+        if doc_id not in self.documents:
+            raise KeyError(f"Unknown document: '{doc_id}'")
+        self._drop_document(doc_id)
+        self._save_corpus()
+        self._maybe_compact()
+
+    def load_from_cache(self, cache_base: str, doc_id=None):
+        """Load a previously cached index + chunks (+ sentence index if present)."""
+        if ingest_cache.is_legacy_cache(cache_base):
+            raise ValueError(
+                f"{cache_base}.faiss / {cache_base}.pkl is a cache from an older version; "
+                f"rebuild it with build_from_pdf(pdf_path, cache_base={cache_base!r})."
+            )
+        doc_id = doc_id or os.path.basename(cache_base)
+        self._set_single_document(doc_id, self._read_cache(cache_base))
+        self._save_corpus(doc_id, cache_base)
+        self._fill_quiz_pool(doc_id)
+
+    def open_corpus(self, corpus_dir: str) -> list[str]:
+        """
+        Keep the corpus in corpus_dir: its segments are memory-mapped and
+        searched in place (nothing is merged or copied into memory), every
+        later add / replace / remove writes only the changed document's
+        segment plus the corpus list, and a compaction saves the corpus as
+        one base segment (see ingest_cache). Call before loading anything
+        else. Returns the doc ids loaded.
+        """
+        if self.documents:
+            raise ValueError("open_corpus must be called before documents are loaded.")
+        os.makedirs(os.path.join(corpus_dir, "segments"), exist_ok=True)
+        self.corpus_dir = corpus_dir
+        segments = {}
+        for doc_id, entry in ingest_cache.read_corpus_manifest(corpus_dir).items():
+            segments.setdefault(entry["segment"], {})[doc_id] = entry
+        for segment, entries in segments.items():
+            cache_base = os.path.join(corpus_dir, segment)
+            started = time.perf_counter()
+            doc = self._read_cache(cache_base)
+            ingest_cache.record_timing("load", time.perf_counter() - started)
+            if any("first_chunk" in entry for entry in entries.values()):
+                self._add_base(doc, entries)
+            else:
+                for doc_id, entry in entries.items():   # one PDF added under several ids shares its segment
+                    self._add_document(doc_id, dict(doc, sha256=entry["sha256"]))
+            for doc_id in entries:
+                self._segments[doc_id] = cache_base
+                self._fill_quiz_pool(doc_id)
+        return list(self.documents)
+
+    def _cache_base_for(self, pdf_path: str, cache_base: str | None):
+        """(cache base, PDF sha256); in a corpus, a PDF without its own cache_base gets a segment."""
+        sha256 = ingest_cache.file_sha256(pdf_path)
+        if cache_base is None and self.corpus_dir:
+            cache_base = ingest_cache.segment_base(self.corpus_dir, sha256)
+        return cache_base, sha256
+
+    def _save_corpus(self, doc_id=None, cache_base=None):
+        """Record doc_id's segment (if cached) and rewrite the corpus list; no-op outside a corpus."""
+        if not self.corpus_dir:
+            return
+        if doc_id is not None and cache_base:
+            self._segments[doc_id] = cache_base
+        documents = {}
+        for i, base in self._segments.items():
+            documents[i] = {"sha256": self.documents[i]["sha256"], "segment": os.path.relpath(base, self.corpus_dir)}
+            if i in self._base_rows:
+                documents[i].update(first_chunk=self._base_rows[i], num_chunks=self.documents[i]["num_chunks"])
+        ingest_cache.write_corpus_manifest(self.corpus_dir, documents)
+
+    def _read_cache(self, cache_base: str) -> dict:
+        doc = {
+            "index": load_index(f"{cache_base}.faiss"),   # memory-mapped
+            "chunks": load_chunks(f"{cache_base}.chunks"),  # read lazily by row
+        }
+        try:
+            doc["sentence_index"] = load_sentence_index(cache_base)
+        except FileNotFoundError:
+            doc["sentence_index"] = None  # older cache: fall back to two-stage search
+        try:
+            doc["lexical_index"] = load_lexical_index(cache_base)
+        except FileNotFoundError:
+            doc["lexical_index"] = build_lexical_index(doc["chunks"])  # older cache: cheap to rebuild
+        try:
+            doc["chunk_pages"] = load_chunk_pages(f"{cache_base}.pages.npy")
+        except FileNotFoundError:
+            doc["chunk_pages"] = [None] * len(doc["chunks"])
+        manifest = ingest_cache.read_manifest(cache_base)
+        doc["sha256"] = manifest["settings"]["pdf_sha256"] if manifest else None
+        return doc
+
+    def _load_or_build(self, pdf_path: str, cache_base: str | None, on_progress, sha256=None) -> dict:
+        """One document's chunks/index/sentence index, from its cache or freshly built."""
+        sha256 = sha256 or ingest_cache.file_sha256(pdf_path)
         if cache_base:
-            save_index(self.index, f"{cache_base}.faiss")
-            save_chunks(self.chunks, f"{cache_base}.pkl")
-
-    def load_from_cache(self, cache_base: str):
-        """Load a previously cached index + chunks."""
-        self.index = load_index(f"{cache_base}.faiss")
-        self.chunks = load_chunks(f"{cache_base}.pkl")
+            settings = ingest_cache.cache_settings(sha256, self.index_mode, self.storage)
+            key = ingest_cache.cache_key(settings)
+            self.cache_status = ingest_cache.check_cache(cache_base, key)
+            if self.cache_status == "hit":
+                started = time.perf_counter()
+                doc = self._read_cache(cache_base)
+                ingest_cache.record_timing("load", time.perf_counter() - started)
+                doc["sha256"] = sha256
+                return doc
+            if ingest_cache.is_legacy_cache(cache_base):
+                print(f"♻️ {cache_base}.faiss / {cache_base}.pkl is a cache from an older version: rebuilding it")
+                ingest_cache.remove_cache(cache_base)
+            ingest_cache.invalidate(cache_base)
+
+        started = time.perf_counter()
+        doc = stream_pdf_into_index(
+            pdf_path, on_progress=on_progress, index_mode=self.index_mode, storage=self.storage
+        )
+        self.ingest_report = doc["report"]
+        doc["sha256"] = sha256
 
-    def answer(self, question: str, k_chunks=3, k_sentences=3) -> str:
+        # optional caching
+        if cache_base:
+            save_index(doc["index"], f"{cache_base}.faiss")
+            save_chunks(doc["chunks"], f"{cache_base}.chunks")
+            save_chunk_pages(doc["chunk_pages"], f"{cache_base}.pages.npy")
+            save_sentence_index(doc["sentence_index"], cache_base)
+            save_lexical_index(doc["lexical_index"], cache_base)
+            ingest_cache.write_manifest(
+                cache_base, key, settings,
+                num_pages=doc["report"]["num_pages"], num_chunks=len(doc["chunks"])
+            )
+            ingest_cache.record_timing("build", time.perf_counter() - started)
+        return doc
+
+    def _set_single_document(self, doc_id: str, doc: dict):
+        self.index = IndexSequence([doc["index"]])
+        self.chunks = ChunkSequence([doc["chunks"]])
+        self.chunk_pages = list(doc["chunk_pages"])
+        self.sentence_index = doc["sentence_index"]
+        self.lexical_index = doc["lexical_index"]
+        self.chunk_docs = [doc_id] * len(self.chunks)
+        self.documents = {
+            doc_id: {"first_chunk": 0, "num_chunks": len(self.chunks), "sha256": doc.get("sha256") or doc_id}
+        }
+        self._dead_rows, self._live_rows = 0, None
+        self._segments, self._base_rows = {}, {}
+
+    def _add_document(self, doc_id: str, doc: dict):
+        if self.index is None:
+            self._set_single_document(doc_id, doc)
+        else:
+            self._append_document(doc_id, doc)
+
+    def _append_document(self, doc_id: str, doc: dict):
+        # The document's index, sentence index and postings become new parts of
+        # the corpus ones (as built, or memory-mapped from its cache): nothing
+        # is copied, and parts already shared with snapshots are never modified.
+        offset = len(self.chunks)
+        self.index = IndexSequence([self.index, doc["index"]])
+        self.chunks.extend(doc["chunks"])
+        self.chunk_pages.extend(doc["chunk_pages"])
+        self.chunk_docs.extend([doc_id] * len(doc["chunks"]))
+
+        if self.sentence_index is not None and doc["sentence_index"] is not None:
+            self.sentence_index = merge_sentence_index(self.sentence_index, doc["sentence_index"])
+        else:
+            self.sentence_index = None  # one side lacks it: corpus falls back to two-stage
+        self.lexical_index = merge_lexical_index(self.lexical_index, doc["lexical_index"])
+
+        self.documents[doc_id] = {
+            "first_chunk": offset, "num_chunks": len(doc["chunks"]), "sha256": doc.get("sha256") or doc_id
+        }
+        self._live_rows = None
+
+    def _add_base(self, doc: dict, entries: dict):
+        """
+        Add a base segment: entries are the manifest entries of the documents
+        it holds. Rows of documents removed since the base was written are dead.
+        """
+        self._add_document(None, doc)
+        base = self.documents.pop(None)
+        start, n = base["first_chunk"], base["num_chunks"]
+        self.chunk_docs[start:start + n] = [None] * n
+        for doc_id, entry in entries.items():
+            first, num = start + entry["first_chunk"], entry["num_chunks"]
+            self.documents[doc_id] = {"first_chunk": first, "num_chunks": num, "sha256": entry["sha256"]}
+            self.chunk_docs[first:first + num] = [doc_id] * num
+            self._base_rows[doc_id] = entry["first_chunk"]
+        self._dead_rows += n - sum(entry["num_chunks"] for entry in entries.values())
+        self._live_rows = None
+
+    def _drop_document(self, doc_id: str):
+        d = self.documents.pop(doc_id)
+        first, n = d["first_chunk"], d["num_chunks"]
+        self.chunk_docs[first:first + n] = [None] * n
+        self._dead_rows += n
+        self._live_rows = None
+        self._segments.pop(doc_id, None)
+        self._base_rows.pop(doc_id, None)
+        if not self.documents:
+            self._set_empty()   # nothing left to search: no need to keep dead rows
+
+    def _set_empty(self):
+        self.index = self.chunks = self.chunk_pages = self.sentence_index = self.lexical_index = None
+        self.chunk_docs = None
+        self._dead_rows, self._live_rows = 0, None
+
+    def _maybe_compact(self):
+        if self.index is None:
+            return
+        if (self._dead_rows >= max(COMPACT_DEAD_FRACTION * len(self.chunks), 1)
+                or len(self.index.parts) > COMPACT_MAX_PARTS or self._outgrown()):
+            self.compact()
+
+    def _outgrown(self):
+        """True once the chunk or sentence index has outgrown the training of its largest part."""
+        if not needs_training(self.index_mode, self.storage):
+            return False
+        indexes = [(self.index, self.index_mode)]
+        if self.sentence_index is not None:
+            indexes.append((self.sentence_index["index"], "flat"))
+        for index, mode in indexes:
+            if not isinstance(index, IndexSequence) or len(index.parts) < 2:
+                continue
+            largest = index.largest_part()
+            if (index.ntotal >= COMPACT_GROWTH_FACTOR * largest.ntotal
+                    or index_setup(largest) != trainable_setup(index.d, mode, self.storage, index.ntotal)):
+                return True
+        return False
+
+    @metrics.timed("compact")
+    def compact(self) -> int:
+        """
+        Rebuild the indexes as one part each, without the dead rows of
+        removed documents (one pass over the remaining rows; an index that
+        needs training is retrained for the remaining rows), and delete corpus
+        segments no document uses any more; in a corpus the result is saved
+        as its base segment and memory-mapped. Chunk rows of the remaining
+        documents are renumbered; their (sha256, chunk number) ids, which
+        key the answer cache and quiz pool, do not change. Returns the
+        number of rows dropped.
+        """
+        dropped = self._dead_rows
+        if dropped or (self.index is not None and len(self.index.parts) > 1):
+            live = sorted(self.documents.items(), key=lambda item: item[1]["first_chunk"])
+            ranges = [(d["first_chunk"], d["first_chunk"] + d["num_chunks"]) for _, d in live]
+            self.index = IndexSequence([select_index_ranges(self.index, ranges, self.index_mode, self.storage)])
+            if self.sentence_index is not None:
+                self.sentence_index = select_sentence_ranges(self.sentence_index, ranges, self.storage)
+            self.lexical_index = select_lexical_ranges(self.lexical_index, ranges)
+            self.chunks = self.chunks.select(ranges)
+            self.chunk_pages = [p for start, stop in ranges for p in self.chunk_pages[start:stop]]
+            self.chunk_docs, first = [], 0
+            for doc_id, d in live:
+                d["first_chunk"] = first
+                first += d["num_chunks"]
+                self.chunk_docs.extend([doc_id] * d["num_chunks"])
+            self._dead_rows, self._live_rows = 0, None
+            metrics.count("rows_compacted", dropped)
+            if self.corpus_dir and self.index.ntotal:
+                self._write_base()
+        self._remove_unused_segments()
+        return dropped
+
+    def _write_base(self):
+        """Save the compacted corpus as one segment, then serve it memory-mapped from there."""
+        base = ingest_cache.base_segment(self.corpus_dir)
+        shas = "".join(sorted(d["sha256"] for d in self.documents.values()))
+        settings = ingest_cache.cache_settings(hashlib.sha256(shas.encode("utf-8")).hexdigest(), self.index_mode, self.storage)
+        save_index(self.index.parts[0], f"{base}.faiss")
+        save_chunks(self.chunks, f"{base}.chunks")
+        save_chunk_pages(self.chunk_pages, f"{base}.pages.npy")
+        if self.sentence_index is not None:
+            save_sentence_index(self.sentence_index, base)
+        save_lexical_index(self.lexical_index, base)
+        ingest_cache.write_manifest(base, ingest_cache.cache_key(settings), settings, num_chunks=len(self.chunks))
+
+        doc = self._read_cache(base)
+        self.index = IndexSequence([doc["index"]])
+        self.chunks = ChunkSequence([doc["chunks"]])
+        if self.sentence_index is not None:
+            self.sentence_index = doc["sentence_index"]
+        self.lexical_index = doc["lexical_index"]
+        for doc_id, d in self.documents.items():
+            self._segments[doc_id] = base
+            self._base_rows[doc_id] = d["first_chunk"]
+        self._save_corpus()
+
+    def _remove_unused_segments(self):
+        if not self.corpus_dir:
+            return
+        segments_dir = os.path.join(self.corpus_dir, "segments")
+        used = {os.path.normpath(base) for base in self._segments.values()}
+        for name in {f.split(".", 1)[0] for f in os.listdir(segments_dir)}:
+            base = os.path.join(segments_dir, name)
+            if os.path.normpath(base) not in used:
+                try:
+                    ingest_cache.remove_cache(base)
+                except OSError:
+                    pass   # still mapped by a snapshot (Windows): removed by a later compaction
+
+    def corpus_stats(self):
+        """Documents, chunk rows in the indexes and rows of removed documents awaiting compaction."""
+        return {
+            "documents": len(self.documents),
+            "rows": len(self.chunks) if self.chunks is not None else 0,
+            "dead_rows": self._dead_rows,
+            "corpus_dir": self.corpus_dir,
+        }
+
+    def snapshot(self):
+        """
+        Copy of this assistant that keeps serving queries while this one
+        adds, replaces and removes documents. The corpus is shared part by
+        part (indexes, text and postings are never modified once added), so
+        a snapshot only copies the per-row and per-document lists. Answer
+        cache and quiz pool stay shared.
+        """
+        snap = copy.copy(self)
+        snap.index = clone_index(self.index)
+        snap.sentence_index = copy_sentence_index(self.sentence_index)
+        snap.lexical_index = copy_lexical_index(self.lexical_index)
+        snap.chunks = self.chunks.copy() if self.chunks is not None else None
+        snap.chunk_pages = list(self.chunk_pages or [])
+        snap.chunk_docs = list(self.chunk_docs or [])
+        snap.documents = {doc_id: dict(d) for doc_id, d in self.documents.items()}
+        snap._segments = dict(self._segments)
+        snap._base_rows = dict(self._base_rows)
+        return snap
+
+    def _fill_quiz_pool(self, doc_id: str):
+        """Queue background quiz generation for the document's chunks that have no ready item."""
+        d = self.documents[doc_id]
+        self.quiz_pool.fill(d["sha256"], self.chunks.view(d["first_chunk"], d["first_chunk"] + d["num_chunks"]))
+
+    def _chunk_key(self, row: int):
+        """(document sha256, chunk number within the document, chunk text) of a corpus row."""
+        d = self.documents[self.chunk_docs[row]]
+        return d["sha256"], row - d["first_chunk"], self.chunks[row]
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """Trade recall for speed on approximate indexes (IVF nprobe / HNSW efSearch)."""
+        set_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+
+    def index_footprint(self):
+        """
+        Vectors stored, bytes per vector, parts and the mode / storage of the
+        largest part of the chunk and sentence indexes (the configured ones
+        unless too few vectors forced a fallback, see ingest_report).
+        """
+        indexes = {"chunks": self.index}
+        if self.sentence_index is not None:
+            indexes["sentences"] = self.sentence_index["index"]
+        footprint = {}
+        for name, index in indexes.items():
+            mode, storage = index_setup(index)
+            footprint[name] = {
+                "vectors": index.ntotal, "bytes_per_vector": index_bytes_per_vector(index),
+                "parts": len(index.parts) if isinstance(index, IndexSequence) else 1, "mode": mode, "storage": storage,
+            }
+        return footprint
+
+    def _rows_for(self, doc_ids):
+        """Chunk rows of the given documents (None = search everything, i.e. no restriction without dead rows)."""
+        if doc_ids is None or set(doc_ids) == set(self.documents):
+            if not self._dead_rows:
+                return None
+            if self._live_rows is None:
+                self._live_rows = self._rows_for_documents(self.documents)
+            return self._live_rows
+        unknown = set(doc_ids) - set(self.documents)
+        if unknown:
+            raise KeyError(f"Unknown document(s): {sorted(unknown)}")
+        return self._rows_for_documents(doc_ids)
+
+    def _rows_for_documents(self, doc_ids):
+        ranges = [
+            np.arange(d["first_chunk"], d["first_chunk"] + d["num_chunks"])
+            for d in (self.documents[i] for i in doc_ids)
+        ]
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype="int64")
+
+    def _search(self, question: str, k_chunks: int, k_sentences: int, doc_ids=None, query_vector=None) -> list[str]:
+        sentence_index = self.sentence_index if self.sentence_mode == "precomputed" else None
+        started = time.perf_counter()
+        with metrics.span(f"retrieve_{self.retrieval_mode}"):
+            sentences, info = retrieve_sentences(
+                question, self.retrieval_mode, self.index, self.chunks, self.lexical_index,
+                k_chunks=k_chunks, k_sentences=k_sentences,
+                sentence_index=sentence_index, rows=self._rows_for(doc_ids), query_vector=query_vector
+            )
+        self._record_retrieval(info, time.perf_counter() - started)
+        return sentences
+
+    def _record_retrieval(self, info, seconds):
+        stats = self._retrieval[info["path"]]
+        stats["queries"] += 1
+        stats["lexical_hits"] += bool(info["lexical_hits"])
+        stats["seconds"].append(seconds)
+        metrics.count(f"retrieval_{info['path']}")
+
+    def retrieval_stats(self):
+        """Queries, queries with a BM25 match and p50/p99 latency per retrieval path taken."""
+        out = {}
+        for path, stats in self._retrieval.items():
+            ms = np.array(stats["seconds"]) * 1000
+            out[path] = {
+                "queries": stats["queries"],
+                "lexical_hits": stats["lexical_hits"],
+                "p50_ms": round(float(np.percentile(ms, 50)), 3) if len(ms) else None,
+                "p99_ms": round(float(np.percentile(ms, 99)), 3) if len(ms) else None,
+            }
+        return out
+
+    def _search_batch(self, questions: list[str], k_chunks: int, k_sentences: int, doc_ids=None,
+                      query_vectors=None) -> list[list[str]]:
+        if self.retrieval_mode != "dense":
+            # BM25 is per query anyway; the dense parts reuse the batch-encoded vectors
+            return [
+                self._search(question, k_chunks, k_sentences, doc_ids,
+                             query_vector=query_vectors[i:i + 1] if query_vectors is not None else None)
+                for i, question in enumerate(questions)
+            ]
+        sentence_index = self.sentence_index if self.sentence_mode == "precomputed" else None
+        started = time.perf_counter()
+        results = search_best_sentences_batch(
+            questions, self.index, self.chunks,
+            k_chunks=k_chunks, k_sentences=k_sentences,
+            sentence_index=sentence_index, rows=self._rows_for(doc_ids), query_vectors=query_vectors
+        )
+        per_query = (time.perf_counter() - started) / max(len(questions), 1)
+        for _ in questions:
+            self._record_retrieval({"path": "dense", "lexical_hits": None}, per_query)
+        return results
+
+    def _cache_namespace(self, mode: str, doc_ids, *params) -> str:
+        """Cached answers are only shared between the same answer mode, retrieval settings and documents."""
+        self._rows_for(doc_ids)  # unknown doc ids raise here
+        ids = self.documents if doc_ids is None else doc_ids
+        shas = sorted({self.documents[i]["sha256"] for i in ids})
+        return "|".join([mode, *map(str, params), *shas])
+
+    def answer_cache_stats(self):
+        """Entries, hits, misses and hit rate of the semantic answer cache."""
+        return self.answer_cache.stats()
+
+    @metrics.timed("answer")
+    def answer(self, question: str, k_chunks=3, k_sentences=3, doc_ids=None, profile=None, student_id=None) -> str:
         """
         Multi-step retrieval + bullet-point LLM refinement.
-        Logs Q&A into database.
+        doc_ids limits retrieval to those documents (None = all loaded);
+        profile picks the generation profile (None = self.profile).
+        Logs Q&A into database under student_id (None = self.student_id).
         """
         assert self.index is not None and self.chunks is not None, \
             "Index/chunks not ready. Call build_from_pdf(...) or load_from_cache(...)."
 
-        top_sents = search_best_sentences(
-            question, self.index, self.chunks,
-            k_chunks=k_chunks, k_sentences=k_sentences
-        )
+        profile = profile or self.profile
+        q = embed_query(question)
+        namespace = self._cache_namespace("refine", doc_ids, profile, self.retrieval_mode, k_chunks, k_sentences)
+        answer = self.answer_cache.lookup(q, namespace)
+        output_tokens = 0
 
-        answer = refine_answer(question, top_sents)
+        if answer is None:
+            top_sents = self._search(question, k_chunks, k_sentences, doc_ids, query_vector=q)
+            answer = refine_answer(question, top_sents, profile=profile)
+            output_tokens = count_tokens(answer)
+            self.answer_cache.store(q, question, answer, namespace)
 
         # Log Q&A
-        log_qa(self.student_id, question, answer)
+        log_qa(student_id or self.student_id, question, answer, profile, output_tokens)
 
         return answer
 
-    def rag_answer(self, question: str, top_k=5) -> str:
+    @metrics.timed("rag_answer")
+    def rag_answer(self, question: str, top_k=5, doc_ids=None, profile=None, student_id=None) -> str:
         """
         Retrieval-Augmented Generation (RAG):
         Retrieves top_k chunks and passes them directly to the LLM.
-        Logs Q&A into database.
+        doc_ids limits retrieval to those documents (None = all loaded);
+        profile picks the generation profile (None = self.profile).
+        Logs Q&A into database under student_id (None = self.student_id).
         """
         assert self.index is not None and self.chunks is not None, \
             "Index/chunks not ready. Call build_from_pdf(...) or load_from_cache(...)."
 
-        # Step 1: Retrieve top-k chunks
-        top_sents = search_best_sentences(
-            question, self.index, self.chunks,
-            k_chunks=top_k, k_sentences=3
-        )
+        # Step 0: a near-duplicate question already answered for these documents?
+        profile = profile or self.profile
+        q = embed_query(question)
+        namespace = self._cache_namespace("rag", doc_ids, profile, self.retrieval_mode, top_k)
+        answer = self.answer_cache.lookup(q, namespace)
+        output_tokens = 0
 
-        # Step 2: Combine into a context passage
-        context = " ".join(top_sents)
+        if answer is None:
+            # Step 1: Retrieve top-k chunks
+            top_sents = self._search(question, top_k, 3, doc_ids, query_vector=q)
 
-        # Step 3: Pass context + question to Flan-T5
-        from answer_refiner import flan  # reuse loaded model
+            # Step 2: Combine into a context passage
+            context = " ".join(top_sents)
 
-        prompt = f"""
-        You are a study assistant.
-        Question: {question}
-        Context: {context}
+            # Step 3: Pass context + question to Flan-T5 (shared model from model_registry)
+            answer = generate_text(_rag_prompt(question, context), **profile_kwargs(profile, "answer"))
+            output_tokens = count_tokens(answer)
+            self.answer_cache.store(q, question, answer, namespace)
 
-        Write a clear, student-friendly answer in 4–6 bullet points.
-        - Each bullet point should explain one important idea.
-        - Avoid repetition.
-        - Stay precise and grounded in the context.
-        """
+        # Log Q&A
+        log_qa(student_id or self.student_id, question, answer, profile, output_tokens)
 
-        output = flan(
-            prompt,
-            max_length=250,
-            min_length=80,
-            do_sample=True,
-            temperature=0.7,
-            top_p=0.9,
-            top_k=50,
-            repetition_penalty=2.0
-        )
+        return answer
+
+    def rag_answer_stream(self, question: str, top_k=5, doc_ids=None, profile=None, student_id=None):
+        """
+        Streaming rag_answer(): yields answer text as Flan-T5 decodes it.
+        The full answer is logged (under student_id, None = self.student_id)
+        once generation finishes; a cached answer is yielded in one piece.
+        """
+        assert self.index is not None and self.chunks is not None, \
+            "Index/chunks not ready. Call build_from_pdf(...) or load_from_cache(...)."
 
-        answer = output[0]['generated_text']
+        profile = profile or self.profile
+        q = embed_query(question)
+        namespace = self._cache_namespace("rag", doc_ids, profile, self.retrieval_mode, top_k)
+        answer = self.answer_cache.lookup(q, namespace)
+        output_tokens = 0
+
+        if answer is not None:
+            yield answer
+        else:
+            top_sents = self._search(question, top_k, 3, doc_ids, query_vector=q)
+            context = " ".join(top_sents)
+
+            pieces = []
+            for piece in stream_generate(_rag_prompt(question, context), **profile_kwargs(profile, "answer")):
+                pieces.append(piece)
+                yield piece
+            answer = "".join(pieces).strip()
+            output_tokens = count_tokens(answer)
+            self.answer_cache.store(q, question, answer, namespace)
 
         # Log Q&A
-        log_qa(self.student_id, question, answer)
+        log_qa(student_id or self.student_id, question, answer, profile, output_tokens)
 
-        return answer
+    @metrics.timed("answer_batch")
+    def answer_batch(self, questions: list[str], k_chunks=3, k_sentences=3, batch_size=8, doc_ids=None,
+                     profile=None, student_ids=None) -> list[str]:
+        """
+        Batched answer(): one query encode, one chunk search and batched
+        Flan-T5 generation for the questions missing from the answer cache.
+        Logs every Q&A, under student_ids[i] if given (else self.student_id).
+        """
+        assert self.index is not None and self.chunks is not None, \
+            "Index/chunks not ready. Call build_from_pdf(...) or load_from_cache(...)."
 
-    def generate_quiz(self, question: str, top_k=3):
+        profile = profile or self.profile
+        namespace = self._cache_namespace("refine", doc_ids, profile, self.retrieval_mode, k_chunks, k_sentences)
+        qs = embed_texts(list(questions))
+        answers = [self.answer_cache.lookup(q, namespace) for q in qs]
+        misses = [i for i, a in enumerate(answers) if a is None]
+        output_tokens = [0] * len(questions)
+
+        if misses:
+            missed = [questions[i] for i in misses]
+            sentence_lists = self._search_batch(missed, k_chunks, k_sentences, doc_ids, query_vectors=qs[misses])
+            refined = refine_answers(missed, sentence_lists, batch_size=batch_size, profile=profile)
+            for i, answer in zip(misses, refined):
+                answers[i] = answer
+                output_tokens[i] = count_tokens(answer)
+                self.answer_cache.store(qs[i], questions[i], answer, namespace)
+
+        student_ids = student_ids or [self.student_id] * len(questions)
+        for student_id, question, answer, tokens in zip(student_ids, questions, answers, output_tokens):
+            log_qa(student_id, question, answer, profile, tokens)
+
+        return answers
+
+    @metrics.timed("rag_answer_batch")
+    def rag_answer_batch(self, questions: list[str], top_k=5, batch_size=8, doc_ids=None, profile=None,
+                         student_ids=None) -> list[str]:
+        """
+        Batched rag_answer(): one query encode, one chunk search and padded
+        Flan-T5 batches of batch_size prompts, for the questions missing from
+        the answer cache. Logs every Q&A, under student_ids[i] if given.
+        """
+        assert self.index is not None and self.chunks is not None, \
+            "Index/chunks not ready. Call build_from_pdf(...) or load_from_cache(...)."
+
+        profile = profile or self.profile
+        namespace = self._cache_namespace("rag", doc_ids, profile, self.retrieval_mode, top_k)
+        qs = embed_texts(list(questions))
+        answers = [self.answer_cache.lookup(q, namespace) for q in qs]
+        misses = [i for i, a in enumerate(answers) if a is None]
+        output_tokens = [0] * len(questions)
+
+        if misses:
+            missed = [questions[i] for i in misses]
+            sentence_lists = self._search_batch(missed, top_k, 3, doc_ids, query_vectors=qs[misses])
+            prompts = [
+                _rag_prompt(question, " ".join(sentences))
+                for question, sentences in zip(missed, sentence_lists)
+            ]
+            generated = generate_texts(prompts, batch_size=batch_size, **profile_kwargs(profile, "answer"))
+            for i, answer in zip(misses, generated):
+                answers[i] = answer
+                output_tokens[i] = count_tokens(answer)
+                self.answer_cache.store(qs[i], questions[i], answer, namespace)
+
+        student_ids = student_ids or [self.student_id] * len(questions)
+        for student_id, question, answer, tokens in zip(student_ids, questions, answers, output_tokens):
+            log_qa(student_id, question, answer, profile, tokens)
+
+        return answers
+
+    @metrics.timed("generate_quiz")
+    def generate_quiz(self, question: str, top_k=3, doc_ids=None, profile=None, student_id=None):
         """
         Generate quiz questions (MCQ + short answer) based on retrieved context.
-        Logs quiz attempt (with placeholder correctness).
+        Served from the quiz pool when one of the chunks nearest to the topic
+        has a pre-generated item (that chunk is then refilled in the
+        background); otherwise generated on the spot with the given profile.
+        Logs quiz attempt (with placeholder correctness) under student_id
+        (None = self.student_id).
         """
         assert self.index is not None and self.chunks is not None, \
             "Index/chunks not ready. Call build_from_pdf(...) or load_from_cache(...)."
 
-        # Step 1: Retrieve top chunks
-        top_sents = search_best_sentences(
-            question, self.index, self.chunks,
-            k_chunks=top_k, k_sentences=3
-        )
+        started = time.perf_counter()
+        q = embed_query(question)
+        rows = search_chunks(question, self.index, QUIZ_POOL_SEARCH_K, self._rows_for(doc_ids), query_vector=q)
+        quiz = self.quiz_pool.take([self._chunk_key(row) for row in rows])
+        inline = quiz is None
 
-        context = " ".join(top_sents)
+        if inline:
+            # Step 1: Retrieve top chunks
+            top_sents = self._search(question, top_k, 3, doc_ids, query_vector=q)
 
-        # Step 2: Generate MCQ + Short Question
-        mcq = generate_mcq(context)
-        short_q = generate_short_question(context)
+            context = " ".join(top_sents)
+
+            # Step 2: Generate MCQ + Short Question
+            quiz = generate_quiz_item(context, profile=profile or self.profile)
+        self.quiz_pool.record_wait(time.perf_counter() - started, inline)
 
         # Log quiz attempt (set correct=False for now, to be updated after student answers)
-        log_quiz(self.student_id, question, correct=False)
+        log_quiz(student_id or self.student_id, question, correct=False)
 
-        return {"mcq": mcq, "short_question": short_q}
+        return quiz
+
+    @metrics.timed("generate_quiz_batch")
+    def generate_quiz_batch(self, questions: list[str], top_k=3, batch_size=8, doc_ids=None, profile=None,
+                            student_ids=None) -> list[dict]:
+        """
+        Batched generate_quiz(): one query encode, pool lookups per topic and
+        padded Flan-T5 batches for the topics the pool cannot serve. Logs
+        every quiz attempt, under student_ids[i] if given.
+        """
+        assert self.index is not None and self.chunks is not None, \
+            "Index/chunks not ready. Call build_from_pdf(...) or load_from_cache(...)."
+
+        started = time.perf_counter()
+        qs = embed_texts(list(questions))
+        rows = self._rows_for(doc_ids)
+        quizzes = [
+            self.quiz_pool.take([
+                self._chunk_key(row)
+                for row in search_chunks(question, self.index, QUIZ_POOL_SEARCH_K, rows, query_vector=qs[i:i + 1])
+            ])
+            for i, question in enumerate(questions)
+        ]
+        misses = [i for i, quiz in enumerate(quizzes) if quiz is None]
+
+        if misses:
+            sentence_lists = self._search_batch([questions[i] for i in misses], top_k, 3, doc_ids, query_vectors=qs[misses])
+            generated = generate_quiz_items(
+                [" ".join(sentences) for sentences in sentence_lists], profile=profile or self.profile, batch_size=batch_size
+            )
+            for i, quiz in zip(misses, generated):
+                quizzes[i] = quiz
+        waited = time.perf_counter() - started
+        inline = set(misses)
+        for i in range(len(questions)):
+            self.quiz_pool.record_wait(waited, i in inline)
+
+        student_ids = student_ids or [self.student_id] * len(questions)
+        for student_id, question in zip(student_ids, questions):
+            log_quiz(student_id, question, correct=False)
+        return quizzes
+
+    @metrics.timed("generate_quiz_set")
+    def generate_quiz_set(self, topic: str, n=10, doc_ids=None, batch_size=8, diversity=0.3, k_sentences=3,
+                          profile=None, student_id=None):
+        """
+        A practice set of up to n quiz items (one MCQ + one short question
+        each, parsed into question/options/answer) about topic. Chunks are
+        chosen by maximal marginal relevance, so the items cover different
+        parts of the material, and all prompts are generated in padded
+        batches. Each item records its doc_id and pages; each is logged as
+        a quiz attempt under student_id (None = self.student_id).
+        """
+        assert self.index is not None and self.chunks is not None, \
+            "Index/chunks not ready. Call build_from_pdf(...) or load_from_cache(...)."
 
-    def track_progress(self):
-        """Get summary of student's progress."""
-        return get_progress(self.student_id)
+        q = embed_query(topic)
+        candidates = search_chunks(
+            topic, self.index, n * QUIZ_SET_CANDIDATES_PER_ITEM, self._rows_for(doc_ids), query_vector=q
+        )
+        picked = [candidates[i] for i in mmr_select(q, reconstruct_rows(self.index, candidates), n, diversity)]
+
+        sentence_index = self.sentence_index if self.sentence_mode == "precomputed" else None
+        contexts = [
+            " ".join(search_best_sentences(
+                topic, self.index, self.chunks, k_chunks=1, k_sentences=k_sentences,
+                sentence_index=sentence_index, rows=[row], query_vector=q
+            ))
+            for row in picked
+        ]
+        items = generate_quiz_set(contexts, batch_size=batch_size, profile=profile or self.profile)
+
+        for row, item in zip(picked, items):
+            item["doc_id"] = self.chunk_docs[row]
+            item["pages"] = self.chunk_pages[row]
+            log_quiz(student_id or self.student_id, topic, correct=False)
+        return items
+
+    def track_progress(self, student_id=None):
+        """Get summary of student's progress (student_id None = self.student_id)."""
+        return get_progress(student_id or self.student_id)
 
 
 
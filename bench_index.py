@@ -0,0 +1,109 @@
+"""
+Recall/latency/size benchmark of the chunk index modes and vector storage
+types on a synthetic corpus:
+
+    python bench_index.py --sizes 10000 100000 --queries 200 --k 5 \
+        --storage float32 float16 int8 pq
+
+Vectors are clustered, unit-normalised and 384-dim like MiniLM embeddings,
+so no model is needed. Every configuration is compared against exact flat
+float32 search; one JSON object per (size, mode, storage, search setting)
+is printed, including bytes per stored vector.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from vector_store import (
+    new_faiss_index, set_search_params, index_mode, index_bytes_per_vector,
+    INDEX_MODES, STORAGE_TYPES
+)
+
+
+def synthetic_corpus(n, dim=384, n_clusters=None, seed=0):
+    rng = np.random.default_rng(seed)
+    n_clusters = n_clusters or max(8, n // 500)
+    centers = rng.normal(size=(n_clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, n_clusters, n)] + 0.6 * rng.normal(size=(n, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def make_queries(corpus, n_queries, seed=1):
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.integers(0, len(corpus), n_queries)]
+    queries = picks + 0.3 * rng.normal(size=picks.shape).astype("float32") / np.sqrt(corpus.shape[1])
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype("float32")
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def time_queries(index, queries, k):
+    """Per-query latency (single-query searches, as in the app) + the result ids."""
+    latencies, ids = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        _, I = index.search(q[None, :], k)
+        latencies.append(time.perf_counter() - t0)
+        ids.append(I[0])
+    return np.array(latencies), np.array(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k, latency and size of the chunk index configurations.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--modes", nargs="+", default=list(INDEX_MODES), choices=INDEX_MODES)
+    parser.add_argument("--storage", nargs="+", default=["float32"], choices=STORAGE_TYPES)
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        corpus = synthetic_corpus(n)
+        queries = make_queries(corpus, args.queries)
+
+        # ground truth: exact float32 flat search
+        exact = new_faiss_index(corpus.shape[1], "flat")
+        exact.add(corpus)
+        _, truth = exact.search(queries, args.k)
+
+        for mode in args.modes:
+            for storage in args.storage:
+                t0 = time.perf_counter()
+                index = new_faiss_index(corpus.shape[1], mode, train_vectors=corpus, storage=storage)
+                index.add(corpus)
+                build_seconds = time.perf_counter() - t0
+
+                if mode == "ivf":
+                    settings = [{"nprobe": p} for p in args.nprobe]
+                elif mode == "hnsw":
+                    settings = [{"ef_search": e} for e in args.ef_search]
+                else:
+                    settings = [{}]
+
+                for setting in settings:
+                    set_search_params(index, **setting)
+                    latencies, found = time_queries(index, queries, args.k)
+                    print(json.dumps({
+                        "n": n,
+                        "mode": index_mode(index),
+                        "storage": storage,
+                        **setting,
+                        "k": args.k,
+                        "recall_at_k": round(recall_at_k(found, truth), 4),
+                        "bytes_per_vector": round(index_bytes_per_vector(index), 1),
+                        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 4),
+                        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 4),
+                        "build_seconds": round(build_seconds, 3),
+                    }), flush=True)
+
+
+if __name__ == "__main__":
+    main()
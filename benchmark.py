@@ -0,0 +1,302 @@
+"""
+End-to-end benchmark of ingest, retrieval, generation and progress tracking:
+
+    python benchmark.py --corpus resnet.pdf synthetic:50 synthetic:500 \
+        --models stub --out bench_results.jsonl
+
+Each corpus is a PDF path or synthetic:<pages> (deterministic generated
+text). With --models stub, a hashing embedder and a canned-text generator
+are registered in model_registry, so the numbers isolate retrieval, FAISS
+and SQLite costs from model inference; --models real uses the real models,
+offline, only if they are already in the local Hugging Face cache.
+
+One JSON object per (corpus, stage) is printed (and appended to --out):
+p50/p99 latency, throughput and the peak RSS of the process so far,
+tagged with the git commit so runs can be compared across commits.
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import model_registry
+from model_registry import process_rss_bytes
+from lexical_index import RETRIEVAL_MODES
+
+RESNET_QUESTIONS = [
+    "What is a residual block?",
+    "Why do deeper plain networks have higher training error?",
+    "How are shortcut connections implemented?",
+    "What is the degradation problem?",
+    "How does ResNet perform on ImageNet?",
+    "What is a bottleneck architecture?",
+    "How are identity mappings used when dimensions change?",
+    "What results were reported on CIFAR-10?",
+]
+
+_SYNTHETIC_TOPICS = [
+    "gradient", "residual", "convolution", "activation", "normalization", "optimizer",
+    "dataset", "layer", "kernel", "feature", "network", "training", "accuracy", "loss",
+    "embedding", "attention", "dropout", "batch", "pooling", "regularization",
+]
+_SYNTHETIC_WORDS = _SYNTHETIC_TOPICS + [
+    "the", "a", "of", "and", "is", "uses", "improves", "reduces", "deep", "shallow",
+    "model", "stage", "input", "output", "error", "signal", "weights", "depth", "width", "rate",
+]
+
+
+# --- Stub models ---
+class StubEmbedder:
+    """Deterministic bag-of-words hashing embedder with the MiniLM interface."""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, convert_to_tensor=False, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i, int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dim] += 1.0
+        out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out[0] if single else out
+
+
+class StubGenerator:
+    """Text2text pipeline stand-in returning a fixed quiz-shaped text per prompt."""
+
+    TEXT = "Q: What does the text describe? a) one b) two ✅ c) three d) four\nA: It describes the topic."
+
+    def __call__(self, prompts, **kwargs):
+        batch = [prompts] if isinstance(prompts, str) else list(prompts)
+        return [{"generated_text": self.TEXT} for _ in batch]
+
+
+def use_models(kind):
+    if kind == "stub":
+        model_registry.register_model("minilm", StubEmbedder)
+        model_registry.register_model("flan", StubGenerator)
+    else:
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+        try:
+            model_registry.preload("minilm", "flan")
+        except Exception as e:
+            sys.exit(f"Real models are not available offline ({e}); run with --models stub.")
+
+
+# --- Corpora ---
+def synthetic_pages(num_pages, words_per_page=350, seed=0):
+    """Yield (page_no, text) of deterministic sentence-structured text."""
+    rng = np.random.default_rng(seed)
+    for page_no in range(1, num_pages + 1):
+        sentences, n = [], 0
+        while n < words_per_page:
+            length = int(rng.integers(8, 20))
+            words = rng.choice(_SYNTHETIC_WORDS, size=length)
+            sentences.append(" ".join(words).capitalize() + ".")
+            n += length
+        yield page_no, " ".join(sentences)
+
+
+def synthetic_questions(n, seed=1):
+    rng = np.random.default_rng(seed)
+    return [f"How does {a} affect {b}?" for a, b in rng.choice(_SYNTHETIC_TOPICS, size=(n, 2))]
+
+
+# --- Measurement ---
+def peak_rss_bytes():
+    """High-water mark of this process's resident memory (None if unavailable)."""
+    try:
+        import resource
+    except ImportError:   # Windows
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset
+        except (ImportError, AttributeError):
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def timed(fn, items):
+    """Per-item latency of fn(item), in seconds, plus the total wall time."""
+    latencies = []
+    started = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    return np.array(latencies), time.perf_counter() - started
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latency_record(latencies, total_seconds, unit="requests"):
+    ms = latencies * 1000
+    return {
+        "n": len(latencies),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "throughput": round(len(latencies) / total_seconds, 2) if total_seconds else None,
+        "throughput_unit": f"{unit}/s",
+    }
+
+
+def bench_corpus(corpus, args, emit):
+    # imported here so the stub models are registered before anything loads
+    import student_tracking
+    from assistant import StudyAssistant
+    from answer_cache import SemanticAnswerCache
+    from quiz_pool import QuizPool
+    from answer_refiner import packing_stats
+
+    workdir = tempfile.mkdtemp(prefix="studybot-bench-")
+    student_tracking.DB_FILE = os.path.join(workdir, "progress.db")
+    pool = QuizPool(os.path.join(workdir, "quiz_pool.db"))
+    sa = StudyAssistant(
+        student_id="bench", index_mode=args.index_mode, storage=args.storage, retrieval_mode=args.retrieval,
+        answer_cache=SemanticAnswerCache(threshold=float("inf")),   # never hits: measure real work
+        quiz_pool=pool,
+    )
+
+    started = time.perf_counter()
+    if corpus.startswith("synthetic:"):
+        num_pages = int(corpus.split(":", 1)[1])
+        sa.build_from_pages(synthetic_pages(num_pages), num_pages, doc_id=corpus)
+        questions = synthetic_questions(args.queries)
+    else:
+        sa.build_from_pdf(corpus)
+        num_pages = sa.ingest_report["num_pages"]
+        questions = [RESNET_QUESTIONS[i % len(RESNET_QUESTIONS)] for i in range(args.queries)]
+    ingest_seconds = time.perf_counter() - started
+    emit(corpus, "ingest", {
+        "pages": num_pages,
+        "chunks": len(sa.chunks),
+        "seconds": round(ingest_seconds, 3),
+        "throughput": round(num_pages / ingest_seconds, 2),
+        "throughput_unit": "pages/s",
+        "chunks_per_second": round(len(sa.chunks) / ingest_seconds, 2),
+    })
+
+    if not corpus.startswith("synthetic:"):
+        # reopening a cached document: memory-mapped index + lazily read chunk store
+        cache_base = os.path.join(workdir, "cache")
+        StudyAssistant(index_mode=args.index_mode, storage=args.storage, quiz_pool=pool).build_from_pdf(
+            corpus, cache_base=cache_base
+        )
+        loads = []
+        for _ in range(5):
+            reopened = StudyAssistant(index_mode=args.index_mode, storage=args.storage, quiz_pool=pool)
+            rss_before = process_rss_bytes()
+            started = time.perf_counter()
+            reopened.load_from_cache(cache_base)
+            loads.append(time.perf_counter() - started)
+        emit(corpus, "cache_load", dict(
+            latency_record(np.array(loads), sum(loads), "loads"),
+            rss_delta_bytes=(process_rss_bytes() - rss_before) if rss_before is not None else None,
+        ))
+
+    latencies, total = timed(lambda q: sa._search(q, 3, 3), questions)
+    emit(corpus, "search_best_sentences", latency_record(latencies, total, "queries"))
+
+    started = time.perf_counter()
+    sa._search_batch(questions, 3, 3)
+    total = time.perf_counter() - started
+    emit(corpus, "search_best_sentences_batch", {
+        "n": len(questions), "seconds": round(total, 4),
+        "throughput": round(len(questions) / total, 2), "throughput_unit": "queries/s",
+    })
+
+    for mode in RETRIEVAL_MODES:
+        sa.retrieval_mode = mode
+        latencies, total = timed(lambda q: sa._search(q, 3, 3), questions)
+        emit(corpus, f"retrieve_{mode}", latency_record(latencies, total, "queries"))
+    paths = sa.retrieval_stats()
+    emit(corpus, "retrieval_paths", {path: {k: paths[path][k] for k in ("queries", "lexical_hits")} for path in paths})
+    sa.retrieval_mode = args.retrieval
+
+    gen_questions = questions[:args.gen_queries]
+    latencies, total = timed(sa.rag_answer, gen_questions)
+    emit(corpus, "rag_answer", latency_record(latencies, total))
+
+    latencies, total = timed(sa.answer, gen_questions)
+    emit(corpus, "answer", latency_record(latencies, total))
+    emit(corpus, "context_packing", packing_stats())
+
+    started = time.perf_counter()
+    pool.wait_until_idle()
+    emit(corpus, "quiz_pool_fill", {"seconds": round(time.perf_counter() - started, 3), **pool.stats()})
+
+    latencies, total = timed(sa.generate_quiz, gen_questions)
+    emit(corpus, "generate_quiz", latency_record(latencies, total))
+
+    latencies, total = timed(lambda q: sa.generate_quiz_set(q, n=args.quiz_set_size), gen_questions[:3])
+    emit(corpus, "generate_quiz_set", dict(latency_record(latencies, total, "sets"), set_size=args.quiz_set_size))
+
+    latencies, total = timed(lambda _: sa.track_progress(), range(args.queries))
+    emit(corpus, "get_progress", latency_record(latencies, total))
+    pool.wait_until_idle()   # let refills finish before the next corpus starts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest, retrieval, generation and tracking.")
+    parser.add_argument("--corpus", nargs="+", default=["resnet.pdf", "synthetic:50", "synthetic:500"],
+                        help="PDF paths and/or synthetic:<pages>")
+    parser.add_argument("--models", choices=["stub", "real"], default="stub")
+    parser.add_argument("--queries", type=int, default=100, help="queries for retrieval / progress stages")
+    parser.add_argument("--gen-queries", type=int, default=20, help="queries for generation stages")
+    parser.add_argument("--quiz-set-size", type=int, default=10)
+    parser.add_argument("--index-mode", default="flat")
+    parser.add_argument("--storage", default="float32")
+    parser.add_argument("--retrieval", choices=RETRIEVAL_MODES, default="dense", help="retrieval mode for generation stages")
+    parser.add_argument("--out", default=None, help="also append the JSON lines to this file")
+    args = parser.parse_args()
+
+    use_models(args.models)
+    meta = {
+        "commit": git_commit(),
+        "models": args.models,
+        "index_mode": args.index_mode,
+        "storage": args.storage,
+        "retrieval": args.retrieval,
+    }
+    out = open(args.out, "a", encoding="utf-8") if args.out else None
+
+    def emit(corpus, stage, record):
+        line = json.dumps({
+            **meta, "corpus": corpus, "stage": stage, **record,
+            "rss_bytes": process_rss_bytes(), "peak_rss_bytes": peak_rss_bytes(),
+        })
+        print(line, flush=True)
+        if out:
+            out.write(line + "\n")
+            out.flush()
+
+    try:
+        for corpus in args.corpus:
+            bench_corpus(corpus, args, emit)
+    finally:
+        if out:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
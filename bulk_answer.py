@@ -0,0 +1,103 @@
+"""
+Offline bulk answering, e.g. pre-answering a course FAQ bank:
+
+    python bulk_answer.py --pdf resnet.pdf --cache-base resnet_cache \
+        --questions faq.txt --out faq_answers.jsonl
+
+Questions are read one per line (or from the "question" field of a .jsonl
+file) and answered in batches. Every finished batch is appended to --out
+and flushed, so the output file doubles as the checkpoint: re-running the
+same command after a crash skips the questions that are already answered.
+"""
+import argparse
+import json
+import os
+import time
+from itertools import islice
+
+from assistant import StudyAssistant
+from generation import GENERATION_PROFILES, DEFAULT_PROFILE
+from lexical_index import RETRIEVAL_MODES
+
+
+def iter_questions(path):
+    """Yield (line_no, question) lazily; blank lines are skipped."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                line = json.loads(line)["question"]
+            yield line_no, line
+
+
+def load_checkpoint(out_path):
+    """
+    Line numbers already answered in out_path. A partially written last
+    record (crash mid-write) is truncated away first.
+    """
+    if not os.path.exists(out_path):
+        return set()
+
+    with open(out_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+
+    done = set()
+    for line in data[:end].decode("utf-8").splitlines():
+        if line.strip():
+            done.add(json.loads(line)["line"])
+    return done
+
+
+def batched(iterable, size):
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions in batches.")
+    parser.add_argument("--pdf", required=True)
+    parser.add_argument("--cache-base", default=None)
+    parser.add_argument("--questions", required=True, help=".txt (one per line) or .jsonl with 'question'")
+    parser.add_argument("--out", required=True, help="JSON lines output, also used to resume")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--mode", choices=["rag", "refine"], default="rag",
+                        help="rag = rag_answer, refine = answer (summarize + refine)")
+    parser.add_argument("--student-id", default="bulk")
+    parser.add_argument("--profile", choices=sorted(GENERATION_PROFILES), default=DEFAULT_PROFILE)
+    parser.add_argument("--retrieval", choices=RETRIEVAL_MODES, default="dense",
+                        help="dense (MiniLM + FAISS), lexical (BM25) or hybrid (fused, BM25 fast path)")
+    args = parser.parse_args()
+
+    sa = StudyAssistant(student_id=args.student_id, retrieval_mode=args.retrieval)
+    sa.build_from_pdf(args.pdf, cache_base=args.cache_base)
+
+    done = load_checkpoint(args.out)
+    pending = ((n, q) for n, q in iter_questions(args.questions) if n not in done)
+    answer_fn = sa.rag_answer_batch if args.mode == "rag" else sa.answer_batch
+
+    total, started = 0, time.perf_counter()
+    with open(args.out, "a", encoding="utf-8") as out:
+        for batch in batched(pending, args.batch_size):
+            questions = [q for _, q in batch]
+            answers = answer_fn(questions, batch_size=args.batch_size, profile=args.profile)
+
+            for (line_no, question), answer in zip(batch, answers):
+                out.write(json.dumps({"line": line_no, "question": question, "answer": answer}) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+
+            total += len(batch)
+            rate = total / (time.perf_counter() - started)
+            print(f"✅ {total} answered ({len(done)} resumed), {rate:.2f} questions/s")
+
+    print(f"💾 Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Offset-indexed text store for chunk and sentence text in the ingest cache
+(replaces the pickled lists):
+
+    write_chunk_store("notes_cache.chunks", chunks, compress=True)
+    store = ChunkStore("notes_cache.chunks")   # maps the file, reads nothing yet
+    store[42]                                  # decodes one record
+
+Layout: a 24-byte header (magic, flags, count), count + 1 little-endian
+uint64 record offsets, then the UTF-8 records (each zlib-compressed when
+the compressed flag is set). Opening a store costs one mmap regardless of
+its size; records are read by ID as they are used, and only those pages
+are brought into memory. Loading never unpickles anything.
+"""
+import bisect
+import mmap
+import os
+import struct
+import zlib
+from collections.abc import Sequence
+
+import numpy as np
+
+MAGIC = b"SBCHUNK1"
+_HEADER = struct.Struct("<8sIIQ")   # magic, flags, reserved, count
+_COMPRESSED = 1
+
+# Write new caches with zlib-compressed records (STUDYBOT_COMPRESS_CHUNKS=1).
+COMPRESS_CHUNKS = os.environ.get("STUDYBOT_COMPRESS_CHUNKS", "") not in ("", "0")
+
+
+def write_chunk_store(path: str, texts, compress: bool | None = None):
+    """Write texts as a chunk store, via a temp file so a crash never leaves a half-written one."""
+    compress = COMPRESS_CHUNKS if compress is None else compress
+    records = [t.encode("utf-8") for t in texts]
+    if compress:
+        records = [zlib.compress(r) for r in records]
+    offsets = np.zeros(len(records) + 1, dtype="<u8")
+    np.cumsum([len(r) for r in records], out=offsets[1:])
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, _COMPRESSED if compress else 0, 0, len(records)))
+        f.write(offsets.tobytes())
+        for r in records:
+            f.write(r)
+    os.replace(tmp_path, path)
+
+
+class ChunkStore(Sequence):
+    """Read-only, lazily decoded view of a chunk store file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, flags, _, count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a chunk store")
+        self.compressed = bool(flags & _COMPRESSED)
+        self._count = count
+        self._offsets = np.frombuffer(self._mm, dtype="<u8", count=count + 1, offset=_HEADER.size)
+        self._data_start = _HEADER.size + 8 * (count + 1)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        i = int(i)
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("chunk store index out of range")
+        start, end = self._data_start + int(self._offsets[i]), self._data_start + int(self._offsets[i + 1])
+        record = self._mm[start:end]
+        return (zlib.decompress(record) if self.compressed else record).decode("utf-8")
+
+    def __reduce__(self):   # copies / pickles reopen the file instead of copying the mapping
+        return ChunkStore, (self.path,)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._mm)
+
+
+class ChunkSequence(Sequence):
+    """
+    Concatenation of text sequences (lists and/or ChunkStores) indexed as
+    one: the corpus chunks of several documents without copying their text.
+    Parts are never modified, so copies share them.
+    """
+
+    def __init__(self, parts=()):
+        self.parts = []
+        self._ends = []
+        for part in parts:
+            self.extend(part)
+
+    def extend(self, texts):
+        """Append texts as a new part (a ChunkStore stays lazy)."""
+        if isinstance(texts, ChunkSequence):
+            for p in texts.parts:
+                self.extend(p)
+            return
+        part = texts if isinstance(texts, (ChunkStore, list, SequenceView)) else list(texts)
+        if len(part):
+            self.parts.append(part)
+            self._ends.append((self._ends[-1] if self._ends else 0) + len(part))
+
+    def copy(self) -> "ChunkSequence":
+        return ChunkSequence(self.parts)
+
+    def __len__(self):
+        return self._ends[-1] if self._ends else 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        p = bisect.bisect_right(self._ends, i)
+        return self.parts[p][i - (self._ends[p - 1] if p else 0)]
+
+    def view(self, start: int, stop: int):
+        """
+        Rows start:stop without reading them (slicing reads every row). A
+        range inside one part is a view of that part, so views of views do
+        not pile up across compactions.
+        """
+        p = bisect.bisect_right(self._ends, start)
+        if p < len(self.parts) and stop <= self._ends[p]:
+            base = self._ends[p - 1] if p else 0
+            part = self.parts[p]
+            if (start - base, stop - base) == (0, len(part)):
+                return part
+            if isinstance(part, SequenceView):
+                return SequenceView(part.base, part.start + start - base, part.start + stop - base)
+            return SequenceView(part, start - base, stop - base)
+        return SequenceView(self, start, stop)
+
+    def select(self, ranges) -> "ChunkSequence":
+        """The rows of the given (start, stop) ranges, in order, sharing this sequence's text."""
+        selected = ChunkSequence()
+        for start, stop in ranges:
+            if stop > start:
+                selected.extend(self.view(start, stop))
+        return selected
+
+
+class SequenceView(Sequence):
+    """Lazy rows start:stop of another sequence."""
+
+    def __init__(self, base, start, stop):
+        self.base, self.start, self.stop = base, start, stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("view index out of range")
+        return self.base[self.start + i]
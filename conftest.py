@@ -0,0 +1,43 @@
+"""
+Shared pytest setup: the stub models from benchmark.py (no downloads) and
+per-test SQLite files, caches and backend, so tests never touch the
+working tree or each other.
+"""
+from pathlib import Path
+
+import pytest
+
+import benchmark
+import model_registry
+import quiz_pool
+import student_tracking
+
+RESNET_PDF = Path(__file__).parent / "resnet.pdf"
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    benchmark.use_models("stub")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(model_registry, "INFERENCE_BACKEND", "torch")
+    monkeypatch.setattr(student_tracking, "DB_FILE", str(tmp_path / "progress.db"))
+    monkeypatch.setattr(quiz_pool, "_default_pool", quiz_pool.QuizPool(str(tmp_path / "quiz_pool.db")))
+    yield
+    student_tracking.shutdown()
+
+
+@pytest.fixture
+def pdfs(tmp_path):
+    """Three small PDFs cut from resnet.pdf: a.pdf (pages 1-3), b.pdf (4-6) and c.pdf (7-9)."""
+    from PyPDF2 import PdfReader, PdfWriter
+
+    reader = PdfReader(str(RESNET_PDF))
+    paths = {}
+    for name, pages in (("a", range(0, 3)), ("b", range(3, 6)), ("c", range(6, 9))):
+        writer = PdfWriter()
+        for i in pages:
+            writer.add_page(reader.pages[i])
+        paths[name] = str(tmp_path / f"{name}.pdf")
+        with open(paths[name], "wb") as f:
+            writer.write(f)
+    return paths
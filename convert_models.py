@@ -0,0 +1,229 @@
+"""
+Build ONNX Runtime artifacts from the locally cached models, then compare
+them and the int8 backend against the PyTorch path:
+
+    python convert_models.py --formats onnx onnx-int8 --report
+
+The ONNX formats are not serving backends (model_registry.BACKENDS): they
+are loaded here only, until the report shows acceptable drift. Artifacts
+go to ONNX_DIR (onnx_models/ by default, or STUDYBOT_ONNX_DIR). Nothing is
+downloaded: the Hugging Face cache must already hold google/flan-t5-base
+and all-MiniLM-L6-v2.
+
+The report prints one JSON object per (backend, model) with p50 latency,
+speedup over torch, and drift: cosine similarity of embeddings, and exact
+match / similarity ratio of greedy-decoded answers.
+"""
+import argparse
+import difflib
+import glob
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+import model_registry
+from model_registry import FLAN_MODEL_NAME, EMBED_MODEL_NAME
+
+FORMATS = ("onnx", "onnx-int8")
+ONNX_DIR = os.environ.get("STUDYBOT_ONNX_DIR", "onnx_models")
+
+REPORT_SENTENCES = [
+    "Deeper neural networks are more difficult to train.",
+    "Residual learning reformulates layers as learning residual functions with reference to the layer inputs.",
+    "Shortcut connections skip one or more layers and perform identity mapping.",
+    "The degradation problem shows that accuracy saturates and then degrades rapidly as depth increases.",
+    "Bottleneck blocks use 1x1 convolutions to reduce and then restore dimensions.",
+    "On ImageNet, residual nets with a depth of up to 152 layers were evaluated.",
+    "Batch normalization is applied right after each convolution and before activation.",
+    "An ensemble of residual nets achieves 3.57% error on the ImageNet test set.",
+]
+REPORT_QUESTIONS = [
+    "What is residual learning?",
+    "Why are shortcut connections useful?",
+    "What is the degradation problem?",
+    "What does a bottleneck block do?",
+]
+REPORT_GEN_KWARGS = dict(max_new_tokens=64, do_sample=False)   # greedy, so backends are comparable
+
+
+def artifact_dir(model: str, fmt: str) -> str:
+    """Where the ONNX artifacts of a model ("flan"/"minilm") in a format go."""
+    return os.path.join(ONNX_DIR, f"{model}-{fmt}")
+
+
+def _require_artifacts(path, fmt):
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"No ONNX artifacts in '{path}'. Build them with: python convert_models.py --formats {fmt}")
+    return path
+
+
+def load_onnx_flan(fmt):
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    from transformers import AutoTokenizer, pipeline
+    path = _require_artifacts(artifact_dir("flan", fmt), fmt)
+    files = {}
+    if fmt == "onnx-int8":
+        # ORTQuantizer saves <graph>_quantized.onnx; point each part at its quantized graph
+        for f in glob.glob(os.path.join(path, "*_quantized.onnx")):
+            name = os.path.basename(f)
+            part = "encoder" if name.startswith("encoder") else \
+                "decoder_with_past" if "with_past" in name else "decoder"
+            files[f"{part}_file_name"] = name
+    model = ORTModelForSeq2SeqLM.from_pretrained(path, **files)
+    return pipeline("text2text-generation", model=model, tokenizer=AutoTokenizer.from_pretrained(path))
+
+
+def load_onnx_minilm(fmt):
+    from sentence_transformers import SentenceTransformer
+    path = _require_artifacts(artifact_dir("minilm", fmt), fmt)
+    onnx_files = sorted(os.path.relpath(f, path) for f in glob.glob(os.path.join(path, "onnx", "*.onnx")))
+    quantized = [f for f in onnx_files if "qint8" in f or "quantized" in f]
+    if fmt == "onnx-int8" and not quantized:
+        raise FileNotFoundError(f"No quantized ONNX graph in '{path}/onnx'.")
+    file_name = quantized[0] if fmt == "onnx-int8" else os.path.join("onnx", "model.onnx")
+    return SentenceTransformer(path, backend="onnx", model_kwargs={"file_name": file_name})
+
+
+def _offline():
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+
+def convert_flan(fmt, arch):
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    base = artifact_dir("flan", "onnx")
+    if not os.path.isdir(base):
+        model = ORTModelForSeq2SeqLM.from_pretrained(FLAN_MODEL_NAME, export=True, local_files_only=True)
+        model.save_pretrained(base)
+        AutoTokenizer.from_pretrained(FLAN_MODEL_NAME, local_files_only=True).save_pretrained(base)
+        print(f"✅ flan -> {base}")
+    if fmt == "onnx":
+        return
+
+    out = artifact_dir("flan", fmt)
+    qconfig = getattr(AutoQuantizationConfig, arch)(is_static=False, per_channel=False)
+    for graph in sorted(glob.glob(os.path.join(base, "*.onnx"))):
+        quantizer = ORTQuantizer.from_pretrained(base, file_name=os.path.basename(graph))
+        quantizer.quantize(save_dir=out, quantization_config=qconfig)
+    for f in os.listdir(base):   # config + tokenizer files
+        if not f.endswith(".onnx") and os.path.isfile(os.path.join(base, f)) and not os.path.exists(os.path.join(out, f)):
+            shutil.copy(os.path.join(base, f), out)
+    print(f"✅ flan -> {out}")
+
+
+def convert_minilm(fmt, arch):
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+
+    out = artifact_dir("minilm", fmt)
+    model = SentenceTransformer(EMBED_MODEL_NAME, backend="onnx", local_files_only=True)
+    model.save(out)
+    if fmt == "onnx-int8":
+        export_dynamic_quantized_onnx_model(model, arch, out)
+    print(f"✅ minilm -> {out}")
+
+
+def _time_each(fn, items):
+    latencies, results = [], []
+    for item in items:
+        t0 = time.perf_counter()
+        results.append(fn(item))
+        latencies.append(time.perf_counter() - t0)
+    return results, float(np.percentile(latencies, 50))
+
+
+def _run_backend(backend, repeats):
+    """Embeddings + greedy answers of the report inputs under a backend or ONNX format, with p50 latencies."""
+    from answer_refiner import _answer_prompt
+
+    if backend in FORMATS:
+        embedder, flan = load_onnx_minilm(backend), load_onnx_flan(backend)
+    else:
+        model_registry.set_backend(backend)
+        embedder, flan = model_registry.get_embedder(), model_registry.get_flan()
+
+    embed = lambda s: np.asarray(embedder.encode([s]), dtype="float32")[0]
+    embed(REPORT_SENTENCES[0])   # warm-up
+    vectors, embed_p50 = _time_each(embed, REPORT_SENTENCES * repeats)
+
+    context = " ".join(REPORT_SENTENCES)
+    generate = lambda q: flan(_answer_prompt(q, context), **REPORT_GEN_KWARGS)[0]["generated_text"]
+    answers, gen_p50 = _time_each(generate, REPORT_QUESTIONS)
+    return {
+        "vectors": np.stack(vectors[:len(REPORT_SENTENCES)]),
+        "answers": answers,
+        "embed_p50": embed_p50,
+        "gen_p50": gen_p50,
+    }
+
+
+def report(backends, repeats=5):
+    baseline = _run_backend("torch", repeats)
+    rows = []
+    for backend in backends:
+        try:
+            run = _run_backend(backend, repeats)
+        except (FileNotFoundError, ImportError) as e:
+            rows.append({"backend": backend, "error": str(e)})
+            continue
+
+        a, b = baseline["vectors"], run["vectors"]
+        cosine = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+        rows.append({
+            "backend": backend,
+            "model": "minilm",
+            "p50_ms": round(run["embed_p50"] * 1000, 3),
+            "torch_p50_ms": round(baseline["embed_p50"] * 1000, 3),
+            "speedup": round(baseline["embed_p50"] / run["embed_p50"], 2),
+            "mean_cosine": round(float(cosine.mean()), 5),
+            "min_cosine": round(float(cosine.min()), 5),
+        })
+
+        similarity = [
+            difflib.SequenceMatcher(None, x, y).ratio() for x, y in zip(baseline["answers"], run["answers"])
+        ]
+        rows.append({
+            "backend": backend,
+            "model": "flan",
+            "p50_ms": round(run["gen_p50"] * 1000, 1),
+            "torch_p50_ms": round(baseline["gen_p50"] * 1000, 1),
+            "speedup": round(baseline["gen_p50"] / run["gen_p50"], 2),
+            "exact_match": round(sum(x == y for x, y in zip(baseline["answers"], run["answers"])) / len(similarity), 3),
+            "mean_similarity": round(float(np.mean(similarity)), 4),
+        })
+    model_registry.set_backend("torch")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export ONNX / int8 inference artifacts and compare backends.")
+    parser.add_argument("--models", nargs="+", choices=["flan", "minilm"], default=["flan", "minilm"])
+    parser.add_argument("--formats", nargs="*", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--arch", choices=["avx2", "avx512", "avx512_vnni", "arm64"], default="avx2",
+                        help="instruction set targeted by int8 ONNX quantization")
+    parser.add_argument("--report", action="store_true", help="compare int8 and the built formats with torch")
+    parser.add_argument("--report-out", default=None, help="also append the report JSON lines to this file")
+    args = parser.parse_args()
+
+    _offline()
+    converters = {"flan": convert_flan, "minilm": convert_minilm}
+    for fmt in args.formats:
+        for name in args.models:
+            converters[name](fmt, args.arch)
+
+    if args.report:
+        rows = report(["int8", *args.formats])
+        with open(args.report_out, "a", encoding="utf-8") if args.report_out else open(os.devnull, "w") as out:
+            for row in rows:
+                print(json.dumps(row))
+                out.write(json.dumps(row) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Process-wide registry of loaded documents, shared by every app session.
+
+    registry = DocumentRegistry()
+    doc_id = registry.submit("notes.pdf", cache_base="notes_cache")   # returns at once
+    registry.jobs()           # status / pages done per document
+    registry.assistant        # None until the first document is ready
+
+Documents are keyed by PDF content hash: the same PDF uploaded by several
+sessions (under any name) is ingested and embedded once. One background
+worker ingests queued PDFs (and replaces / removes documents) in order.
+Queries use `assistant`, a snapshot of the corpus that is replaced, never
+modified, when a change finishes, so questions keep being answered while
+another PDF is ingested.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ingest_cache
+from assistant import StudyAssistant
+
+
+class DocumentRegistry:
+    def __init__(self, index_mode="flat", storage="float32", answer_cache=None, quiz_pool=None, corpus_dir=None):
+        # Only the ingest worker touches the builder; sessions get its snapshots.
+        self._builder = StudyAssistant(
+            index_mode=index_mode, storage=storage, answer_cache=answer_cache, quiz_pool=quiz_pool
+        )
+        self.assistant = None
+        self.version = 0        # bumped every time a new snapshot is published
+        self._jobs = {}         # sha256 -> {"doc_id", "status", "progress", "error"}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+        if corpus_dir:
+            # documents kept in the corpus directory are ready at once (memory-mapped)
+            for doc_id in self._builder.open_corpus(corpus_dir):
+                sha256 = self._builder.documents[doc_id]["sha256"]
+                self._jobs[sha256] = {"doc_id": doc_id, "sha256": sha256, "status": "ready", "progress": None, "error": None}
+            self._publish(self._builder.snapshot())
+
+    def submit(self, pdf_path: str, cache_base: str | None = None, doc_id=None) -> str:
+        """
+        Queue a PDF for background ingestion and return its doc id. A PDF
+        whose content is already loaded or queued is not ingested again: the
+        existing doc id is returned. A failed document can be submitted again.
+        """
+        sha256 = ingest_cache.file_sha256(pdf_path)
+        doc_id = doc_id or os.path.basename(pdf_path)
+        with self._lock:
+            job = self._jobs.get(sha256)
+            if job is not None and job["status"] != "error":
+                return job["doc_id"]
+            if any(j["doc_id"] == doc_id and j["status"] != "error" for j in self._jobs.values()):
+                raise ValueError(f"Another document is already loaded as '{doc_id}'.")
+            job = {"doc_id": doc_id, "sha256": sha256, "status": "queued", "progress": None, "error": None}
+            self._jobs[sha256] = job
+        self._executor.submit(self._ingest, job, pdf_path, cache_base)
+        return doc_id
+
+    def replace(self, doc_id: str, pdf_path: str, cache_base: str | None = None):
+        """
+        Queue a new version of a loaded document under the same doc id; only
+        that document is re-ingested (see StudyAssistant.replace_pdf).
+        """
+        sha256 = ingest_cache.file_sha256(pdf_path)
+        with self._lock:
+            job = self._jobs.get(sha256)
+            if job is not None and job["status"] != "error":
+                return
+            job = {"doc_id": doc_id, "sha256": sha256, "status": "queued", "progress": None, "error": None}
+            self._jobs[sha256] = job
+        self._executor.submit(self._ingest, job, pdf_path, cache_base, True)
+
+    def remove(self, doc_id: str):
+        """Queue removal of a document; returns a future that raises KeyError for an unknown doc id."""
+        return self._executor.submit(self._remove, doc_id)
+
+    def _ingest(self, job, pdf_path, cache_base, replace=False):
+        job["status"] = "ingesting"
+
+        def on_progress(progress):
+            job["progress"] = progress
+
+        try:
+            if replace:
+                self._builder.replace_pdf(job["doc_id"], pdf_path, cache_base=cache_base, on_progress=on_progress)
+            else:
+                self._builder.add_pdf(pdf_path, cache_base=cache_base, on_progress=on_progress, doc_id=job["doc_id"])
+            snapshot = self._builder.snapshot()
+        except Exception as e:
+            job["status"], job["error"] = "error", f"{type(e).__name__}: {e}"
+            return
+        if replace:
+            self._forget(job["doc_id"], keep=job)
+        self._publish(snapshot)
+        job["status"] = "ready"
+
+    def _remove(self, doc_id):
+        self._builder.remove_document(doc_id)
+        self._forget(doc_id)
+        self._publish(self._builder.snapshot())
+
+    def _forget(self, doc_id, keep=None):
+        """Drop the jobs of doc_id's earlier content, so that content can be submitted again."""
+        with self._lock:
+            self._jobs = {sha: j for sha, j in self._jobs.items() if j["doc_id"] != doc_id or j is keep}
+
+    def _publish(self, snapshot):
+        self.assistant = snapshot if snapshot.documents else None  # queries already running keep the previous one
+        self.version += 1
+
+    def jobs(self) -> list[dict]:
+        """One dict per submitted document: doc_id, sha256, status, progress, error."""
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    @property
+    def documents(self) -> dict:
+        """Ready documents (doc id -> chunk range and sha256)."""
+        return self.assistant.documents if self.assistant is not None else {}
+
+    def wait_until_idle(self):
+        """Block until every queued document has been ingested (for scripts and benchmarks)."""
+        self._executor.submit(lambda: None).result()
@@ -1,15 +1,22 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
-# Load embedding model once (fast & small)
-_embedder = SentenceTransformer("all-MiniLM-L6-v2")
+import metrics
+from model_registry import get_embedder
+
+# The embedding model is loaded lazily (and shared) through model_registry.
 
 def generate_embeddings(chunks):
-    return _embedder.encode(chunks, convert_to_tensor=False)
+    metrics.count("chunks_embedded", len(chunks))
+    with metrics.span("embed_chunks"):
+        return get_embedder().encode(chunks, convert_to_tensor=False)
 
 def embed_query(query):
-    return _embedder.encode([query]).astype("float32")
+    with metrics.span("embed_query"):
+        return get_embedder().encode([query]).astype("float32")
+
+def embedding_dim():
+    return get_embedder().get_sentence_embedding_dimension()
 
 def embed_texts(texts):
-    arr = _embedder.encode(texts, convert_to_tensor=False)
+    arr = get_embedder().encode(texts, convert_to_tensor=False)
     return np.array(arr).astype("float32")
@@ -0,0 +1,221 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from model_registry import get_flan
+
+# Named generation profiles, chosen per request. Each sets the decoding
+# strategy, a token budget per kind of output (max_new_tokens: decoding stops
+# at EOS or the budget, there is no forced minimum length), an optional
+# wall-clock deadline (max_time: generate() stops and returns the text so far;
+# for batched calls it bounds the whole batch) and whether long answer
+# contexts get an extra summarization pass.
+GENERATION_PROFILES = {
+    "fast": {
+        "decoding": dict(do_sample=False, num_beams=1, repetition_penalty=1.5),
+        "max_new_tokens": {"answer": 128, "summary": 96, "mcq": 160, "short_question": 96},
+        "max_time": 4.0,
+        "summarize": False,
+    },
+    "balanced": {
+        "decoding": dict(do_sample=True, temperature=0.7, top_p=0.9, top_k=50, repetition_penalty=2.0),
+        "max_new_tokens": {"answer": 250, "summary": 200, "mcq": 250, "short_question": 180},
+        "max_time": 15.0,
+        "summarize": True,
+    },
+    "thorough": {
+        "decoding": dict(do_sample=False, num_beams=4, no_repeat_ngram_size=3, repetition_penalty=1.5),
+        "max_new_tokens": {"answer": 384, "summary": 256, "mcq": 320, "short_question": 220},
+        "max_time": None,
+        "summarize": True,
+    },
+}
+DEFAULT_PROFILE = "balanced"
+
+# Flan-T5 encoder input length; longer prompts are cut off by the tokenizer.
+FLAN_MAX_INPUT_TOKENS = 512
+# Tokens per whitespace word, to estimate lengths when the generator has no tokenizer.
+TOKENS_PER_WORD = 1.3
+
+class _FlanLock:
+    """
+    Re-entrant lock around Flan-T5 and its tokenizer where interactive
+    callers go first: background() (the quiz pool) only takes the lock
+    while no other caller holds it or waits for it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._idle = threading.Condition()
+        self._interactive = 0           # threads holding or waiting for the lock, background ones excluded
+        self._local = threading.local()
+
+    def __enter__(self):
+        local = self._local
+        local.depth = getattr(local, "depth", 0) + 1
+        if local.depth == 1 and not getattr(local, "background", False):
+            with self._idle:
+                self._interactive += 1
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+        local = self._local
+        local.depth -= 1
+        if local.depth == 0 and not getattr(local, "background", False):
+            with self._idle:
+                self._interactive -= 1
+                self._idle.notify_all()
+
+    @contextmanager
+    def background(self):
+        """Hold the lock for one unit of background work, once no interactive call is pending."""
+        with self._idle:
+            self._idle.wait_for(lambda: not self._interactive)
+        self._local.background = True
+        try:
+            with self:
+                yield
+        finally:
+            self._local.background = False
+
+
+# Flan-T5 and its tokenizer serve one call at a time: the server's model
+# worker, the quiz pool's background thread and streaming answers share them.
+_flan_lock = _FlanLock()
+
+
+def background_generation():
+    """Context for background (quiz pool) generation: waits while interactive calls are pending."""
+    return _flan_lock.background()
+
+
+def get_profile(name: str | None) -> dict:
+    """The named profile (DEFAULT_PROFILE for None)."""
+    name = name or DEFAULT_PROFILE
+    if name not in GENERATION_PROFILES:
+        raise ValueError(f"Unknown generation profile '{name}'. Known: {sorted(GENERATION_PROFILES)}")
+    return GENERATION_PROFILES[name]
+
+
+def profile_kwargs(profile: str | None, kind: str) -> dict:
+    """generate() keyword arguments of a profile for one kind of output ("answer", "summary", "mcq", ...)."""
+    p = get_profile(profile)
+    kwargs = dict(p["decoding"], max_new_tokens=p["max_new_tokens"][kind])
+    if p["max_time"] is not None:
+        kwargs["max_time"] = p["max_time"]
+    return kwargs
+
+
+def count_tokens(text: str) -> int | None:
+    """Flan-T5 tokens in text (None if the loaded generator has no tokenizer)."""
+    tokenizer = getattr(get_flan(), "tokenizer", None)
+    if tokenizer is None:
+        return None
+    with _flan_lock:
+        return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def token_lengths(texts: list[str]) -> list[int]:
+    """Flan-T5 tokens per text, in one tokenizer call (estimated from word counts without a tokenizer)."""
+    texts = list(texts)
+    tokenizer = getattr(get_flan(), "tokenizer", None)
+    if tokenizer is None:
+        return [math.ceil(len(t.split()) * TOKENS_PER_WORD) for t in texts]
+    if not texts:
+        return []
+    with _flan_lock:
+        return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """text cut to its first max_tokens Flan-T5 tokens."""
+    tokenizer = getattr(get_flan(), "tokenizer", None)
+    if tokenizer is None:
+        return " ".join(text.split()[:int(max_tokens / TOKENS_PER_WORD)])
+    with _flan_lock:
+        ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+        return text if len(ids) <= max_tokens else tokenizer.decode(ids[:max_tokens], skip_special_tokens=True)
+
+
+def prompt_budgets(prompts: list[str]) -> list[int]:
+    """Context tokens left in each (context-less) prompt under the encoder limit (1 for </s>)."""
+    return [max(FLAN_MAX_INPUT_TOKENS - n - 1, 0) for n in token_lengths(prompts)]
+
+
+def record_tokens(prompts: list[str], outputs: list[str]):
+    """Count prompt/output tokens (only when metrics are enabled: tokenizing costs time)."""
+    if not metrics.is_enabled() or getattr(get_flan(), "tokenizer", None) is None:
+        return
+    metrics.count("prompt_tokens", sum(count_tokens(p) for p in prompts))
+    metrics.count("output_tokens", sum(count_tokens(o) for o in outputs))
+
+
+def generate_text(prompt: str, **gen_kwargs) -> str:
+    """Run Flan-T5 on a single prompt and return the generated string."""
+    with metrics.span("generate"), _flan_lock:
+        output = get_flan()(prompt, **gen_kwargs)[0]["generated_text"]
+    metrics.count("generations")
+    record_tokens([prompt], [output])
+    return output
+
+
+def generate_texts(prompts: list[str], batch_size: int = 8, **gen_kwargs) -> list[str]:
+    """
+    Run Flan-T5 over many prompts in padded batches of batch_size.
+    Returns one generated string per prompt, in order.
+    """
+    if not prompts:
+        return []
+
+    with metrics.span("generate_batch"), _flan_lock:
+        outputs = get_flan()(list(prompts), batch_size=batch_size, **gen_kwargs)
+    # the pipeline returns [{...}, ...] for single-sequence outputs, [[{...}], ...] otherwise
+    texts = [(o[0] if isinstance(o, list) else o)["generated_text"] for o in outputs]
+    metrics.count("generations", len(texts))
+    record_tokens(prompts, texts)
+    return texts
+
+
+def stream_generate(prompt: str, **gen_kwargs):
+    """
+    Yield Flan-T5 output text piece by piece as tokens are decoded.
+    generate() runs on a background thread feeding a TextIteratorStreamer.
+    """
+    from transformers import TextIteratorStreamer
+
+    flan = get_flan()
+    tokenizer, model = flan.tokenizer, flan.model
+    with _flan_lock:
+        inputs = tokenizer(prompt, return_tensors="pt", truncation=True).to(model.device)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    errors = []
+
+    def run():
+        try:
+            with _flan_lock:
+                model.generate(**inputs, streamer=streamer, **gen_kwargs)
+        except Exception as e:   # surface in the caller instead of hanging the stream
+            errors.append(e)
+            streamer.end()
+
+    thread = threading.Thread(target=run, daemon=True)
+    started = time.perf_counter()
+    thread.start()
+    pieces = []
+    for piece in streamer:
+        if piece:
+            if not pieces:
+                metrics.record_span("generate_first_token", time.perf_counter() - started)
+            pieces.append(piece)
+            yield piece
+    thread.join()
+
+    if errors:
+        raise errors[0]
+    metrics.record_span("generate", time.perf_counter() - started)
+    metrics.count("generations")
+    record_tokens([prompt], ["".join(pieces)])
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from text_processing import CHUNKING_TIERS
+import model_registry
+from model_registry import EMBED_MODEL_NAME
+
+# Bump when the on-disk cache layout changes so old caches are rebuilt.
+CACHE_VERSION = 4
+
+_stats = {"hits": 0, "misses": 0, "stale": 0, "load_seconds": 0.0, "build_seconds": 0.0}
+_stats_lock = threading.Lock()
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Content hash of a file, read in blocks so large PDFs stay cheap on memory."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_settings(pdf_sha256: str, index_mode: str = "flat", storage: str = "float32") -> dict:
+    """Everything that changes the cached index/chunks for a given PDF."""
+    return {
+        "version": CACHE_VERSION,
+        "pdf_sha256": pdf_sha256,
+        "chunking": CHUNKING_TIERS,
+        "embed_model": EMBED_MODEL_NAME,
+        "backend": model_registry.INFERENCE_BACKEND,   # int8 embeddings differ numerically from torch
+        "index_mode": index_mode,
+        "storage": storage,
+    }
+
+
+def cache_key(settings: dict) -> str:
+    blob = json.dumps(settings, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+
+def manifest_path(cache_base: str) -> str:
+    return f"{cache_base}.manifest.json"
+
+
+def cache_files(cache_base: str) -> list[str]:
+    return [
+        f"{cache_base}.faiss", f"{cache_base}.chunks", f"{cache_base}.pages.npy",
+        f"{cache_base}.sent.faiss", f"{cache_base}.sent.chunks", f"{cache_base}.sent.npz",
+    ]
+
+
+def read_manifest(cache_base: str) -> dict | None:
+    try:
+        with open(manifest_path(cache_base), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def check_cache(cache_base: str, key: str) -> str:
+    """
+    Returns "hit", "miss" (nothing cached) or "stale" (cached for other
+    content/settings, or files missing). Updates the hit/miss counters.
+    """
+    manifest = read_manifest(cache_base)
+    if manifest is None:
+        status = "stale" if is_legacy_cache(cache_base) else "miss"
+    elif manifest.get("key") == key and all(os.path.exists(p) for p in cache_files(cache_base)):
+        status = "hit"
+    else:
+        status = "stale"
+
+    with _stats_lock:
+        _stats["hits" if status == "hit" else "misses" if status == "miss" else "stale"] += 1
+    return status
+
+
+def is_legacy_cache(cache_base: str) -> bool:
+    """True for a cache written before manifests (<cache_base>.faiss + pickled <cache_base>.pkl chunks)."""
+    return read_manifest(cache_base) is None and os.path.exists(f"{cache_base}.pkl")
+
+
+def invalidate(cache_base: str):
+    """Drop the manifest so a half-rebuilt cache is never mistaken for a hit."""
+    try:
+        os.remove(manifest_path(cache_base))
+    except FileNotFoundError:
+        pass
+
+
+def write_manifest(cache_base: str, key: str, settings: dict, **extra):
+    """Written last, after the index and chunks, so its presence marks a complete cache."""
+    manifest = {
+        "key": key,
+        "settings": settings,
+        "created": datetime.now().isoformat(),
+        **extra,
+    }
+    path = manifest_path(cache_base)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def remove_cache(cache_base: str):
+    """Delete a cache (manifest first, so a partly deleted one is never a hit)."""
+    invalidate(cache_base)
+    for path in cache_files(cache_base) + [f"{cache_base}.lex.npz", f"{cache_base}.lex.chunks", f"{cache_base}.pkl"]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# A corpus directory keeps one cache ("segment") per document plus
+# corpus.json, the doc id -> segment list. Adding, replacing or removing a
+# document writes or deletes only that document's segment and rewrites the
+# small list; unchanged documents are only rewritten by a compaction, which
+# saves the live rows of all documents as one "base" segment.
+
+def corpus_manifest_path(corpus_dir: str) -> str:
+    return os.path.join(corpus_dir, "corpus.json")
+
+
+def segment_base(corpus_dir: str, pdf_sha256: str) -> str:
+    """Cache base of a document's segment, named by content so a re-added PDF reuses it."""
+    return os.path.join(corpus_dir, "segments", pdf_sha256[:16])
+
+
+def base_segment(corpus_dir: str) -> str:
+    """Cache base for a new compacted segment; never reuses a name, as the old base may still be mapped."""
+    return os.path.join(corpus_dir, "segments", f"base-{uuid.uuid4().hex[:16]}")
+
+
+def read_corpus_manifest(corpus_dir: str) -> dict:
+    """
+    doc id -> {"sha256", "segment"} (segment relative to corpus_dir), plus
+    "first_chunk" / "num_chunks" for a document stored in a base segment;
+    empty for a new corpus.
+    """
+    try:
+        with open(corpus_manifest_path(corpus_dir), "r", encoding="utf-8") as f:
+            return json.load(f)["documents"]
+    except FileNotFoundError:
+        return {}
+
+
+def write_corpus_manifest(corpus_dir: str, documents: dict):
+    path = corpus_manifest_path(corpus_dir)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": CACHE_VERSION, "updated": datetime.now().isoformat(), "documents": documents}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def record_timing(kind: str, seconds: float):
+    """kind is "load" (cache hit) or "build" (miss/stale rebuild)."""
+    with _stats_lock:
+        _stats[f"{kind}_seconds"] += seconds
+
+
+def get_cache_stats() -> dict:
+    """Hit/miss/stale counts and total load vs. build time for this process."""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,122 @@
+import time
+
+import numpy as np
+
+import metrics
+from data_ingestion import open_pdf_pages
+from text_processing import iter_chunks, chunking_params
+from embeddings import generate_embeddings, embedding_dim
+from vector_store import (
+    new_faiss_index, needs_training, new_sentence_index, add_to_sentence_index, train_sentence_index,
+    index_setup, IVF_TRAIN_SIZE
+)
+from lexical_index import new_lexical_index, add_to_lexical_index
+
+# Chunks embedded (and added to the index) per step; bounds the float32 embedding batch.
+EMBED_BATCH_SIZE = 64
+
+
+def stream_pages_into_index(pages, num_pages, batch_size=EMBED_BATCH_SIZE, on_progress=None,
+                            index_mode="flat", storage="float32"):
+    """
+    Generator pipeline: pages -> incremental chunker -> batched embeddings ->
+    FAISS index, one batch at a time. pages is an iterable of
+    (page_no, text, seconds) as produced by data_ingestion.iter_pages.
+    For index modes / storage types that need training, the first
+    IVF_TRAIN_SIZE vectors are held back, used to train the index, then
+    added; the sentence index is trained the same way. A document too small
+    to train the requested setup falls back to a simpler one (see
+    new_faiss_index), which the report records as "fallback".
+
+    Memory: page text, word lists and float32 embeddings are only held a
+    batch at a time, but the result is built in memory and grows with the
+    document: chunk and sentence texts, lexical postings, the indexes'
+    stored codes and, until training, up to IVF_TRAIN_SIZE held-back
+    vectors per index. Nothing is written to disk here.
+
+    on_progress(dict) is called after every batch with pages/chunks done.
+    Returns {"chunks", "chunk_pages", "index", "sentence_index", "lexical_index", "report"}.
+    """
+    started = time.perf_counter()
+    chunk_size, overlap = chunking_params(num_pages)
+    dim = embedding_dim()
+    index = None if needs_training(index_mode, storage) else new_faiss_index(dim, index_mode, storage=storage)
+    untrained = []   # vector batches waiting for the index to be trained
+    sentence_index = new_sentence_index(storage)
+    lexical_index = new_lexical_index()
+    chunks, chunk_pages, batch, page_seconds = [], [], [], []
+    report = {"num_pages": num_pages, "pages_done": 0, "chunks_done": 0}
+
+    def page_texts():
+        for page_no, text, secs in pages:
+            report["pages_done"] = page_no
+            page_seconds.append(secs)
+            yield page_no, text
+
+    def train_index():
+        nonlocal index
+        vectors = np.vstack(untrained) if untrained else np.empty((0, dim), dtype="float32")
+        index = new_faiss_index(dim, index_mode, train_vectors=vectors, storage=storage)
+        index.add(vectors)
+        untrained.clear()
+
+    def flush():
+        vectors = np.asarray(generate_embeddings(batch), dtype="float32")
+        if index is not None:
+            with metrics.span("index_add"):
+                index.add(vectors)
+        else:
+            untrained.append(vectors)
+            if sum(len(v) for v in untrained) >= IVF_TRAIN_SIZE:
+                train_index()
+        with metrics.span("sentence_index_add"):
+            add_to_sentence_index(sentence_index, batch)
+        with metrics.span("lexical_index_add"):
+            add_to_lexical_index(lexical_index, batch)
+        chunks.extend(batch)
+        batch.clear()
+        report["chunks_done"] = len(chunks)
+        if on_progress:
+            on_progress(dict(report, seconds=time.perf_counter() - started))
+
+    for chunk, first_page, last_page in iter_chunks(page_texts(), chunk_size, overlap):
+        batch.append(chunk)
+        chunk_pages.append((first_page, last_page))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    if index is None:
+        train_index()
+    train_sentence_index(sentence_index)
+
+    # chunk / sentence index: "mode/storage" requested -> built, when too few vectors forced a fallback
+    report["fallback"] = {
+        name: f"{'/'.join(requested)} -> {'/'.join(index_setup(ix))}"
+        for name, ix, requested in (
+            ("chunks", index, (index_mode, storage)), ("sentences", sentence_index["index"], ("flat", storage))
+        )
+        if index_setup(ix) != requested
+    }
+    if report["fallback"]:
+        print(f"⚠️ Too few vectors to train the requested index: {report['fallback']} (retrained as the corpus grows)")
+    report["seconds"] = time.perf_counter() - started
+    report["page_seconds"] = page_seconds
+    return {
+        "chunks": chunks,
+        "chunk_pages": chunk_pages,
+        "index": index,
+        "sentence_index": sentence_index,
+        "lexical_index": lexical_index,
+        "report": report,
+    }
+
+
+def stream_pdf_into_index(pdf_path, batch_size=EMBED_BATCH_SIZE, on_progress=None, workers=None,
+                          index_mode="flat", storage="float32"):
+    """stream_pages_into_index over a PDF, pages extracted in parallel as they are consumed."""
+    num_pages, pages = open_pdf_pages(pdf_path, workers=workers)
+    return stream_pages_into_index(
+        pages, num_pages, batch_size=batch_size, on_progress=on_progress,
+        index_mode=index_mode, storage=storage
+    )
@@ -0,0 +1,377 @@
+"""
+BM25 inverted index over chunks, next to the FAISS indexes. Exact-term
+lookups ("Table 3", "bottleneck block") are answered from postings lists
+without a MiniLM encode or a FAISS search. The sentences of the retrieved
+chunks are scored at query time with the chunk-level idf, from the text
+already stored in the sentence index.
+
+Retrieval modes (StudyAssistant.retrieval_mode):
+    "dense"    MiniLM + FAISS only (the default)
+    "lexical"  BM25 chunks, then BM25 sentences within them
+    "hybrid"   dense and BM25 chunk rankings fused by reciprocal rank; a
+               confident BM25 hit (every query term in the top chunk, clearly
+               ahead of the runner-up) takes the lexical path and skips FAISS
+"""
+import bisect
+import heapq
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+import metrics
+from embeddings import embed_query
+from vector_store import chunk_sentences, search_chunks, search_best_sentences, best_sentences
+
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+BM25_K1, BM25_B = 1.2, 0.75
+RRF_K = 60               # reciprocal rank fusion: score = sum 1 / (RRF_K + rank)
+CONFIDENT_MARGIN = 1.5   # top chunk BM25 score / runner-up score needed for the fast path
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how in into is it its of on or "
+    "that the their this to was were what when where which who why will with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased alphanumeric terms without stopwords ("Table 3" -> ["table", "3"])."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class _BM25Scoring:
+    """
+    Query-time BM25 over segments() = [(first row, BM25Index), ...], with
+    corpus-wide idf and average length. Shared by BM25Index and BM25Sequence.
+    """
+
+    def idf(self, term, df=None) -> float:
+        n = len(self)
+        if df is None:
+            df = sum(len(part.posting(term)) for _, part in self.segments())
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def scores(self, terms, rows=None) -> dict:
+        """row -> BM25 score of every row containing a query term (rows restricts the rows scored)."""
+        n = len(self)
+        if not n or not terms:
+            return {}
+        avgdl = self.total_length / n or 1.0
+        allowed = set(rows) if rows is not None else None
+        segments = self.segments()
+        scores = defaultdict(float)
+        for term in set(terms):
+            postings = [(first, part, part.posting(term)) for first, part in segments]
+            df = sum(len(posting) for _, _, posting in postings)
+            if not df:
+                continue
+            idf = self.idf(term, df)
+            for first, part, posting in postings:
+                for row, tf in posting.items():
+                    if allowed is not None and first + row not in allowed:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * part.lengths[row] / avgdl)
+                    scores[first + row] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, terms, k, rows=None) -> list[tuple[int, float]]:
+        """(row, score) of the k best-scoring rows with a query term, best first (rows restricts the search)."""
+        return top_hits(self.scores(terms, rows), k)
+
+    def score_texts(self, terms, texts) -> np.ndarray:
+        """
+        BM25 scores of texts that are not rows of the index (the sentences
+        of retrieved chunks), with this index's idf; lengths are normalized
+        by the texts' own average.
+        """
+        counts = [Counter(tokenize(t)) for t in texts]
+        lengths = np.array([sum(c.values()) for c in counts], dtype="float64")
+        avgdl = float(lengths.mean()) if lengths.any() else 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avgdl)
+        scores = np.zeros(len(texts))
+        for term in set(terms):
+            tfs = np.array([c.get(term, 0) for c in counts], dtype="float64")
+            scores += self.idf(term) * tfs * (BM25_K1 + 1) / (tfs + norm)
+        return scores
+
+    def contains(self, term, row) -> bool:
+        first, part = self.segment_of(row)
+        return row - first in part.posting(term)
+
+    def select(self, ranges) -> "BM25Index":
+        """Index of the rows in the given (start, stop) ranges, renumbered in order."""
+        new_rows, first = {}, 0
+        for start, stop in ranges:
+            new_rows.update(zip(range(start, stop), range(first, first + stop - start)))
+            first += stop - start
+        selected = BM25Index()
+        for offset, part in self.segments():
+            for term, posting in part.iter_postings():
+                kept = {new_rows[offset + row]: tf for row, tf in posting.items() if offset + row in new_rows}
+                if kept:
+                    selected._postings[term].update(kept)
+        for start, stop in ranges:
+            for row in range(start, stop):
+                offset, part = self.segment_of(row)
+                selected.lengths.append(part.lengths[row - offset])
+        selected.total_length = sum(selected.lengths)
+        return selected
+
+
+class BM25Index(_BM25Scoring):
+    """
+    Postings (term -> {row: term frequency}) plus row lengths. Scores are
+    computed at query time from the current statistics, so rows can be
+    appended without rebuilding. A cached index keeps its postings packed
+    and reads only the query terms' postings.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._packed = None   # (terms, starts, rows, tfs) read from a cache, terms sorted
+        self.lengths = []
+        self.total_length = 0
+
+    @property
+    def postings(self):
+        """All postings as dicts (unpacks a cached index; only needed to add rows)."""
+        if self._packed is not None:
+            self._postings.update(self.iter_postings())
+            self._packed = None
+        return self._postings
+
+    def posting(self, term) -> dict:
+        """{row: term frequency} of one term."""
+        if self._packed is None:
+            return self._postings.get(term, {})
+        terms, starts, rows, tfs = self._packed
+        i = int(np.searchsorted(terms, term))
+        if i == len(terms) or terms[i] != term:
+            return {}
+        return dict(zip(rows[starts[i]:starts[i + 1]].tolist(), tfs[starts[i]:starts[i + 1]].tolist()))
+
+    def iter_postings(self):
+        """(term, {row: term frequency}) of every term, without unpacking a cached index in place."""
+        if self._packed is None:
+            yield from self._postings.items()
+            return
+        terms, starts, rows, tfs = self._packed
+        bounds, rows, tfs = starts.tolist(), rows.tolist(), tfs.tolist()
+        for i, term in enumerate(terms.tolist()):
+            yield term, dict(zip(rows[bounds[i]:bounds[i + 1]], tfs[bounds[i]:bounds[i + 1]]))
+
+    def to_arrays(self, prefix: str) -> dict:
+        """Postings as flat arrays (CSR by term) for np.savez."""
+        postings = dict(self.iter_postings())
+        terms = sorted(postings)
+        starts = np.zeros(len(terms) + 1, dtype="int64")
+        np.cumsum([len(postings[t]) for t in terms], out=starts[1:])
+        return {
+            f"{prefix}terms": np.array(terms, dtype=str),
+            f"{prefix}starts": starts,
+            f"{prefix}rows": np.array([r for t in terms for r in postings[t]], dtype="int64"),
+            f"{prefix}tfs": np.array([tf for t in terms for tf in postings[t].values()], dtype="int32"),
+            f"{prefix}lengths": np.array(self.lengths, dtype="int32"),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str) -> "BM25Index":
+        bm25 = cls()
+        bm25._packed = tuple(arrays[f"{prefix}{k}"] for k in ("terms", "starts", "rows", "tfs"))
+        bm25.lengths = arrays[f"{prefix}lengths"].tolist()
+        bm25.total_length = sum(bm25.lengths)
+        return bm25
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def segments(self):
+        return [(0, self)]
+
+    def segment_of(self, row):
+        return 0, self
+
+    def add(self, texts):
+        postings = self.postings
+        for text in texts:
+            row = len(self.lengths)
+            tokens = tokenize(text)
+            for term, tf in Counter(tokens).items():
+                postings[term][row] = tf
+            self.lengths.append(len(tokens))
+            self.total_length += len(tokens)
+
+
+class BM25Sequence(_BM25Scoring):
+    """
+    Concatenation of BM25 indexes scored as one (rows continue from part to
+    part, statistics are corpus-wide), so a document is added without
+    copying or unpacking the other documents' postings. Parts are never
+    modified once added, so copies share them.
+    """
+
+    def __init__(self, parts=()):
+        self.parts = []
+        self._firsts = []
+        self._len = 0
+        self.total_length = 0
+        for part in parts:
+            self.append(part)
+
+    def append(self, index):
+        if isinstance(index, BM25Sequence):
+            for part in index.parts:
+                self.append(part)
+            return
+        self.parts.append(index)
+        self._firsts.append(self._len)
+        self._len += len(index)
+        self.total_length += index.total_length
+
+    def copy(self) -> "BM25Sequence":
+        return BM25Sequence(self.parts)
+
+    def __len__(self):
+        return self._len
+
+    def segments(self):
+        return list(zip(self._firsts, self.parts))
+
+    def segment_of(self, row):
+        p = bisect.bisect_right(self._firsts, row) - 1
+        return self._firsts[p], self.parts[p]
+
+
+def top_hits(scores, k) -> list[tuple[int, float]]:
+    """The k best (row, score) pairs of a scores dict, best first."""
+    return heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+
+
+def new_lexical_index():
+    """Empty lexical index: BM25 over chunk rows."""
+    return {"chunks": BM25Index()}
+
+
+def add_to_lexical_index(lexical_index, chunks):
+    """Index chunks appended after the ones already indexed."""
+    lexical_index["chunks"].add(chunks)
+
+
+def build_lexical_index(chunks):
+    lexical_index = new_lexical_index()
+    add_to_lexical_index(lexical_index, chunks)
+    return lexical_index
+
+
+def merge_lexical_index(target, source):
+    """Lexical index of target's chunks followed by source's, sharing both; neither input is modified."""
+    return {"chunks": BM25Sequence([target["chunks"], source["chunks"]])}
+
+
+def select_lexical_ranges(lexical_index, ranges):
+    """Lexical index of the chunks in the given (start, stop) chunk row ranges, renumbered in order."""
+    return {"chunks": lexical_index["chunks"].select(ranges)}
+
+
+def copy_lexical_index(lexical_index):
+    """Copy sharing the (never modified) postings."""
+    return dict(lexical_index) if lexical_index is not None else None
+
+
+def save_lexical_index(lexical_index, cache_base):
+    """BM25 postings to <cache_base>.lex.npz (no pickle)."""
+    tmp_path = f"{cache_base}.lex.tmp.npz"
+    np.savez(tmp_path, **lexical_index["chunks"].to_arrays("chunks_"))
+    os.replace(tmp_path, f"{cache_base}.lex.npz")
+    try:
+        os.remove(f"{cache_base}.lex.chunks")   # sentence text of older caches, now read from the sentence index
+    except FileNotFoundError:
+        pass
+
+
+def load_lexical_index(cache_base):
+    """The cached lexical index; postings are only unpacked when first searched."""
+    with np.load(f"{cache_base}.lex.npz", allow_pickle=False) as arrays:
+        return {"chunks": BM25Index.from_arrays(arrays, "chunks_")}
+
+
+def lexical_chunk_scores(terms, lexical_index, rows=None) -> dict:
+    with metrics.span("lexical_chunk_search"):
+        return lexical_index["chunks"].scores(terms, rows)
+
+
+def lexical_best_sentences(terms, lexical_index, chunk_rows, k_sentences, chunks, sentence_index=None) -> list[str]:
+    """
+    BM25-best sentences of the given chunks (text from the sentence index,
+    or split from the chunks without one); when none contains a query
+    term, the leading sentences of the first chunk.
+    """
+    sentences = chunk_sentences(chunk_rows, chunks, sentence_index)
+    if not sentences:
+        return []
+    with metrics.span("lexical_sentence_search"):
+        scores = lexical_index["chunks"].score_texts(terms, sentences)
+    best = [i for i in np.argsort(-scores, kind="stable")[:k_sentences] if scores[i] > 0]
+    return [sentences[i] for i in best or range(min(k_sentences, len(sentences)))]
+
+
+def is_confident(terms, hits, lexical_index) -> bool:
+    """Every query term occurs in the top chunk and it scores CONFIDENT_MARGIN x the runner-up."""
+    if not hits or not terms:
+        return False
+    top, top_score = hits[0]
+    if not all(lexical_index["chunks"].contains(t, top) for t in terms):
+        return False
+    return len(hits) == 1 or top_score >= CONFIDENT_MARGIN * hits[1][1]
+
+
+def fuse_rankings(rankings, k) -> list[int]:
+    """Reciprocal rank fusion of several ranked row lists; the k best rows."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            scores[row] += 1.0 / (RRF_K + rank + 1)
+    return [row for row, _ in heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])]
+
+
+def retrieve_sentences(query, mode, index, chunks, lexical_index, k_chunks=3, k_sentences=3, sentence_index=None,
+                       rows=None, query_vector=None) -> tuple[list[str], dict]:
+    """
+    Best sentences for query under a retrieval mode (see module docstring).
+    Returns (sentences, info); info["path"] is the path actually taken
+    ("dense", "lexical", "hybrid" or "fast_path") and info["lexical_hits"]
+    the number of chunks containing a query term. query_vector is only
+    needed (or computed) on the dense and fused paths. The fused chunks go
+    straight to the sentence stage (no second, restricted chunk search).
+    """
+    if mode == "dense":
+        sentences = search_best_sentences(
+            query, index, chunks, k_chunks=k_chunks, k_sentences=k_sentences,
+            sentence_index=sentence_index, rows=rows, query_vector=query_vector
+        )
+        return sentences, {"path": "dense", "lexical_hits": None}
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode '{mode}'; choose from {RETRIEVAL_MODES}.")
+
+    terms = tokenize(query)
+    n_candidates = k_chunks if mode == "lexical" else 2 * k_chunks
+    scores = lexical_chunk_scores(terms, lexical_index, rows)
+    hits = top_hits(scores, n_candidates)
+    info = {"lexical_hits": len(scores)}
+
+    if mode == "lexical" or is_confident(terms, hits, lexical_index):
+        info["path"] = "lexical" if mode == "lexical" else "fast_path"
+        top_rows = [row for row, _ in hits[:k_chunks]]
+        metrics.count("chunks_retrieved", len(top_rows))
+        return lexical_best_sentences(terms, lexical_index, top_rows, k_sentences, chunks, sentence_index), info
+
+    if query_vector is None:
+        query_vector = embed_query(query)   # shared by the chunk and sentence stages
+    dense_rows = search_chunks(query, index, n_candidates, rows, query_vector=query_vector)
+    fused = fuse_rankings([dense_rows, [row for row, _ in hits]], k_chunks)
+    info["path"] = "hybrid"
+    metrics.count("chunks_retrieved", len(fused))
+    return best_sentences(query_vector, fused, chunks, k_sentences, sentence_index), info
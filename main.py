@@ -1,36 +1,48 @@
 from assistant import StudyAssistant
+from ingest_cache import get_cache_stats
+from model_registry import model_stats
 
-pdf_path = "C:/Users/aksha/OneDrive/Documents/Desktop/personalized_studybot/resnet.pdf"
-cache_base = "ml_types_cache"
+# Guarded so PDF extraction worker processes (spawned on Windows) do not re-run the CLI.
+if __name__ == "__main__":
+    pdf_path = "C:/Users/aksha/OneDrive/Documents/Desktop/personalized_studybot/resnet.pdf"
+    cache_base = "ml_types_cache"
 
-# Initialize with a student_id (later can be roll number/login ID)
-sa = StudyAssistant(student_id="student1")
-sa.build_from_pdf(pdf_path, cache_base=cache_base)
+    # Initialize with a student_id (later can be roll number/login ID)
+    sa = StudyAssistant(student_id="student1")
+    sa.build_from_pdf(pdf_path, cache_base=cache_base)
+    print(f"💾 Index cache: {sa.cache_status} {get_cache_stats()}")
 
-print("✅ Assistant is ready. Commands: ask a question, type 'quiz', type 'progress', or 'exit' to quit.")
+    print("✅ Assistant is ready. Commands: ask a question, type 'quiz', type 'progress', 'models', or 'exit' to quit.")
 
-while True:
-    q = input("\nYour command: ")
-    if q.lower().strip() == "exit":
-        print("👋 Exiting Study Assistant. Goodbye!")
-        break
-    elif q.lower().strip() == "quiz":
-        quiz = sa.generate_quiz("ResNet Architecture")
-        print("\n📝 Quiz Generated:\n")
-        print("MCQ:", quiz["mcq"]["mcq"])
-        print("\nShort Question:", quiz["short_question"]["short_question"])
-    elif q.lower().strip() == "progress":
-        progress = sa.track_progress()
-        print("\n📊 Progress Report")
-        print(f"- Total Q&A sessions: {progress['total_qa']}")
-        print(f"- Total Quiz Attempts: {progress['total_quiz']}")
-        print(f"- Quiz Accuracy: {progress['accuracy']}%")
-    else:
-        ans = sa.rag_answer(q)   # Uses RAG-enhanced answers
-        print("\n📘 Question:", q)
-        print("→ Answer:\n")
-        print(ans)
-        print("\n" + "-"*60)
+    while True:
+        q = input("\nYour command: ")
+        if q.lower().strip() == "exit":
+            print("👋 Exiting Study Assistant. Goodbye!")
+            break
+        elif q.lower().strip() == "quiz":
+            quiz = sa.generate_quiz("ResNet Architecture")
+            print("\n📝 Quiz Generated:\n")
+            print("MCQ:", quiz["mcq"]["mcq"])
+            print("\nShort Question:", quiz["short_question"]["short_question"])
+        elif q.lower().strip() == "progress":
+            progress = sa.track_progress()
+            print("\n📊 Progress Report")
+            print(f"- Total Q&A sessions: {progress['total_qa']}")
+            print(f"- Total Quiz Attempts: {progress['total_quiz']}")
+            print(f"- Quiz Accuracy: {progress['accuracy']}%")
+        elif q.lower().strip() == "models":
+            stats = model_stats()
+            print("\n🧠 Models")
+            for name, m in stats["models"].items():
+                print(f"- {name}: loaded={m['loaded']} load_seconds={m['load_seconds']} param_bytes={m['param_bytes']}")
+            print(f"- Backend: {stats['backend']}")
+            print(f"- Process RSS: {stats['process_rss_bytes']} bytes")
+        else:
+            print("\n📘 Question:", q)
+            print("→ Answer:\n")
+            for piece in sa.rag_answer_stream(q):   # RAG answer, printed as it is generated
+                print(piece, end="", flush=True)
+            print("\n\n" + "-"*60)
 
 
 
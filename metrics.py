@@ -0,0 +1,201 @@
+"""
+Lightweight in-process metrics: timing spans per stage and counters.
+
+    import metrics
+    metrics.enable()                      # or STUDYBOT_METRICS=1 in the environment
+    with metrics.trace() as t:            # per-request breakdown (optional)
+        sa.rag_answer("What is a residual block?")
+    print(t.spans)                        # [("embed_query", 0.004), ("chunk_search", ...), ...]
+    print(metrics.snapshot())             # aggregates since start / reset()
+    print(metrics.to_prometheus())
+
+Disabled (the default), span() returns a shared no-op context manager and
+count() returns immediately, so instrumented code pays one global lookup.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+SAMPLES_PER_SPAN = 2048   # recent durations kept per span name, for percentiles
+
+_enabled = os.environ.get("STUDYBOT_METRICS", "") not in ("", "0")
+_lock = threading.Lock()
+_spans = {}                     # name -> {"count", "total", "max", "samples"}
+_counters = defaultdict(float)  # name -> value
+_local = threading.local()      # .traces: stack of active Trace objects
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_span(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def span(name: str):
+    """Context manager timing one stage under name (no-op when disabled)."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def timed(name: str):
+    """Decorator: a span around every call of the decorated function."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_span(name: str, seconds: float):
+    """Record an already-measured duration as a span."""
+    if not _enabled:
+        return
+    with _lock:
+        s = _spans.get(name)
+        if s is None:
+            s = _spans[name] = {"count": 0, "total": 0.0, "max": 0.0, "samples": deque(maxlen=SAMPLES_PER_SPAN)}
+        s["count"] += 1
+        s["total"] += seconds
+        s["max"] = max(s["max"], seconds)
+        s["samples"].append(seconds)
+    for t in getattr(_local, "traces", ()):
+        t.spans.append((name, seconds))
+
+
+def count(name: str, value=1):
+    """Add value to a counter (no-op when disabled)."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] += value
+    for t in getattr(_local, "traces", ()):
+        t.counters[name] += value
+
+
+class Trace:
+    """Spans and counters recorded by the current thread while the trace is active."""
+
+    def __init__(self):
+        self.spans = []
+        self.counters = defaultdict(float)
+
+    def __enter__(self):
+        if not hasattr(_local, "traces"):
+            _local.traces = []
+        _local.traces.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        _local.traces.remove(self)
+        return False
+
+    def totals(self) -> dict:
+        """Seconds per span name within this trace."""
+        out = defaultdict(float)
+        for name, seconds in self.spans:
+            out[name] += seconds
+        return dict(out)
+
+
+def trace() -> Trace:
+    return Trace()
+
+
+def snapshot() -> dict:
+    """Aggregated spans (count, total/p50/p99/max ms) and counters."""
+    with _lock:
+        spans = {}
+        for name, s in _spans.items():
+            ms = np.array(s["samples"]) * 1000
+            spans[name] = {
+                "count": s["count"],
+                "total_ms": round(s["total"] * 1000, 3),
+                "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                "p99_ms": round(float(np.percentile(ms, 99)), 3),
+                "max_ms": round(s["max"] * 1000, 3),
+            }
+        return {"spans": spans, "counters": dict(_counters)}
+
+
+def to_prometheus(prefix="studybot") -> str:
+    """Prometheus text exposition of the current snapshot."""
+    snap = snapshot()
+    lines = [
+        f"# HELP {prefix}_stage_seconds Time spent per pipeline stage.",
+        f"# TYPE {prefix}_stage_seconds summary",
+    ]
+    for name, s in sorted(snap["spans"].items()):
+        label = f'stage="{name}"'
+        lines.append(f'{prefix}_stage_seconds{{{label},quantile="0.5"}} {s["p50_ms"] / 1000}')
+        lines.append(f'{prefix}_stage_seconds{{{label},quantile="0.99"}} {s["p99_ms"] / 1000}')
+        lines.append(f"{prefix}_stage_seconds_sum{{{label}}} {s['total_ms'] / 1000}")
+        lines.append(f"{prefix}_stage_seconds_count{{{label}}} {s['count']}")
+    for name, value in sorted(snap["counters"].items()):
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def to_jsonl() -> str:
+    """One JSON object per span / counter, timestamped, for log shipping or diffing runs."""
+    snap = snapshot()
+    ts = time.time()
+    lines = [json.dumps({"ts": ts, "type": "span", "name": n, **s}) for n, s in sorted(snap["spans"].items())]
+    lines += [json.dumps({"ts": ts, "type": "counter", "name": n, "value": v}) for n, v in sorted(snap["counters"].items())]
+    return "".join(line + "\n" for line in lines)
+
+
+def export_jsonl(path: str):
+    """Append the current snapshot to path as JSON lines."""
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(to_jsonl())
@@ -0,0 +1,138 @@
+import gc
+import os
+import threading
+import time
+
+FLAN_MODEL_NAME = "google/flan-t5-base"
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+DEVICE = -1   # CPU (-1), or 0 if you have GPU
+
+# Inference backend for both models (CPU):
+# "torch" - the Hugging Face models as-is
+# "int8"  - torch dynamic int8 quantization of the Linear layers, no artifacts needed
+# ONNX Runtime graphs are only exported and measured by convert_models.py
+# until its --report shows their drift against torch is acceptable.
+BACKENDS = ("torch", "int8")
+INFERENCE_BACKEND = os.environ.get("STUDYBOT_BACKEND", "torch")
+if INFERENCE_BACKEND not in BACKENDS:
+    raise ValueError(f"STUDYBOT_BACKEND='{INFERENCE_BACKEND}' is not a backend. Known: {BACKENDS}")
+
+
+def _quantize_dynamic(module):
+    import torch
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _load_flan():
+    from transformers import pipeline
+    pipe = pipeline("text2text-generation", model=FLAN_MODEL_NAME, device=DEVICE)
+    if INFERENCE_BACKEND == "int8":
+        pipe.model = _quantize_dynamic(pipe.model)
+    return pipe
+
+
+def _load_minilm():
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(EMBED_MODEL_NAME)
+    return _quantize_dynamic(model) if INFERENCE_BACKEND == "int8" else model
+
+
+# name -> zero-arg loader; models are only loaded on first get_model(name)
+_loaders = {
+    "flan": _load_flan,
+    "minilm": _load_minilm,
+}
+_models = {}
+_load_seconds = {}
+_lock = threading.Lock()
+
+
+def register_model(name: str, loader):
+    """Add or replace a loader (drops any instance already loaded under that name)."""
+    with _lock:
+        _loaders[name] = loader
+        _models.pop(name, None)
+        _load_seconds.pop(name, None)
+
+
+def set_backend(backend: str):
+    """Switch the inference backend; loaded models are dropped and reload on next use."""
+    global INFERENCE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Known: {BACKENDS}")
+    INFERENCE_BACKEND = backend
+    unload("flan", "minilm")
+
+
+def get_model(name: str):
+    """Return the shared instance of a model, loading it once on first use."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _lock:
+        if name not in _models:
+            if name not in _loaders:
+                raise KeyError(f"Unknown model '{name}'. Known: {sorted(_loaders)}")
+            started = time.perf_counter()
+            _models[name] = _loaders[name]()
+            _load_seconds[name] = time.perf_counter() - started
+        return _models[name]
+
+
+def get_flan():
+    return get_model("flan")
+
+
+def get_embedder():
+    return get_model("minilm")
+
+
+def preload(*names):
+    """Load models up front (all registered models if no names are given)."""
+    for name in names or list(_loaders):
+        get_model(name)
+
+
+def unload(*names):
+    """Release models (all if no names are given); they reload on next use."""
+    with _lock:
+        for name in names or list(_models):
+            _models.pop(name, None)
+    gc.collect()
+
+
+def _param_bytes(model):
+    module = getattr(model, "model", model)  # transformers pipeline wraps the torch module
+    try:
+        return sum(p.numel() * p.element_size() for p in module.parameters())
+    except AttributeError:
+        return None
+
+
+def process_rss_bytes():
+    """Current resident memory of this process (None if it cannot be read)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def model_stats() -> dict:
+    """Load state, load time and parameter memory per model, plus process RSS."""
+    with _lock:
+        models = {
+            name: {
+                "loaded": name in _models,
+                "load_seconds": _load_seconds.get(name),
+                "param_bytes": _param_bytes(_models[name]) if name in _models else None,
+            }
+            for name in _loaders
+        }
+    return {"models": models, "backend": INFERENCE_BACKEND, "process_rss_bytes": process_rss_bytes()}
@@ -1,17 +1,14 @@
-from transformers import pipeline
+import re
 
-# Load Flan-T5 (reuse if already loaded elsewhere)
-flan = pipeline(
-    "text2text-generation",
-    model="google/flan-t5-base",
-    device=-1   # CPU (-1), or 0 if you have GPU
+from generation import (   # shared Flan-T5 with answer_refiner / StudyAssistant
+    generate_text, generate_texts, profile_kwargs, prompt_budgets, truncate_tokens
 )
 
-def generate_mcq(context: str, n_options: int = 4) -> dict:
-    """
-    Generate a multiple-choice question with options and one marked correct.
-    """
-    prompt = f"""
+_OPTION_RE = re.compile(r"(?:^|\s)([a-h])\)\s*", re.IGNORECASE)
+
+
+def _mcq_prompt(context: str, n_options: int = 4) -> str:
+    return f"""
     From the following text, create ONE multiple-choice question.
     - Give exactly {n_options} options.
     - Put ✅ after the correct option.
@@ -26,15 +23,9 @@ def generate_mcq(context: str, n_options: int = 4) -> dict:
     Text: {context}
     """
 
-    output = flan(prompt, max_length=250, temperature=0.7)[0]['generated_text']
-    return {"mcq": output}
-
 
-def generate_short_question(context: str) -> dict:
-    """
-    Generate one short descriptive question with its correct answer.
-    """
-    prompt = f"""
+def _short_question_prompt(context: str) -> str:
+    return f"""
     From the following text, create ONE short descriptive question with its correct answer.
     Format like this:
 
@@ -44,6 +35,82 @@ def generate_short_question(context: str) -> dict:
     Text: {context}
     """
 
-    output = flan(prompt, max_length=180, temperature=0.7)[0]['generated_text']
+
+def _fit(contexts: list[str], empty_prompt: str) -> list[str]:
+    """Contexts cut to the tokens the prompt leaves under the encoder limit (a whole chunk can exceed it)."""
+    budget = prompt_budgets([empty_prompt])[0]
+    return [truncate_tokens(c, budget) for c in contexts]
+
+
+def generate_mcq(context: str, n_options: int = 4, profile=None) -> dict:
+    """
+    Generate a multiple-choice question with options and one marked correct.
+    """
+    context = _fit([context], _mcq_prompt("", n_options))[0]
+    output = generate_text(_mcq_prompt(context, n_options), **profile_kwargs(profile, "mcq"))
+    return {"mcq": output}
+
+
+def generate_short_question(context: str, profile=None) -> dict:
+    """
+    Generate one short descriptive question with its correct answer.
+    """
+    context = _fit([context], _short_question_prompt(""))[0]
+    output = generate_text(_short_question_prompt(context), **profile_kwargs(profile, "short_question"))
     return {"short_question": output}
 
+
+def parse_mcq(text: str) -> dict:
+    """
+    Split generated MCQ text into question, options and the ✅-marked answer.
+    Options may be on separate lines or inline ("a) x b) y ✅ c) z").
+    answer / answer_index are None when no option is marked.
+    """
+    parts = _OPTION_RE.split(text)
+    question = re.sub(r"^\s*Q:\s*", "", parts[0]).strip()
+    options, answer_index = [], None
+    for i in range(1, len(parts) - 1, 2):
+        option = parts[i + 1].strip()
+        if "✅" in option:
+            answer_index = len(options)
+            option = option.replace("✅", "").strip()
+        options.append(option)
+    return {
+        "question": question,
+        "options": options,
+        "answer": options[answer_index] if answer_index is not None else None,
+        "answer_index": answer_index,
+        "raw": text,
+    }
+
+
+def parse_short_question(text: str) -> dict:
+    """Split generated "Q: ... A: ..." text into question and answer (None if missing)."""
+    match = re.search(r"(?:^|\s)A:\s*", text)
+    question = text[:match.start()] if match else text
+    answer = text[match.end():].strip() if match else ""
+    return {
+        "question": re.sub(r"^\s*Q:\s*", "", question).strip(),
+        "answer": answer or None,
+        "raw": text,
+    }
+
+
+def generate_quiz_set(contexts: list[str], batch_size: int = 8, n_options: int = 4, profile=None) -> list[dict]:
+    """
+    One MCQ + one short question per context. All prompts go through
+    padded Flan-T5 batches (two generate passes in total) instead of two
+    calls per context. Returns parsed items, in context order.
+    """
+    mcqs = generate_texts(
+        [_mcq_prompt(c, n_options) for c in _fit(contexts, _mcq_prompt("", n_options))],
+        batch_size=batch_size, **profile_kwargs(profile, "mcq")
+    )
+    shorts = generate_texts(
+        [_short_question_prompt(c) for c in _fit(contexts, _short_question_prompt(""))],
+        batch_size=batch_size, **profile_kwargs(profile, "short_question")
+    )
+    return [
+        {"mcq": parse_mcq(mcq), "short_question": parse_short_question(short)}
+        for mcq, short in zip(mcqs, shorts)
+    ]
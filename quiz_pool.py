@@ -0,0 +1,211 @@
+import itertools
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import metrics
+from generation import background_generation
+from quiz_generator import generate_mcq, generate_short_question, generate_quiz_set
+
+QUIZ_POOL_DB = "quiz_pool.db"
+ITEMS_PER_CHUNK = 1     # ready quiz items kept per chunk
+FILL_QUEUE_SIZE = 32    # fill chunks queued at a time; the rest wait in a per-document backlog
+_REFILL, _FILL = 0, 1   # queue priorities: refills of served chunks go first
+
+
+class QuizPool:
+    """
+    Pre-generated quiz items (MCQ + short question) per chunk, stored in
+    SQLite keyed by (document sha256, chunk number) so they survive restarts
+    and are shared by every assistant that loads the same PDF. One
+    background thread generates items, yielding Flan-T5 to interactive
+    calls between items; take() serves a ready one instantly.
+    """
+
+    def __init__(self, db_file=QUIZ_POOL_DB, items_per_chunk=ITEMS_PER_CHUNK):
+        self.items_per_chunk = items_per_chunk
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS quiz_pool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_sha TEXT,
+                chunk INTEGER,
+                mcq TEXT,
+                short_question TEXT,
+                created REAL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_quiz_pool_chunk ON quiz_pool (doc_sha, chunk)")
+        self._conn.commit()
+        self._db_lock = threading.Lock()
+
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()       # FIFO order within a priority
+        self._pending = set()               # (doc_sha, chunk) queued or being generated
+        self._pending_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._backlog = deque()             # [doc_sha, chunks, missing chunk numbers] not queued yet
+        self._fill_queued = 0               # _FILL entries in the queue or being generated
+        self._doc_chunks = {}               # doc_sha -> number of chunks, for the fill level
+        self._waits = deque(maxlen=1000)    # seconds generate_quiz waited per request
+        self.stats_counts = {"generated": 0, "served_from_pool": 0, "generated_inline": 0, "errors": 0}
+
+    def _ready_counts(self, doc_sha):
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT chunk, COUNT(*) FROM quiz_pool WHERE doc_sha=? GROUP BY chunk", (doc_sha,)
+            ).fetchall()
+        return dict(rows)
+
+    def _enqueue(self, priority, doc_sha, chunk, context):
+        with self._pending_lock:
+            if (doc_sha, chunk) in self._pending:
+                return
+            self._pending.add((doc_sha, chunk))
+            if priority == _FILL:
+                self._fill_queued += 1
+        self._queue.put((priority, next(self._seq), doc_sha, chunk, context))
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="quiz-pool", daemon=True)
+                self._thread.start()
+
+    def fill(self, doc_sha, chunks):
+        """
+        Queue generation for every chunk of a document below items_per_chunk,
+        FILL_QUEUE_SIZE chunks at a time (the worker queues more as it goes).
+        """
+        self._doc_chunks[doc_sha] = len(chunks)
+        ready = self._ready_counts(doc_sha)
+        missing = (chunk for chunk in range(len(chunks)) if ready.get(chunk, 0) < self.items_per_chunk)
+        with self._pending_lock:
+            self._backlog.append([doc_sha, chunks, missing])
+        self._top_up()
+
+    def _top_up(self):
+        """Move chunks from the backlog to the queue until FILL_QUEUE_SIZE fill chunks are queued."""
+        while True:
+            with self._pending_lock:
+                if self._fill_queued >= FILL_QUEUE_SIZE or not self._backlog:
+                    return
+                doc_sha, chunks, missing = self._backlog[0]
+                chunk = next(missing, None)
+                if chunk is None:
+                    self._backlog.popleft()
+                    continue
+            self._enqueue(_FILL, doc_sha, chunk, chunks[chunk])   # only missing chunks are read
+
+    def _run(self):
+        while True:
+            priority, _, doc_sha, chunk, context = self._queue.get()
+            try:
+                with metrics.span("quiz_pool_generate"), background_generation():
+                    item = generate_quiz_item(context)
+                self.add_item(doc_sha, chunk, item)
+            except Exception as e:   # keep the worker alive; the chunk is retried on the next fill
+                self.stats_counts["errors"] += 1
+                print(f"⚠️ Quiz pool: generation failed for chunk {chunk}: {e}")
+            finally:
+                with self._pending_lock:
+                    self._pending.discard((doc_sha, chunk))
+                    if priority == _FILL:
+                        self._fill_queued -= 1
+                self._top_up()
+                self._queue.task_done()
+
+    def add_item(self, doc_sha, chunk, item):
+        with self._db_lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO quiz_pool (doc_sha, chunk, mcq, short_question, created) VALUES (?, ?, ?, ?, ?)",
+                (doc_sha, chunk, item["mcq"]["mcq"], item["short_question"]["short_question"], time.time())
+            )
+        self.stats_counts["generated"] += 1
+
+    def take(self, candidates):
+        """
+        Remove and return the ready item of the first candidate (doc_sha,
+        chunk, context) that has one, queueing that chunk for a refill.
+        Returns None when none of the candidates has a ready item.
+        """
+        with self._db_lock, self._conn:
+            for doc_sha, chunk, context in candidates:
+                row = self._conn.execute(
+                    "SELECT id, mcq, short_question FROM quiz_pool WHERE doc_sha=? AND chunk=? ORDER BY id LIMIT 1",
+                    (doc_sha, chunk)
+                ).fetchone()
+                if row:
+                    self._conn.execute("DELETE FROM quiz_pool WHERE id=?", (row[0],))
+                    break
+            else:
+                metrics.count("quiz_pool_misses")
+                return None
+        metrics.count("quiz_pool_hits")
+        self._enqueue(_REFILL, doc_sha, chunk, context)
+        self.stats_counts["served_from_pool"] += 1
+        return {"mcq": {"mcq": row[1]}, "short_question": {"short_question": row[2]}}
+
+    def record_wait(self, seconds, inline):
+        self._waits.append(seconds)
+        if inline:
+            self.stats_counts["generated_inline"] += 1
+
+    def wait_until_idle(self):
+        """Block until every queued and backlogged chunk has been generated (for scripts and tests)."""
+        self._queue.join()
+
+    def stats(self):
+        """Fill level of the pool, queue depth, served/inline counts and request wait times."""
+        target = sum(self._doc_chunks.values()) * self.items_per_chunk
+        with self._db_lock:
+            ready = sum(
+                min(n, self.items_per_chunk)
+                for sha in self._doc_chunks
+                for (n,) in self._conn.execute(
+                    "SELECT COUNT(*) FROM quiz_pool WHERE doc_sha=? GROUP BY chunk", (sha,)
+                )
+            )
+        waits = np.array(self._waits) * 1000
+        stats = dict(
+            self.stats_counts,
+            ready=ready,
+            target=target,
+            fill_level=round(ready / target, 4) if target else 0.0,
+            queue_depth=self._queue.qsize(),
+            backlog_docs=len(self._backlog),
+        )
+        if len(waits):
+            stats["wait_ms_p50"] = round(float(np.percentile(waits, 50)), 3)
+            stats["wait_ms_p99"] = round(float(np.percentile(waits, 99)), 3)
+        return stats
+
+
+def generate_quiz_item(context: str, profile=None) -> dict:
+    """MCQ + short question for one context, in generate_quiz's return format."""
+    return {"mcq": generate_mcq(context, profile=profile), "short_question": generate_short_question(context, profile=profile)}
+
+
+def generate_quiz_items(contexts: list[str], profile=None, batch_size=8) -> list[dict]:
+    """generate_quiz_item for many contexts, in padded Flan-T5 batches (two generate passes in total)."""
+    return [
+        {"mcq": {"mcq": item["mcq"]["raw"]}, "short_question": {"short_question": item["short_question"]["raw"]}}
+        for item in generate_quiz_set(contexts, batch_size=batch_size, profile=profile)
+    ]
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_quiz_pool() -> QuizPool:
+    """Process-wide pool, so concurrent assistants do not generate the same chunks twice."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = QuizPool()
+        return _default_pool
@@ -0,0 +1,407 @@
+"""
+Local HTTP service around one shared StudyAssistant, for many concurrent
+students (standard library only):
+
+    python server.py --pdf resnet.pdf --cache-base resnet_cache --port 8765
+    python server.py --corpus study_corpus     # documents persist there, added / removed at runtime
+    STUDYBOT_SERVER_URL=http://127.0.0.1:8765 streamlit run app.py
+
+Endpoints (JSON in / JSON out):
+    POST /answer     {"question", "student_id", "mode": "rag"|"refine", "top_k", "doc_ids", "profile", "timeout"}
+    POST /quiz       {"topic", "student_id", "doc_ids", "profile", "timeout"}
+    GET  /progress?student_id=...
+    GET  /documents          POST /documents {"pdf_path", "cache_base", "doc_id", "replace"}
+    DELETE /documents?doc_id=...
+    GET  /stats              GET  /health
+
+Answer (and quiz) requests that arrive within --window-ms of each other
+(up to --max-batch) are answered together with one rag_answer_batch /
+answer_batch (generate_quiz_batch) call: one query encode, one FAISS
+search and padded Flan-T5 batches. Model work runs on a single worker thread, batches in arrival
+order. Each request is validated before it joins a batch, so a malformed
+one gets 400 on its own; 404 means an unknown path or document. Documents are ingested on a separate worker and
+the answering side switches to a snapshot of the new corpus when done.
+A full queue is rejected with 503 (backpressure) and a request that
+exceeds its timeout gets 504. Responses carry queue_ms / compute_ms.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+from assistant import StudyAssistant
+from answer_refiner import packing_stats
+from generation import get_profile
+from student_tracking import get_progress
+
+DEFAULT_TIMEOUT = 120.0      # seconds per request, from arrival
+MAX_BODY_BYTES = 1 << 20
+ANSWER_MODES = ("rag", "refine")
+
+
+class Overloaded(Exception):
+    pass
+
+
+class NotFound(LookupError):
+    """Unknown path, or a document that is not loaded (404)."""
+
+
+def _check_fields(body, text_field, documents):
+    """Raise ValueError (KeyError for unknown doc ids) unless body is a well-formed /answer or /quiz payload."""
+    if not isinstance(body, dict):
+        raise ValueError("expected a JSON object")
+    if not isinstance(body.get(text_field), str) or not body[text_field].strip():
+        raise ValueError(f"'{text_field}' must be a non-empty string")
+    if body.get("student_id") is not None and not isinstance(body["student_id"], str):
+        raise ValueError("'student_id' must be a string")
+    timeout = body.get("timeout", DEFAULT_TIMEOUT)
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+        raise ValueError("'timeout' must be a positive number of seconds")
+    get_profile(body.get("profile"))
+    doc_ids = body.get("doc_ids")
+    if doc_ids is not None:
+        if not isinstance(doc_ids, list) or not all(isinstance(d, str) for d in doc_ids):
+            raise ValueError("'doc_ids' must be a list of strings")
+        unknown = set(doc_ids) - set(documents)
+        if unknown:
+            raise KeyError(f"Unknown document(s): {sorted(unknown)}")
+
+
+def check_answer_request(body, documents):
+    _check_fields(body, "question", documents)
+    if body.get("mode", "rag") not in ANSWER_MODES:
+        raise ValueError(f"'mode' must be one of {ANSWER_MODES}")
+    top_k = body.get("top_k", 5)
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+        raise ValueError("'top_k' must be a positive integer")
+
+
+def check_quiz_request(body, documents):
+    _check_fields(body, "topic", documents)
+
+
+def check_document_request(body):
+    """Raise ValueError unless body is a well-formed POST /documents payload."""
+    if not isinstance(body, dict):
+        raise ValueError("expected a JSON object")
+    if not isinstance(body.get("pdf_path"), str) or not body["pdf_path"].strip():
+        raise ValueError("'pdf_path' must be a non-empty string")
+    if not os.path.isfile(body["pdf_path"]):
+        raise ValueError(f"'pdf_path' is not a file: {body['pdf_path']}")
+    for field in ("cache_base", "doc_id"):
+        if body.get(field) is not None and (not isinstance(body[field], str) or not body[field].strip()):
+            raise ValueError(f"'{field}' must be a non-empty string")
+    if not isinstance(body.get("replace", False), bool):
+        raise ValueError("'replace' must be true or false")
+    if body.get("replace") and body.get("doc_id") is None:
+        raise ValueError("'replace' needs the 'doc_id' of the document to replace")
+
+
+class _Pending:
+    __slots__ = ("payload", "future", "enqueued", "cancelled")
+
+    def __init__(self, payload, future):
+        self.payload = payload
+        self.future = future
+        self.enqueued = time.perf_counter()
+        self.cancelled = False
+
+
+class MicroBatcher:
+    """
+    Collects submitted payloads for up to window seconds (or max_batch
+    items), groups them by key_fn(payload) and runs run_batch(key, payloads)
+    on the executor, one group at a time. run_batch returns one result per
+    payload, in order.
+    """
+
+    def __init__(self, name, run_batch, executor, key_fn, max_batch=16, window=0.02, max_queue=256):
+        self.name = name
+        self.run_batch = run_batch
+        self.executor = executor
+        self.key_fn = key_fn
+        self.max_batch = max_batch
+        self.window = window
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.queue_waits = deque(maxlen=2048)
+        self.compute_times = deque(maxlen=2048)
+        self.batch_sizes = deque(maxlen=2048)
+        self.counts = defaultdict(int)
+
+    async def submit(self, payload, timeout):
+        item = _Pending(payload, asyncio.get_running_loop().create_future())
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.counts["rejected"] += 1
+            raise Overloaded(f"{self.name} queue is full ({self.queue.maxsize} pending)")
+        self.counts["requests"] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(item.future), timeout)
+        except asyncio.TimeoutError:
+            item.cancelled = True   # skipped if still queued; a running batch cannot be interrupted
+            self.counts["timeouts"] += 1
+            raise
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            groups = defaultdict(list)
+            for item in batch:
+                if not item.cancelled:
+                    groups[self.key_fn(item.payload)].append(item)
+            for key, items in groups.items():
+                await self._run_group(loop, key, items)
+
+    async def _run_group(self, loop, key, items):
+        started = time.perf_counter()
+        for item in items:
+            self.queue_waits.append(started - item.enqueued)
+        try:
+            results = await loop.run_in_executor(self.executor, self.run_batch, key, [i.payload for i in items])
+        except Exception as e:
+            self.counts["errors"] += len(items)
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+        compute = time.perf_counter() - started
+        self.compute_times.append(compute)
+        self.batch_sizes.append(len(items))
+        self.counts["batches"] += 1
+        for item, result in zip(items, results):
+            if not item.future.done():
+                item.future.set_result({
+                    **result,
+                    "queue_ms": round((started - item.enqueued) * 1000, 2),
+                    "compute_ms": round(compute * 1000, 2),
+                    "batch_size": len(items),
+                })
+
+    def stats(self):
+        def pct(values):
+            ms = np.array(values) * 1000
+            if not len(ms):
+                return {}
+            return {"p50": round(float(np.percentile(ms, 50)), 2), "p99": round(float(np.percentile(ms, 99)), 2)}
+
+        return {
+            **self.counts,
+            "queue_depth": self.queue.qsize(),
+            "mean_batch_size": round(float(np.mean(self.batch_sizes)), 2) if self.batch_sizes else 0.0,
+            "queue_wait_ms": pct(self.queue_waits),
+            "compute_ms": pct(self.compute_times),
+        }
+
+
+class StudyServer:
+    def __init__(self, assistant: StudyAssistant, max_batch=16, window_ms=20, max_queue=256):
+        # Documents are added to the builder on the ingest worker; queries use
+        # `assistant`, a snapshot of it that is replaced when a change finishes
+        # (as in DocumentRegistry), so answering never waits for an ingest.
+        self.builder = assistant
+        self.assistant = assistant.snapshot()
+        # One model worker: Flan-T5 / MiniLM answer and quiz calls never overlap.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="studybot-model")
+        self.ingest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="studybot-ingest")
+        self.answers = MicroBatcher(
+            "answer", self._answer_batch, self.executor,
+            key_fn=lambda p: (p.get("mode", "rag"), p.get("profile"), p.get("top_k", 5),
+                              tuple(p["doc_ids"]) if p.get("doc_ids") else None),
+            max_batch=max_batch, window=window_ms / 1000, max_queue=max_queue,
+        )
+        self.quizzes = MicroBatcher(
+            "quiz", self._quiz_batch, self.executor,
+            key_fn=lambda p: (p.get("profile"), tuple(p["doc_ids"]) if p.get("doc_ids") else None),
+            max_batch=max_batch, window=window_ms / 1000, max_queue=max_queue,
+        )
+        self.started = time.time()
+
+    def _answer_batch(self, key, payloads):
+        mode, profile, top_k, doc_ids = key
+        assistant = self.assistant   # the whole batch uses one corpus snapshot
+        questions = [p["question"] for p in payloads]
+        student_ids = [p.get("student_id") or assistant.student_id for p in payloads]
+        doc_ids = list(doc_ids) if doc_ids else None
+        if mode == "refine":
+            answers = assistant.answer_batch(
+                questions, k_chunks=top_k, batch_size=len(questions), doc_ids=doc_ids,
+                profile=profile, student_ids=student_ids
+            )
+        else:
+            answers = assistant.rag_answer_batch(
+                questions, top_k=top_k, batch_size=len(questions), doc_ids=doc_ids,
+                profile=profile, student_ids=student_ids
+            )
+        return [{"answer": a} for a in answers]
+
+    def _quiz_batch(self, key, payloads):
+        # mostly served from the quiz pool; misses are generated in one padded batch
+        profile, doc_ids = key
+        assistant = self.assistant
+        quizzes = assistant.generate_quiz_batch(
+            [p["topic"] for p in payloads], batch_size=len(payloads), doc_ids=list(doc_ids) if doc_ids else None,
+            profile=profile, student_ids=[p.get("student_id") or assistant.student_id for p in payloads]
+        )
+        return [{"quiz": quiz} for quiz in quizzes]
+
+    async def _documents(self, body):
+        check_document_request(body)
+
+        def add():
+            if body.get("replace"):   # new version of a loaded document, same doc id
+                if body["doc_id"] not in self.builder.documents:
+                    raise NotFound(f"document '{body['doc_id']}'")
+                changed = self.builder.replace_pdf(body["doc_id"], body["pdf_path"], cache_base=body.get("cache_base"))
+                result = {"doc_id": body["doc_id"], "changed": changed}
+            else:
+                doc_id = self.builder.add_pdf(body["pdf_path"], cache_base=body.get("cache_base"), doc_id=body.get("doc_id"))
+                result = {"doc_id": doc_id, "changed": True}
+            if result["changed"]:
+                self.assistant = self.builder.snapshot()
+            return result
+        return await asyncio.get_running_loop().run_in_executor(self.ingest_executor, add)
+
+    async def _remove_document(self, query):
+        doc_id = query.get("doc_id", [None])[0]
+        if not doc_id:
+            raise ValueError("'doc_id' query parameter is required")
+
+        def remove():
+            if doc_id not in self.builder.documents:
+                raise NotFound(f"document '{doc_id}'")
+            self.builder.remove_document(doc_id)
+            self.assistant = self.builder.snapshot()
+        await asyncio.get_running_loop().run_in_executor(self.ingest_executor, remove)
+        return {"doc_id": doc_id, "removed": True}
+
+    async def route(self, method, path, query, body):
+        if method == "POST" and path == "/answer":
+            check_answer_request(body, self.assistant.documents)
+            return await self.answers.submit(body, body.get("timeout", DEFAULT_TIMEOUT))
+        if method == "POST" and path == "/quiz":
+            check_quiz_request(body, self.assistant.documents)
+            return await self.quizzes.submit(body, body.get("timeout", DEFAULT_TIMEOUT))
+        if method == "GET" and path == "/progress":
+            student_id = query.get("student_id", [self.assistant.student_id])[0]
+            return await asyncio.to_thread(get_progress, student_id)
+        if method == "GET" and path == "/documents":
+            return {"documents": self.assistant.documents}
+        if method == "POST" and path == "/documents":
+            return await self._documents(body)
+        if method == "DELETE" and path == "/documents":
+            return await self._remove_document(query)
+        if method == "GET" and path == "/stats":
+            return {
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "answer": self.answers.stats(),
+                "quiz": self.quizzes.stats(),
+                "answer_cache": self.assistant.answer_cache_stats(),
+                "quiz_pool": self.assistant.quiz_pool.stats(),
+                "context_packing": packing_stats(),
+                "corpus": self.assistant.corpus_stats(),
+            }
+        if method == "GET" and path == "/health":
+            return {"ok": True, "ready": self.assistant.index is not None}
+        raise NotFound(f"{method} {path}")
+
+    async def handle(self, reader, writer):
+        status, payload = 200, None
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY_BYTES:
+                raise ValueError("request body too large")
+            body = json.loads(await reader.readexactly(length)) if length else {}
+
+            method, target = request_line[0], request_line[1]
+            url = urlsplit(target)
+            payload = await self.route(method, url.path, parse_qs(url.query), body)
+        except Overloaded as e:
+            status, payload = 503, {"error": str(e)}
+        except asyncio.TimeoutError:
+            status, payload = 504, {"error": "request timed out"}
+        except NotFound as e:
+            status, payload = 404, {"error": f"not found: {e}"}
+        except (ValueError, LookupError) as e:   # LookupError: KeyError (unknown doc_ids), IndexError
+            status, payload = 400, {"error": f"bad request: {e}"}
+        except Exception as e:
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+
+        data = json.dumps(payload).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error",
+                  503: "Service Unavailable", 504: "Gateway Timeout"}[status]
+        head = (
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n"
+            + ("Retry-After: 1\r\n" if status == 503 else "") + "\r\n"
+        )
+        writer.write(head.encode("latin-1") + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        workers = [asyncio.create_task(self.answers.run()), asyncio.create_task(self.quizzes.run())]
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"✅ Study Assistant service on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in workers:
+                task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a StudyAssistant over local HTTP with micro-batching.")
+    parser.add_argument("--pdf", nargs="*", default=[], help="PDFs to load at startup")
+    parser.add_argument("--cache-base", nargs="*", default=[], help="cache base per --pdf (same order)")
+    parser.add_argument("--corpus", help="corpus directory: documents loaded from / added to it persist")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--student-id", default="default")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--window-ms", type=float, default=20)
+    parser.add_argument("--max-queue", type=int, default=256)
+    args = parser.parse_args()
+
+    assistant = StudyAssistant(student_id=args.student_id)
+    if args.corpus:
+        assistant.open_corpus(args.corpus)
+    for i, pdf in enumerate(args.pdf):
+        cache_base = args.cache_base[i] if i < len(args.cache_base) else None
+        if os.path.basename(pdf) in assistant.documents:
+            assistant.replace_pdf(os.path.basename(pdf), pdf, cache_base=cache_base)   # no-op when unchanged
+        else:
+            assistant.add_pdf(pdf, cache_base=cache_base)
+
+    server = StudyServer(assistant, max_batch=args.max_batch, window_ms=args.window_ms, max_queue=args.max_queue)
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
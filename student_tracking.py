@@ -1,11 +1,294 @@
+import atexit
+import queue
 import sqlite3
+import threading
+import time
+from collections import deque
 from datetime import datetime
 
+import numpy as np
+
+import metrics
+
 DB_FILE = "student_progress.db"
 
+# Background writer: log_qa / log_quiz only enqueue; one thread owns a
+# long-lived WAL connection and commits queued rows in groups.
+WRITE_QUEUE_SIZE = 10000    # producers block (backpressure) once this many rows are pending
+WRITE_BATCH_SIZE = 256      # max rows per group commit
+BUSY_TIMEOUT_MS = 5000
+COMMIT_RETRIES = 5              # attempts per group while the database stays locked / busy
+COMMIT_BACKOFF_SECONDS = 0.05   # sleep before the first retry, doubled after each
+FLUSH_TIMEOUT = 30              # seconds get_progress waits for pending rows
+
+
+class _LogWriter:
+    """Single writer thread draining a bounded queue of (sql, params) rows."""
+
+    _STOP = object()
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self.commit_seconds = deque(maxlen=1000)
+        self.stats = {"rows_written": 0, "commits": 0, "errors": 0, "retries": 0, "max_queue_depth": 0}
+        self.thread = threading.Thread(target=self._run, name="student-tracking-writer", daemon=True)
+        self.thread.start()
+
+    def put(self, sql, params):
+        with metrics.span("log_enqueue"):
+            self.queue.put((sql, params))
+        depth = self.queue.qsize()
+        if depth > self.stats["max_queue_depth"]:
+            self.stats["max_queue_depth"] = depth
+
+    def _run(self):
+        conn = None
+        try:
+            while True:
+                items = [self.queue.get()]
+                while len(items) < WRITE_BATCH_SIZE:
+                    try:
+                        items.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                stop = any(item is self._STOP for item in items)
+                rows = [item for item in items if item is not self._STOP]
+                try:
+                    if rows:
+                        conn = conn or _connect(self.db_file)   # retried with the next group if it fails
+                        self._commit(conn, rows)
+                except Exception as e:   # the thread must outlive any error, or flush() waits forever
+                    self.stats["errors"] += 1
+                    print(f"⚠️ student_tracking: dropped {len(rows)} log rows: {e}")
+                finally:
+                    for _ in items:
+                        self.queue.task_done()
+                if stop:
+                    return
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _commit(self, conn, rows):
+        started = time.perf_counter()
+        try:
+            self._write(conn, rows)
+            written = len(rows)
+        except sqlite3.Error as e:
+            if _is_busy(e):
+                raise
+            # one bad row fails the whole transaction: write the rest one by one
+            written = 0
+            for row in rows:
+                try:
+                    self._write(conn, [row])
+                    written += 1
+                except sqlite3.Error as row_error:
+                    self.stats["errors"] += 1
+                    print(f"⚠️ student_tracking: dropped a log row: {row_error}")
+        self.commit_seconds.append(time.perf_counter() - started)
+        metrics.record_span("sqlite_commit", self.commit_seconds[-1])
+        metrics.count("log_rows_committed", written)
+        self.stats["rows_written"] += written
+        self.stats["commits"] += 1
+
+    def _write(self, conn, rows):
+        """Commit rows in one transaction (one fsync), retrying with backoff while the database is locked."""
+        delay = COMMIT_BACKOFF_SECONDS
+        for attempt in range(COMMIT_RETRIES):
+            try:
+                with conn:
+                    for sql, params in rows:
+                        conn.execute(sql, params)
+                return
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == COMMIT_RETRIES - 1:
+                    raise
+                self.stats["retries"] += 1
+                time.sleep(delay)
+                delay *= 2
+
+    def stop(self):
+        self.queue.put(self._STOP)
+        self.thread.join()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _is_busy(error):
+    """True for SQLITE_BUSY / SQLITE_LOCKED: another connection holds the lock, worth retrying."""
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def _connect(db_file):
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _get_writer():
+    """The writer for the current DB_FILE (restarted if DB_FILE was changed)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.db_file != DB_FILE:
+            if _writer is not None:
+                _writer.stop()
+            _writer = _LogWriter(DB_FILE)
+        return _writer
+
+
+def flush(timeout=None):
+    """
+    Block until every queued log row is committed. Returns False instead
+    if the writer thread is not running or timeout seconds pass first.
+    """
+    writer = _writer
+    if writer is None:
+        return True
+    deadline = None if timeout is None else time.monotonic() + timeout
+    pending = writer.queue.all_tasks_done
+    with pending:
+        while writer.queue.unfinished_tasks:
+            if not writer.thread.is_alive():
+                print("⚠️ student_tracking: log writer is not running; pending rows are not committed")
+                return False
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                return False
+            pending.wait(wait)
+    return True
+
+
+def shutdown():
+    """Flush and stop the background writer (also run at interpreter exit)."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.stop()
+            _writer = None
+
+
+atexit.register(shutdown)
+
+
+def writer_stats():
+    """Queue depth, rows written, group commits and commit latency of the log writer."""
+    if _writer is None:
+        return {"queue_depth": 0, "rows_written": 0, "commits": 0, "errors": 0, "retries": 0, "max_queue_depth": 0}
+    latencies = np.array(_writer.commit_seconds) * 1000
+    stats = dict(_writer.stats, queue_depth=_writer.queue.qsize())
+    if len(latencies):
+        stats["commit_ms_p50"] = round(float(np.percentile(latencies, 50)), 3)
+        stats["commit_ms_p99"] = round(float(np.percentile(latencies, 99)), 3)
+        stats["rows_per_commit"] = round(stats["rows_written"] / stats["commits"], 2)
+    return stats
+
+
+# Schema migrations, applied in order by init_db; PRAGMA user_version records
+# the last one applied. Each runs in a single transaction.
+MIGRATIONS = [
+    # 1: indexes + per-student summary kept current by triggers, backfilled once
+    [
+        "CREATE INDEX IF NOT EXISTS idx_qa_log_student_time ON qa_log (student_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_quiz_log_student_time ON quiz_log (student_id, timestamp)",
+        '''
+        CREATE TABLE IF NOT EXISTS student_summary (
+            student_id TEXT PRIMARY KEY,
+            total_qa INTEGER NOT NULL DEFAULT 0,
+            total_quiz INTEGER NOT NULL DEFAULT 0,
+            total_correct INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS qa_log_insert AFTER INSERT ON qa_log BEGIN
+            INSERT INTO student_summary (student_id, total_qa) VALUES (NEW.student_id, 1)
+            ON CONFLICT (student_id) DO UPDATE SET total_qa = total_qa + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS qa_log_delete AFTER DELETE ON qa_log BEGIN
+            UPDATE student_summary SET total_qa = total_qa - 1 WHERE student_id = OLD.student_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS quiz_log_insert AFTER INSERT ON quiz_log BEGIN
+            INSERT INTO student_summary (student_id, total_quiz, total_correct)
+            VALUES (NEW.student_id, 1, COALESCE(NEW.correct, 0))
+            ON CONFLICT (student_id) DO UPDATE SET
+                total_quiz = total_quiz + 1,
+                total_correct = total_correct + COALESCE(NEW.correct, 0);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS quiz_log_delete AFTER DELETE ON quiz_log BEGIN
+            UPDATE student_summary SET
+                total_quiz = total_quiz - 1,
+                total_correct = total_correct - COALESCE(OLD.correct, 0)
+            WHERE student_id = OLD.student_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS quiz_log_update AFTER UPDATE OF student_id, correct ON quiz_log BEGIN
+            UPDATE student_summary SET
+                total_quiz = total_quiz - 1,
+                total_correct = total_correct - COALESCE(OLD.correct, 0)
+            WHERE student_id = OLD.student_id;
+            INSERT INTO student_summary (student_id, total_quiz, total_correct)
+            VALUES (NEW.student_id, 1, COALESCE(NEW.correct, 0))
+            ON CONFLICT (student_id) DO UPDATE SET
+                total_quiz = total_quiz + 1,
+                total_correct = total_correct + COALESCE(NEW.correct, 0);
+        END
+        ''',
+        "DELETE FROM student_summary",
+        '''
+        INSERT INTO student_summary (student_id, total_qa, total_quiz, total_correct)
+        SELECT student_id, SUM(qa), SUM(quiz), SUM(correct) FROM (
+            SELECT student_id, 1 AS qa, 0 AS quiz, 0 AS correct FROM qa_log
+            UNION ALL
+            SELECT student_id, 0, 1, COALESCE(correct, 0) FROM quiz_log
+        )
+        WHERE student_id IS NOT NULL
+        GROUP BY student_id
+        ''',
+    ],
+    # 2: generation profile and generated token count per answer (NULL for older rows)
+    [
+        "ALTER TABLE qa_log ADD COLUMN profile TEXT",
+        "ALTER TABLE qa_log ADD COLUMN output_tokens INTEGER",
+    ],
+]
+
+
+def _migrate(conn):
+    """Apply the MIGRATIONS this database has not seen yet."""
+    conn.isolation_level = None   # explicit transactions: DDL + data + user_version together
+    for version, statements in enumerate(MIGRATIONS, start=1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                conn.execute("ROLLBACK")   # already applied (possibly by another process)
+                continue
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
 def init_db():
-    """Initialize database with tables if not exists."""
-    conn = sqlite3.connect(DB_FILE)
+    """Initialize database with tables if not exists, then apply pending migrations."""
+    conn = _connect(DB_FILE)
     c = conn.cursor()
 
     # Q&A logs
@@ -31,46 +314,47 @@ def init_db():
     ''')
 
     conn.commit()
+    _migrate(conn)
     conn.close()
 
 
-def log_qa(student_id: str, question: str, answer: str):
-    """Log a Q&A interaction."""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO qa_log (student_id, question, answer, timestamp)
-        VALUES (?, ?, ?, ?)
-    ''', (student_id, question, answer, datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+def log_qa(student_id: str, question: str, answer: str, profile: str | None = None, output_tokens: int | None = None):
+    """
+    Log a Q&A interaction (queued; committed by the background writer),
+    with the generation profile used and the tokens generated for it
+    (0 when the answer came from the answer cache).
+    """
+    _get_writer().put('''
+        INSERT INTO qa_log (student_id, question, answer, timestamp, profile, output_tokens)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (student_id, question, answer, datetime.now().isoformat(), profile, output_tokens))
 
 
 def log_quiz(student_id: str, question: str, correct: bool):
-    """Log a quiz attempt."""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
+    """Log a quiz attempt (queued; committed by the background writer)."""
+    _get_writer().put('''
         INSERT INTO quiz_log (student_id, question, correct, timestamp)
         VALUES (?, ?, ?, ?)
     ''', (student_id, question, int(correct), datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
 
 
 def get_progress(student_id: str):
-    """Retrieve student progress summary."""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
+    """
+    Retrieve student progress summary (pending log rows are committed
+    first, waiting up to FLUSH_TIMEOUT for them). Reads the trigger-maintained student_summary row, so the cost does not
+    grow with the log tables.
+    """
+    flush(FLUSH_TIMEOUT)
+    with metrics.span("get_progress"):
+        conn = sqlite3.connect(DB_FILE)
+        c = conn.cursor()
 
-    # Total Q&A count
-    c.execute("SELECT COUNT(*) FROM qa_log WHERE student_id=?", (student_id,))
-    total_qa = c.fetchone()[0]
-
-    # Quiz stats
-    c.execute("SELECT COUNT(*), SUM(correct) FROM quiz_log WHERE student_id=?", (student_id,))
-    total_quiz, total_correct = c.fetchone()
-    conn.close()
+        c.execute(
+            "SELECT total_qa, total_quiz, total_correct FROM student_summary WHERE student_id=?",
+            (student_id,)
+        )
+        total_qa, total_quiz, total_correct = c.fetchone() or (0, 0, 0)
+        conn.close()
 
     if total_quiz == 0:
         accuracy = 0
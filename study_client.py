@@ -0,0 +1,93 @@
+"""
+Thin client for server.py with the StudyAssistant methods the app uses,
+so app.py can run against a shared local service (STUDYBOT_SERVER_URL)
+instead of loading its own models. Standard library only.
+"""
+import json
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+
+REQUEST_TIMEOUT = 300   # seconds; the server applies its own per-request timeout
+
+
+class StudyServiceError(RuntimeError):
+    """The service rejected a request (HTTP error status) or could not be reached."""
+
+
+class StudyClient:
+    def __init__(self, base_url="http://127.0.0.1:8765", student_id="default"):
+        self.base_url = base_url.rstrip("/")
+        self.student_id = student_id
+
+    def _request(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        req = urllib.request.Request(
+            self.base_url + path, data=data, method=method, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise StudyServiceError(f"Study Assistant service: {e.code} {message}") from None
+        except urllib.error.URLError as e:
+            raise StudyServiceError(f"Study Assistant service unreachable at {self.base_url}: {e.reason}") from None
+
+    @property
+    def documents(self):
+        return self._request("GET", "/documents")["documents"]
+
+    def add_pdf(self, pdf_path: str, cache_base: str | None = None, doc_id=None) -> str:
+        """Load a PDF on the server (paths are resolved here; the server shares this filesystem)."""
+        body = {
+            "pdf_path": os.path.abspath(pdf_path),
+            "cache_base": os.path.abspath(cache_base) if cache_base else None,
+            "doc_id": doc_id,
+        }
+        return self._request("POST", "/documents", body)["doc_id"]
+
+    def replace_pdf(self, doc_id: str, pdf_path: str, cache_base: str | None = None) -> bool:
+        """New version of a loaded document on the server; False when its content is unchanged."""
+        body = {
+            "pdf_path": os.path.abspath(pdf_path),
+            "cache_base": os.path.abspath(cache_base) if cache_base else None,
+            "doc_id": doc_id,
+            "replace": True,
+        }
+        return self._request("POST", "/documents", body)["changed"]
+
+    def remove_document(self, doc_id: str):
+        self._request("DELETE", "/documents?" + urllib.parse.urlencode({"doc_id": doc_id}))
+
+    def _answer(self, question, mode, top_k, doc_ids, profile, student_id):
+        return self._request("POST", "/answer", {
+            "question": question, "mode": mode, "top_k": top_k, "doc_ids": doc_ids,
+            "profile": profile, "student_id": student_id or self.student_id,
+        })["answer"]
+
+    def answer(self, question: str, k_chunks=3, doc_ids=None, profile=None, student_id=None) -> str:
+        return self._answer(question, "refine", k_chunks, doc_ids, profile, student_id)
+
+    def rag_answer(self, question: str, top_k=5, doc_ids=None, profile=None, student_id=None) -> str:
+        return self._answer(question, "rag", top_k, doc_ids, profile, student_id)
+
+    def rag_answer_stream(self, question: str, top_k=5, doc_ids=None, profile=None, student_id=None):
+        """Same interface as StudyAssistant.rag_answer_stream; the service answers in one piece."""
+        yield self.rag_answer(question, top_k=top_k, doc_ids=doc_ids, profile=profile, student_id=student_id)
+
+    def generate_quiz(self, question: str, doc_ids=None, profile=None, student_id=None):
+        return self._request("POST", "/quiz", {
+            "topic": question, "doc_ids": doc_ids, "profile": profile, "student_id": student_id or self.student_id,
+        })["quiz"]
+
+    def track_progress(self, student_id=None):
+        query = urllib.parse.urlencode({"student_id": student_id or self.student_id})
+        return self._request("GET", f"/progress?{query}")
+
+    def stats(self):
+        return self._request("GET", "/stats")
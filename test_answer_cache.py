@@ -0,0 +1,16 @@
+import numpy as np
+
+from answer_cache import SemanticAnswerCache
+
+
+def test_loading_a_larger_cache_keeps_the_most_recent_entries(tmp_path):
+    path = str(tmp_path / "answers")
+    vectors = np.eye(8, dtype="float32")
+    cache = SemanticAnswerCache(max_entries=8, path=path)
+    for i, v in enumerate(vectors):
+        cache.store(v, f"q{i}", f"a{i}", namespace="doc")
+    cache.save()
+
+    smaller = SemanticAnswerCache(max_entries=3, path=path)
+    assert smaller.stats()["entries"] == 3
+    assert [smaller.lookup(v, "doc") for v in vectors] == [None] * 5 + ["a5", "a6", "a7"]
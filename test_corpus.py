@@ -0,0 +1,151 @@
+import os
+
+import faiss
+import pytest
+
+import assistant as assistant_module
+import benchmark
+from assistant import StudyAssistant
+from embeddings import embed_texts
+from ingest_pipeline import stream_pages_into_index
+from lexical_index import RETRIEVAL_MODES
+import vector_store
+from vector_store import ivf_nlist
+
+QUESTION = "How are residual blocks stacked in deeper networks?"
+
+
+def _texts(assistant, doc_id):
+    d = assistant.documents[doc_id]
+    return [assistant.chunks[row] for row in range(d["first_chunk"], d["first_chunk"] + d["num_chunks"])]
+
+
+def _add_pages(assistant, doc_id, num_pages, seed):
+    pages = ((page_no, text, 0.0) for page_no, text in benchmark.synthetic_pages(num_pages, seed=seed))
+    doc = stream_pages_into_index(pages, num_pages, index_mode=assistant.index_mode, storage=assistant.storage)
+    assistant._add_document(doc_id, dict(doc, sha256=doc_id))
+    assistant._maybe_compact()
+
+
+def _segments(corpus_dir):
+    return {f.split(".", 1)[0] for f in os.listdir(os.path.join(corpus_dir, "segments"))}
+
+
+def _answers(assistant, doc_ids=None):
+    answers = {}
+    for mode in RETRIEVAL_MODES:
+        assistant.retrieval_mode = mode
+        answers[mode] = assistant._search(QUESTION, 3, 3, doc_ids=doc_ids)
+    return answers
+
+
+def test_corpus_add_replace_remove_compact_reopen(pdfs, tmp_path):
+    corpus_dir = str(tmp_path / "corpus")
+    assistant = StudyAssistant()
+    assistant.open_corpus(corpus_dir)
+    for name in ("a", "b", "c"):
+        assistant.add_pdf(pdfs[name], doc_id=name)
+    assert len(_segments(corpus_dir)) == 3
+    b_text = _texts(assistant, "b")
+    b_dense = _answers(assistant, ["b"])["dense"]
+
+    assistant.remove_document("a")   # a third of the rows: compacted into one base segment right away
+    assert assistant.corpus_stats()["dead_rows"] == 0
+    assert [name[:5] for name in _segments(corpus_dir)] == ["base-"]
+    assert assistant.index.ntotal == len(assistant.chunks) == len(b_text) + len(_texts(assistant, "c"))
+    assert _texts(assistant, "b") == b_text
+    assert _answers(assistant, ["b"])["dense"] == b_dense
+
+    assert not assistant.replace_pdf("c", pdfs["c"])
+    assert assistant.replace_pdf("c", pdfs["a"])
+    assistant.add_pdf(pdfs["c"], doc_id="c2")
+    with pytest.raises(KeyError):
+        assistant._search(QUESTION, 3, 3, doc_ids=["a"])
+
+    reopened = StudyAssistant()
+    assert sorted(reopened.open_corpus(corpus_dir)) == ["b", "c", "c2"]
+    assert len(reopened.index.parts) == len(assistant.index.parts) == 2   # base + c2, searched as mapped
+    assert _texts(reopened, "c") == _texts(assistant, "c")
+    assert _answers(reopened) == _answers(assistant)
+
+
+def test_reopened_base_keeps_removed_rows_dead(pdfs, tmp_path, monkeypatch):
+    monkeypatch.setattr(assistant_module, "COMPACT_DEAD_FRACTION", 1.0)
+    corpus_dir = str(tmp_path / "corpus")
+    assistant = StudyAssistant()
+    assistant.open_corpus(corpus_dir)
+    assistant.add_pdf(pdfs["a"], doc_id="a")
+    assistant.add_pdf(pdfs["b"], doc_id="b")
+    assistant.compact()
+    a_rows = assistant.documents["a"]["num_chunks"]
+    assistant.remove_document("a")   # stays in the base segment as dead rows
+
+    reopened = StudyAssistant()
+    assert reopened.open_corpus(corpus_dir) == ["b"]
+    assert reopened.corpus_stats()["dead_rows"] == a_rows
+    assert _answers(reopened) == _answers(assistant)
+    assert reopened.compact() == a_rows
+    assert _answers(reopened) == _answers(assistant)
+
+
+def test_snapshot_keeps_its_corpus_while_the_builder_changes(pdfs):
+    assistant = StudyAssistant()
+    assistant.add_pdf(pdfs["a"], doc_id="a")
+    snapshot = assistant.snapshot()
+    before = _answers(snapshot)
+
+    assistant.add_pdf(pdfs["b"], doc_id="b")
+    assistant.remove_document("a")
+    assistant.compact()
+    assert set(assistant.documents) == {"b"}
+    assert set(snapshot.documents) == {"a"}
+    assert snapshot.index.ntotal == len(snapshot.chunks)
+    assert _answers(snapshot) == before
+
+
+def test_ivf_is_retrained_as_the_corpus_grows():
+    assistant = StudyAssistant(index_mode="ivf")
+    _add_pages(assistant, "first", 160, seed=1)
+    first_nlist = faiss.extract_index_ivf(assistant.index.parts[0]).nlist
+    _add_pages(assistant, "second", 120, seed=2)   # below twice the trained rows: kept as a second part
+    assert len(assistant.index.parts) == 2
+    _add_pages(assistant, "third", 120, seed=3)
+    assert len(assistant.index.parts) == 1
+    nlist = faiss.extract_index_ivf(assistant.index.parts[0]).nlist
+    assert nlist == ivf_nlist(len(assistant.chunks)) > first_nlist
+    assert assistant._search("residual gradient", 3, 3)
+
+
+def test_pq_fallback_is_reported_and_trained_once_the_corpus_is_large_enough(pdfs, monkeypatch):
+    assistant = StudyAssistant(storage="pq")
+    assistant.add_pdf(pdfs["a"], doc_id="a")
+    assert assistant.ingest_report["fallback"] == {"chunks": "flat/pq -> flat/int8", "sentences": "flat/pq -> flat/int8"}
+    assert assistant.index_footprint()["chunks"]["storage"] == "int8"
+
+    # small codebooks keep training fast; the rows per document stay below their 39 * 2**3 training rows
+    monkeypatch.setattr(vector_store, "PQ_NBITS", 3)
+    _add_pages(assistant, "first", 160, seed=1)
+    _add_pages(assistant, "second", 160, seed=2)
+    assert assistant.index_footprint()["chunks"]["storage"] == "int8"
+    _add_pages(assistant, "third", 160, seed=3)
+    footprint = assistant.index_footprint()
+    assert footprint["chunks"]["vectors"] >= vector_store.pq_min_train() and footprint["chunks"]["parts"] == 1
+    assert (footprint["chunks"]["storage"], footprint["sentences"]["storage"]) == ("pq", "pq")
+    assert footprint["chunks"]["bytes_per_vector"] < 384
+    assert assistant._search("residual gradient", 3, 3)
+
+
+def test_reconstructing_rows_never_modifies_a_shared_index(tmp_path):
+    vectors = embed_texts([text for _, text in benchmark.synthetic_pages(600, words_per_page=40)])
+    index = vector_store.build_faiss_index(vectors, "ivf")
+    assert not faiss.extract_index_ivf(index).direct_map.no()   # mapped when built
+
+    legacy = faiss.clone_index(index)
+    faiss.extract_index_ivf(legacy).set_direct_map_type(faiss.DirectMap.NoMap)
+    before = faiss.serialize_index(legacy)
+    rows = [3, 300, 599]
+    assert vector_store.reconstruct_rows(legacy, rows) == pytest.approx(vectors[rows], abs=1e-5)
+    assert (faiss.serialize_index(legacy) == before).all()
+
+    vector_store.save_index(legacy, str(tmp_path / "legacy.index"))
+    assert not faiss.extract_index_ivf(vector_store.load_index(str(tmp_path / "legacy.index"))).direct_map.no()
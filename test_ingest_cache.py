@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+import model_registry
+import ingest_cache
+from assistant import StudyAssistant
+
+
+def _cache(tmp_path, sha="abc", **settings):
+    base = str(tmp_path / "doc_cache")
+    key = ingest_cache.cache_key(ingest_cache.cache_settings(sha, **settings))
+    for path in ingest_cache.cache_files(base):
+        open(path, "wb").close()
+    ingest_cache.write_manifest(base, key, ingest_cache.cache_settings(sha, **settings))
+    return base
+
+
+def _status(base, sha="abc", **settings):
+    return ingest_cache.check_cache(base, ingest_cache.cache_key(ingest_cache.cache_settings(sha, **settings)))
+
+
+def test_cache_hits_only_for_the_same_settings(tmp_path):
+    base = _cache(tmp_path)
+    assert _status(base) == "hit"
+    assert _status(base, sha="other") == "stale"
+    assert _status(base, index_mode="hnsw") == "stale"
+    assert _status(base, storage="int8") == "stale"
+    assert ingest_cache.check_cache(str(tmp_path / "missing"), "key") == "miss"
+
+
+def test_backend_is_part_of_the_cache_key(tmp_path):
+    base = _cache(tmp_path)
+    model_registry.set_backend("int8")   # the stub loaders stay registered
+    assert _status(base) == "stale"
+    model_registry.set_backend("torch")
+    assert _status(base) == "hit"
+
+
+def test_missing_file_makes_the_cache_stale(tmp_path):
+    base = _cache(tmp_path)
+    os.remove(f"{base}.sent.npz")
+    assert _status(base) == "stale"
+
+
+def test_build_from_pdf_reuses_and_invalidates_the_cache(tmp_path, pdfs):
+    base = str(tmp_path / "a_cache")
+    sa = StudyAssistant()
+    sa.build_from_pdf(pdfs["a"], cache_base=base)
+    assert sa.cache_status == "miss"
+    built = list(sa.chunks)
+
+    sa.build_from_pdf(pdfs["a"], cache_base=base)
+    assert sa.cache_status == "hit"
+    assert list(sa.chunks) == built
+
+    model_registry.set_backend("int8")
+    sa.build_from_pdf(pdfs["a"], cache_base=base)
+    assert sa.cache_status == "stale"
+    sa.build_from_pdf(pdfs["a"], cache_base=base)
+    assert sa.cache_status == "hit"
+
+    StudyAssistant(storage="float16").build_from_pdf(pdfs["a"], cache_base=base)
+    assert ingest_cache.read_manifest(base)["settings"]["storage"] == "float16"
+
+
+def test_legacy_pickle_cache_is_rebuilt(tmp_path, pdfs):
+    base = str(tmp_path / "old_cache")
+    for ext in ("faiss", "pkl"):
+        with open(f"{base}.{ext}", "wb") as f:
+            f.write(b"written before manifests")
+    with pytest.raises(ValueError, match="older version"):
+        StudyAssistant().load_from_cache(base)
+
+    sa = StudyAssistant()
+    sa.build_from_pdf(pdfs["a"], cache_base=base)
+    assert sa.cache_status == "stale"
+    assert not os.path.exists(f"{base}.pkl")
+    sa.load_from_cache(base)
+    assert len(sa.chunks)
+
+
+def test_onnx_formats_are_not_serving_backends():
+    with pytest.raises(ValueError, match="Unknown backend"):
+        model_registry.set_backend("onnx")
+    assert model_registry.INFERENCE_BACKEND == "torch"
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+
+import benchmark
+from embeddings import embed_query, embed_texts
+from lexical_index import build_lexical_index, load_lexical_index, retrieve_sentences, save_lexical_index, tokenize
+from vector_store import (
+    _search_rows, build_faiss_index, build_sentence_index, index_mode, set_search_params
+)
+
+RARE = "The zebracorn table lists every ablation result."
+
+
+def _corpus():
+    chunks = [text for _, text in benchmark.synthetic_pages(400, words_per_page=60)]
+    chunks[137] = RARE + " Nothing else is measured here."
+    return chunks
+
+
+@pytest.mark.parametrize("mode", ["ivf", "hnsw"])
+def test_restricted_search_returns_far_rows(mode):
+    chunks = _corpus()
+    index = build_faiss_index(embed_texts(chunks), mode)
+    assert index_mode(index) == mode
+    set_search_params(index, nprobe=1, ef_search=1)
+    q = embed_query(chunks[0])
+    rows = list(range(200, 400, 7))
+    _, idxs = _search_rows(index, q, 5, rows)
+    vectors = embed_texts([chunks[r] for r in rows])
+    exact = [rows[i] for i in np.argsort(((vectors - q) ** 2).sum(1), kind="stable")[:5]]
+    assert idxs[0].tolist() == exact
+
+
+@pytest.mark.parametrize("mode", ["ivf", "hnsw"])
+@pytest.mark.parametrize("precomputed", [True, False])
+def test_hybrid_sentences_come_from_every_fused_chunk(mode, precomputed):
+    chunks = _corpus()
+    index = build_faiss_index(embed_texts(chunks), mode)
+    set_search_params(index, nprobe=1, ef_search=1)
+    sentence_index = build_sentence_index(chunks) if precomputed else None
+    lexical_index = build_lexical_index(chunks)
+    query = "zebracorn gradient residual"
+
+    sentences, info = retrieve_sentences(
+        query, "hybrid", index, chunks, lexical_index, k_chunks=3, k_sentences=100, sentence_index=sentence_index
+    )
+    assert info["path"] == "hybrid"
+    assert info["lexical_hits"] == sum(bool(set(tokenize(query)) & set(tokenize(c))) for c in chunks)
+    assert RARE in sentences   # the BM25-only chunk reaches the sentence stage
+
+
+def test_lexical_path_reads_sentences_from_the_sentence_index(tmp_path):
+    chunks = _corpus()
+    base = str(tmp_path / "doc")
+    save_lexical_index(build_lexical_index(chunks), base)
+    assert not os.path.exists(f"{base}.lex.chunks")
+    lexical_index = load_lexical_index(base)
+    index = build_faiss_index(embed_texts(chunks))
+
+    for sentence_index in (build_sentence_index(chunks), None):
+        sentences, info = retrieve_sentences(
+            "zebracorn ablation", "lexical", index, chunks, lexical_index, k_chunks=1, k_sentences=1,
+            sentence_index=sentence_index
+        )
+        assert (sentences, info["path"], info["lexical_hits"]) == ([RARE], "lexical", 1)
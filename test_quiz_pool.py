@@ -0,0 +1,78 @@
+import threading
+import time
+
+import benchmark
+import generation
+import model_registry
+import quiz_pool
+from generation import FLAN_MAX_INPUT_TOKENS, generate_texts, token_lengths
+from quiz_pool import QuizPool
+
+
+class RecordingGenerator(benchmark.StubGenerator):
+    """Stub generator that records its prompts and how many calls ever overlapped."""
+
+    def __init__(self):
+        self.prompts = []
+        self.active = self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, prompts, **kwargs):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.prompts.extend([prompts] if isinstance(prompts, str) else prompts)
+        time.sleep(0.01)
+        with self._lock:
+            self.active -= 1
+        return super().__call__(prompts, **kwargs)
+
+
+def _use_generator():
+    generator = RecordingGenerator()
+    model_registry.register_model("flan", lambda: generator)
+    return generator
+
+
+def test_pool_prompts_fit_the_encoder(tmp_path):
+    generator = _use_generator()
+    pool = QuizPool(str(tmp_path / "pool.db"))
+    long_chunk = " ".join(["residual networks ease the training of deeper models."] * 120)   # ~840 words
+    pool.fill("sha", [long_chunk])
+    pool.wait_until_idle()
+    assert pool.stats()["ready"] == 1
+    assert max(token_lengths(generator.prompts)) < FLAN_MAX_INPUT_TOKENS
+
+
+def test_pool_generation_never_overlaps_other_generation(tmp_path):
+    generator = _use_generator()
+    pool = QuizPool(str(tmp_path / "pool.db"))
+    pool.fill("sha", [f"chunk {i} about residual learning." for i in range(10)])
+    for _ in range(10):
+        generate_texts(["What is a residual block?"] * 4, batch_size=4)
+    pool.wait_until_idle()
+    assert generator.max_active == 1
+
+
+def test_pool_waits_while_interactive_calls_are_pending(tmp_path):
+    generator = _use_generator()
+    pool = QuizPool(str(tmp_path / "pool.db"))
+    with generation._flan_lock:   # an interactive caller holds Flan-T5
+        pool.fill("sha", ["a chunk about residual learning."])
+        time.sleep(0.1)
+        assert generator.prompts == []
+        generate_texts(["What is a residual block?"])   # re-entrant for the interactive thread
+    pool.wait_until_idle()
+    assert pool.stats()["ready"] == 1
+
+
+def test_fill_queues_a_bounded_number_of_chunks(tmp_path, monkeypatch):
+    _use_generator()
+    monkeypatch.setattr(quiz_pool, "FILL_QUEUE_SIZE", 3)
+    pool = QuizPool(str(tmp_path / "pool.db"))
+    with generation._flan_lock:
+        pool.fill("sha", [f"chunk {i} about residual learning." for i in range(20)])
+        time.sleep(0.05)
+        assert pool._fill_queued <= 3 and pool._queue.qsize() <= 3
+    pool.wait_until_idle()
+    assert pool.stats()["ready"] == 20
@@ -0,0 +1,145 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from assistant import StudyAssistant
+from server import MicroBatcher, NotFound, StudyServer
+
+
+class _Writer:
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+async def _request(server, method, target, body=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else b""
+    reader, writer = asyncio.StreamReader(), _Writer()
+    reader.feed_data(f"{method} {target} HTTP/1.1\r\nContent-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+    reader.feed_eof()
+    await server.handle(reader, writer)
+    head, _, payload = writer.data.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+def test_failing_batch_only_fails_its_own_group():
+    def run_batch(key, payloads):
+        if key == "bad":
+            raise ValueError("boom")
+        return [{"echo": p["n"]} for p in payloads]
+
+    async def scenario():
+        batcher = MicroBatcher("test", run_batch, ThreadPoolExecutor(max_workers=1), key_fn=lambda p: p["key"], window=0.05)
+        worker = asyncio.create_task(batcher.run())
+        try:
+            return await asyncio.gather(
+                batcher.submit({"key": "ok", "n": 1}, 5), batcher.submit({"key": "bad", "n": 2}, 5),
+                batcher.submit({"key": "ok", "n": 3}, 5), return_exceptions=True,
+            )
+        finally:
+            worker.cancel()
+
+    first, failed, third = asyncio.run(scenario())
+    assert (first["echo"], third["echo"], first["batch_size"]) == (1, 3, 2)
+    assert isinstance(failed, ValueError)
+
+
+def test_malformed_request_is_rejected_before_it_joins_a_batch(pdfs):
+    assistant = StudyAssistant()
+    assistant.add_pdf(pdfs["a"], doc_id="a")
+    server = StudyServer(assistant, window_ms=50)
+
+    async def scenario():
+        workers = [asyncio.create_task(server.answers.run()), asyncio.create_task(server.quizzes.run())]
+        try:
+            return await asyncio.gather(
+                server.route("POST", "/answer", {}, {"question": "What is a residual block?"}),
+                server.route("POST", "/answer", {}, {"question": 42}),
+                server.route("POST", "/answer", {}, {"question": "Why go deeper?", "top_k": "five"}),
+                server.route("POST", "/answer", {}, {"question": "Which layers?", "doc_ids": ["missing"]}),
+                server.route("POST", "/quiz", {}, {"topic": "residual", "profile": "unknown"}),
+                server.route("POST", "/answer", {}, {"question": "How is depth handled?"}),
+                return_exceptions=True,
+            )
+        finally:
+            for task in workers:
+                task.cancel()
+
+    good, bad_type, bad_top_k, unknown_doc, bad_profile, other = asyncio.run(scenario())
+    assert isinstance(bad_type, ValueError) and isinstance(bad_top_k, ValueError) and isinstance(bad_profile, ValueError)
+    assert isinstance(unknown_doc, KeyError)
+    assert good["batch_size"] == other["batch_size"] == 2
+    assert good["answer"] and other["answer"]
+
+
+def test_documents_are_ingested_off_the_model_worker(pdfs):
+    assistant = StudyAssistant()
+    assistant.add_pdf(pdfs["a"], doc_id="a")
+    server = StudyServer(assistant)
+    before = server.assistant
+
+    async def scenario():
+        return await server.route("POST", "/documents", {}, {"pdf_path": pdfs["b"], "doc_id": "b"})
+
+    assert asyncio.run(scenario()) == {"doc_id": "b", "changed": True}
+    assert set(server.assistant.documents) == {"a", "b"}
+    assert set(before.documents) == {"a"}   # queries already running keep their snapshot
+    asyncio.run(server.route("DELETE", "/documents", {"doc_id": ["a"]}, {}))
+    assert set(server.assistant.documents) == {"b"}
+    with pytest.raises(NotFound):
+        asyncio.run(server.route("DELETE", "/documents", {"doc_id": ["a"]}, {}))
+
+
+def test_handle_maps_bad_requests_to_400_and_missing_things_to_404(pdfs):
+    assistant = StudyAssistant()
+    assistant.add_pdf(pdfs["a"], doc_id="a")
+    server = StudyServer(assistant)
+
+    async def scenario():
+        return await asyncio.gather(
+            _request(server, "POST", "/answer", {"question": "Which layers?", "doc_ids": ["missing"]}),
+            _request(server, "POST", "/documents", {"doc_id": "b"}),
+            _request(server, "POST", "/documents", {"pdf_path": pdfs["b"], "replace": True}),
+            _request(server, "POST", "/documents", {"pdf_path": pdfs["b"], "doc_id": "missing", "replace": True}),
+            _request(server, "DELETE", "/documents"),
+            _request(server, "DELETE", "/documents?doc_id=missing"),
+            _request(server, "GET", "/nowhere"),
+            _request(server, "GET", "/health"),
+        )
+
+    statuses = [status for status, _ in asyncio.run(scenario())]
+    assert statuses == [400, 400, 400, 404, 400, 404, 404, 200]
+
+
+def test_quiz_requests_are_generated_as_one_batch(pdfs, monkeypatch):
+    assistant = StudyAssistant()
+    assistant.add_pdf(pdfs["a"], doc_id="a")
+    assistant.quiz_pool.take = lambda keys: None   # every topic misses the pool
+    server = StudyServer(assistant, window_ms=50)
+    calls = []
+    monkeypatch.setattr("assistant.generate_quiz_items", lambda contexts, **kw: calls.append(len(contexts)) or [
+        {"mcq": {"mcq": "Q?"}, "short_question": {"short_question": "Why?"}} for _ in contexts
+    ])
+
+    async def scenario():
+        worker = asyncio.create_task(server.quizzes.run())
+        try:
+            return await asyncio.gather(*(
+                _request(server, "POST", "/quiz", {"topic": topic}) for topic in ("residual", "depth", "shortcut")
+            ))
+        finally:
+            worker.cancel()
+
+    results = asyncio.run(scenario())
+    assert [status for status, _ in results] == [200, 200, 200]
+    assert calls == [3] and results[0][1]["batch_size"] == 3
@@ -0,0 +1,91 @@
+import sqlite3
+import threading
+import time
+
+import student_tracking
+from student_tracking import MIGRATIONS, flush, get_progress, init_db, log_qa, log_quiz, writer_stats
+
+
+def _old_database(path):
+    """A progress DB as written before migrations: the two log tables, no user_version."""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE qa_log (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id TEXT, question TEXT, "
+                 "answer TEXT, timestamp TEXT)")
+    conn.execute("CREATE TABLE quiz_log (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id TEXT, question TEXT, "
+                 "correct INTEGER, timestamp TEXT)")
+    conn.executemany("INSERT INTO qa_log (student_id, question) VALUES (?, ?)",
+                     [("s1", "q1"), ("s1", "q2"), ("s2", "q3"), (None, "q4")])
+    conn.executemany("INSERT INTO quiz_log (student_id, question, correct) VALUES (?, ?, ?)",
+                     [("s1", "q1", 1), ("s1", "q2", 0), ("s1", "q3", None), ("s2", "q4", 1)])
+    conn.commit()
+    conn.close()
+
+
+def _query(sql):
+    conn = sqlite3.connect(student_tracking.DB_FILE)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_old_database_is_migrated_and_backfilled():
+    _old_database(student_tracking.DB_FILE)
+    init_db()
+    init_db()   # already migrated: nothing is applied or backfilled twice
+
+    assert _query("PRAGMA user_version") == [(len(MIGRATIONS),)]
+    assert {"profile", "output_tokens"} <= {row[1] for row in _query("PRAGMA table_info(qa_log)")}
+    assert get_progress("s1") == {"total_qa": 2, "total_quiz": 3, "accuracy": 33.33}
+    assert get_progress("s2") == {"total_qa": 1, "total_quiz": 1, "accuracy": 100.0}
+    assert get_progress("nobody") == {"total_qa": 0, "total_quiz": 0, "accuracy": 0}
+
+
+def test_triggers_keep_the_summary_current():
+    init_db()
+    log_qa("s1", "What is a residual block?", "An identity shortcut.", profile="fast", output_tokens=12)
+    for correct in (True, False, True):
+        log_quiz("s1", "quiz", correct)
+    assert get_progress("s1") == {"total_qa": 1, "total_quiz": 3, "accuracy": 66.67}
+
+    conn = sqlite3.connect(student_tracking.DB_FILE)
+    with conn:
+        conn.execute("UPDATE quiz_log SET correct = 1 WHERE correct = 0")
+        conn.execute("DELETE FROM quiz_log WHERE id = (SELECT MIN(id) FROM quiz_log)")
+        conn.execute("UPDATE quiz_log SET student_id = 's2' WHERE id = (SELECT MAX(id) FROM quiz_log)")
+        conn.execute("DELETE FROM qa_log")
+    conn.close()
+    assert get_progress("s1") == {"total_qa": 0, "total_quiz": 1, "accuracy": 100.0}
+    assert get_progress("s2") == {"total_qa": 0, "total_quiz": 1, "accuracy": 100.0}
+
+
+def test_bad_rows_and_locks_do_not_drop_the_rest_of_a_group(monkeypatch):
+    init_db()
+    monkeypatch.setattr(student_tracking, "BUSY_TIMEOUT_MS", 0)   # surface SQLITE_BUSY to the retry loop
+    monkeypatch.setattr(student_tracking, "COMMIT_BACKOFF_SECONDS", 0.02)
+    locker = sqlite3.connect(student_tracking.DB_FILE, check_same_thread=False)
+    locker.execute("BEGIN IMMEDIATE")   # another writer holds the lock for a while
+    threading.Timer(0.1, locker.rollback).start()
+
+    log_quiz("s1", "quiz", True)
+    student_tracking._get_writer().put("INSERT INTO missing_table VALUES (?)", (1,))
+    log_quiz("s1", "quiz", False)
+    assert flush(timeout=10)
+    locker.close()
+    assert get_progress("s1") == {"total_qa": 0, "total_quiz": 2, "accuracy": 50.0}
+    stats = writer_stats()
+    assert stats["retries"] >= 1 and stats["errors"] == 1 and stats["rows_written"] == 2
+
+
+def test_flush_returns_when_the_writer_cannot_commit(tmp_path, monkeypatch):
+    monkeypatch.setattr(student_tracking, "DB_FILE", str(tmp_path / "missing" / "progress.db"))
+    log_quiz("s1", "quiz", True)   # the writer cannot open the database: the row is dropped, not stuck
+    assert flush(timeout=10)
+    assert writer_stats()["errors"] == 1
+
+    writer = student_tracking._writer
+    writer.stop()
+    writer.queue.put(("SELECT 1", ()))   # queued after the writer stopped
+    started = time.monotonic()
+    assert not flush()
+    assert time.monotonic() - started < 5
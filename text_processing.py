@@ -25,13 +25,52 @@ def split_into_sentences(text):
     return [s for s in sentences if len(s) > 10]  # drop very short ones
 
 
+# (max pages, chunk_size, overlap); None = no upper bound
+CHUNKING_TIERS = [
+    (5, 200, 30),      # small
+    (30, 400, 50),     # medium
+    (None, 600, 100),  # large
+]
+
+
+def chunking_params(num_pages):
+    """
+    Returns (chunk_size, overlap) for a PDF with num_pages pages.
+    """
+    for max_pages, chunk_size, overlap in CHUNKING_TIERS:
+        if max_pages is None or num_pages <= max_pages:
+            return chunk_size, overlap
+
+
+def iter_chunks(pages, chunk_size=400, overlap=50):
+    """
+    Incremental chunk_text over an iterable of (page_no, text).
+    Yields (chunk, first_page, last_page) as soon as a chunk is full; the
+    overlap window carries across page boundaries, so the chunks are the
+    same as chunk_text on the joined text while only ~one chunk is held.
+    """
+    step = chunk_size - overlap
+    words, word_pages = [], []
+
+    for page_no, text in pages:
+        page_words = text.split()
+        words.extend(page_words)
+        word_pages.extend([page_no] * len(page_words))
+
+        while len(words) >= chunk_size:
+            yield " ".join(words[:chunk_size]), word_pages[0], word_pages[chunk_size - 1]
+            del words[:step], word_pages[:step]
+
+    # tail: same trailing (partial) windows chunk_text produces
+    while words:
+        end = min(chunk_size, len(words))
+        yield " ".join(words[:end]), word_pages[0], word_pages[end - 1]
+        del words[:step], word_pages[:step]
+
+
 def adaptive_chunking(text, num_pages):
     """
     Chooses chunk size & overlap based on PDF size.
     """
-    if num_pages <= 5:  # small
-        return chunk_text(text, chunk_size=200, overlap=30)
-    elif num_pages <= 30:  # medium
-        return chunk_text(text, chunk_size=400, overlap=50)
-    else:  # large
-        return chunk_text(text, chunk_size=600, overlap=100)
+    chunk_size, overlap = chunking_params(num_pages)
+    return chunk_text(text, chunk_size=chunk_size, overlap=overlap)
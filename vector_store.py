@@ -1,32 +1,483 @@
+import bisect
+import os
 import re
 import faiss
 import numpy as np
-import pickle
-from embeddings import embed_query, embed_texts
+import metrics
+from embeddings import embed_query, embed_texts, embedding_dim
+from chunk_store import ChunkStore, ChunkSequence, write_chunk_store
 
-def build_faiss_index(embeddings):
-    dim = len(embeddings[0])
-    index = faiss.IndexFlatL2(dim)
-    index.add(np.array(embeddings).astype("float32"))
+# --- Chunk index types ---
+# "flat": exact brute-force scan. "ivf": inverted lists over a k-means coarse
+# quantizer, trained at build time; nprobe lists are scanned per query.
+# "hnsw": navigable small-world graph, no training; efSearch sets the search breadth.
+INDEX_MODES = ("flat", "ivf", "hnsw")
+IVF_MIN_POINTS_PER_LIST = 39   # faiss wants at least this many training points per list
+IVF_TRAIN_SIZE = 16384         # vectors buffered for training in streaming builds
+DEFAULT_NPROBE = 8
+HNSW_M = 32
+DEFAULT_EF_SEARCH = 64
+# A search restricted to rows (IDSelector) on IVF / HNSW only sees the rows the
+# probed lists or the graph walk reach, so far rows come back as -1. Row sets
+# up to this size are scored exactly from their decoded vectors instead.
+EXACT_SEARCH_MAX_ROWS = 4096
+
+# --- Vector storage ---
+# How each vector is stored: "float32" (4 B/dim), "float16" (2 B/dim),
+# "int8" scalar quantization (1 B/dim, trained min/max) or "pq" product
+# quantization (PQ_M bytes per vector, trained codebooks).
+STORAGE_TYPES = ("float32", "float16", "int8", "pq")
+PQ_M = 48              # sub-quantizers; 384 dims / 48 = 8 dims per byte
+PQ_NBITS = 8           # 2**PQ_NBITS centroids per sub-quantizer
+_SQ_TYPES = {
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+def pq_min_train():
+    """Training vectors PQ needs (FAISS k-means wants 39 per centroid); fewer -> "int8" instead."""
+    return 39 * 2 ** PQ_NBITS
+
+def needs_training(mode, storage="float32"):
+    return mode == "ivf" or storage in ("int8", "pq")
+
+def ivf_nlist(n):
+    """IVF list count for n training vectors; 0 if too few for IVF to be worth it."""
+    nlist = min(int(4 * np.sqrt(n)), n // IVF_MIN_POINTS_PER_LIST)
+    return nlist if nlist >= 2 else 0
+
+def _make_index(dim, mode, storage, nlist):
+    if mode == "hnsw":
+        if storage == "float32":
+            return faiss.IndexHNSWFlat(dim, HNSW_M)
+        if storage == "pq":
+            return faiss.IndexHNSWPQ(dim, PQ_M, HNSW_M, PQ_NBITS)
+        return faiss.IndexHNSWSQ(dim, _SQ_TYPES[storage], HNSW_M)
+
+    if mode == "flat" and storage == "float32":
+        return faiss.IndexFlatL2(dim)
+    if mode == "flat" and storage != "pq":
+        return faiss.IndexScalarQuantizer(dim, _SQ_TYPES[storage])
+
+    # IVF, and flat PQ as a single-list IVF (IndexPQ cannot do filtered searches)
+    quantizer = faiss.IndexFlatL2(dim)
+    if storage == "float32":
+        return faiss.IndexIVFFlat(quantizer, dim, nlist)
+    if storage == "pq":
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_M, PQ_NBITS)
+    return faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, _SQ_TYPES[storage])
+
+def _fallback_setup(dim, mode, storage, n, nlist=None):
+    """(mode, storage, nlist) that n training vectors can support (see new_faiss_index)."""
+    if storage == "pq" and (n < pq_min_train() or dim % PQ_M):
+        storage = "int8"
+    if storage == "int8" and n == 0:
+        storage = "float32"
+    if mode == "ivf":
+        nlist = nlist or ivf_nlist(n)
+        if not nlist or n < nlist:
+            mode = "flat"
+    if mode != "ivf":
+        nlist = 1
+    return mode, storage, nlist
+
+def trainable_setup(dim, mode, storage, n):
+    """(mode, storage) of the index new_faiss_index builds when trained on n vectors."""
+    return _fallback_setup(dim, mode, storage, n)[:2]
+
+def new_faiss_index(dim, mode="flat", train_vectors=None, nlist=None, storage="float32"):
+    """
+    Empty chunk index of the given mode and vector storage, trained on
+    train_vectors when needed. Falls back to a simpler setup when there are
+    too few vectors to train on (ivf -> flat, pq -> int8 -> float32).
+    """
+    if mode not in INDEX_MODES:
+        raise ValueError(f"Unknown index mode '{mode}'. Choose from {INDEX_MODES}.")
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Unknown vector storage '{storage}'. Choose from {STORAGE_TYPES}.")
+
+    n = 0 if train_vectors is None else len(train_vectors)
+    mode, storage, nlist = _fallback_setup(dim, mode, storage, n, nlist)
+    index = _make_index(dim, mode, storage, nlist)
+    if not index.is_trained:
+        index.train(np.asarray(train_vectors, dtype="float32"))
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(DEFAULT_NPROBE, ivf.nlist)
+        ivf.make_direct_map()   # kept up to date by add(); reconstruct_rows needs it
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = DEFAULT_EF_SEARCH
+    return index
+
+def build_faiss_index(embeddings, mode="flat", storage="float32"):
+    vectors = np.array(embeddings).astype("float32")
+    index = new_faiss_index(vectors.shape[1], mode, train_vectors=vectors, storage=storage)
+    index.add(vectors)
     return index
 
+def index_mode(index):
+    if isinstance(index, IndexSequence):
+        return index_mode(index.largest_part()) if index.parts else "flat"
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.nlist > 1:
+        return "ivf"
+    if hasattr(index, "hnsw"):
+        return "hnsw"
+    return "flat"
+
+def index_storage(index):
+    """Vector storage of an index (see STORAGE_TYPES; of its largest part for a sequence)."""
+    if isinstance(index, IndexSequence):
+        return index_storage(index.largest_part()) if index.parts else "float32"
+    typed = faiss.downcast_index(index)   # a view: index must stay referenced while it is used
+    if hasattr(typed, "hnsw"):
+        return index_storage(typed.storage)
+    if isinstance(typed, (faiss.IndexIVFPQ, faiss.IndexPQ)):
+        return "pq"
+    sq = getattr(typed, "sq", None)
+    if sq is not None:
+        return "float16" if sq.qtype == _SQ_TYPES["float16"] else "int8"
+    return "float32"
+
+def index_setup(index):
+    """(mode, storage) an index was actually built with, for comparison with trainable_setup."""
+    return index_mode(index), index_storage(index)
+
+def index_bytes_per_vector(index):
+    """Serialized size of the index per stored vector (codes + structure overhead)."""
+    if not index.ntotal:
+        return None
+    parts = index.parts if isinstance(index, IndexSequence) else [index]
+    return sum(len(faiss.serialize_index(p)) for p in parts) / index.ntotal
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Tune search breadth: nprobe for IVF, efSearch for HNSW (ignored otherwise)."""
+    if isinstance(index, IndexSequence):
+        for part in index.parts:
+            set_search_params(part, nprobe, ef_search)
+        return
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    if hasattr(index, "hnsw") and ef_search:
+        index.hnsw.efSearch = ef_search
+
+class IndexSequence:
+    """
+    Concatenation of FAISS indexes searched as one, row ids continuing from
+    part to part (the vector counterpart of ChunkSequence): the corpus
+    index keeps each document's index as it was built or memory-mapped
+    instead of copying its vectors. Parts are never modified once added,
+    so copies share them.
+    """
+
+    def __init__(self, parts=(), d=None):
+        self.parts = []
+        self._ends = []
+        self.d = d
+        for part in parts:
+            self.append(part)
+
+    def append(self, index):
+        """Append an index (or every part of a sequence) after the rows already here."""
+        if isinstance(index, IndexSequence):
+            for part in index.parts:
+                self.append(part)
+            self.d = self.d or index.d
+            return
+        self.d = index.d
+        if index.ntotal:
+            self.parts.append(index)
+            self._ends.append(self.ntotal + index.ntotal)
+
+    def copy(self) -> "IndexSequence":
+        return IndexSequence(self.parts, self.d)
+
+    @property
+    def ntotal(self):
+        return self._ends[-1] if self._ends else 0
+
+    def largest_part(self):
+        return max(self.parts, key=lambda p: p.ntotal)
+
+    def _split(self, rows):
+        """(part, part-local rows, first row of the part) for every part holding one of rows (all parts for None)."""
+        starts = [0] + self._ends[:-1]
+        if rows is None:
+            return [(part, None, first) for part, first in zip(self.parts, starts)]
+        rows = np.asarray(rows, dtype="int64")
+        split = []
+        for part, first, end in zip(self.parts, starts, self._ends):
+            local = rows[(rows >= first) & (rows < end)] - first
+            if len(local):
+                split.append((part, local, first))
+        return split
+
+    def search(self, q, k, rows=None):
+        """(distances, ids) of the k nearest rows over all parts, as index.search (rows restricts the search)."""
+        q = np.asarray(q, dtype="float32").reshape(-1, self.d)
+        dists = [np.full((len(q), k), np.inf, dtype="float32")]
+        ids = [np.full((len(q), k), -1, dtype="int64")]
+        for part, local, first in self._split(rows):
+            part_dists, part_ids = _search_rows(part, q, k, local)
+            dists.append(np.where(part_ids >= 0, part_dists, np.inf))
+            ids.append(np.where(part_ids >= 0, part_ids + first, -1))
+        dists, ids = np.hstack(dists), np.hstack(ids)
+        order = np.argsort(dists, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(dists, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+    def reconstruct_rows(self, rows):
+        rows = np.asarray(rows, dtype="int64")
+        vectors = np.empty((len(rows), self.d), dtype="float32")
+        which = np.searchsorted(self._ends, rows, side="right")
+        for p in np.unique(which):
+            mask = which == p
+            vectors[mask] = reconstruct_rows(self.parts[p], rows[mask] - (self._ends[p - 1] if p else 0))
+        return vectors
+
+    def part_of(self, row):
+        """(part, part-local row) of a corpus row."""
+        p = bisect.bisect_right(self._ends, row)
+        return self.parts[p], row - (self._ends[p - 1] if p else 0)
+
 def split_into_sentences(text):
     return re.split(r'(?<=[.!?])\s+', text.strip())
 
-def search_best_sentences(query, index, chunks, k_chunks=3, k_sentences=3):
-    q = embed_query(query)
-    _, idxs = index.search(q, k_chunks)
-    candidate_chunks = [chunks[i] for i in idxs[0]]
+def new_sentence_index(storage="float32"):
+    """
+    Empty sentence-level index. Sentence rows of chunk i are
+    offsets[i]:offsets[i+1]. With a storage that needs training, vectors
+    are held back until IVF_TRAIN_SIZE of them (or train_sentence_index)
+    train the index, as for chunk indexes in ingest_pipeline.
+    """
+    if needs_training("flat", storage):
+        return {"index": None, "sentences": [], "offsets": [0], "untrained": {"storage": storage, "vectors": []}}
+    return {"index": new_faiss_index(embedding_dim(), storage=storage), "sentences": [], "offsets": [0]}
 
-    sentences = []
-    for ch in candidate_chunks:
+def add_to_sentence_index(sentence_index, chunks):
+    """Split and embed the sentences of chunks appended after the ones already indexed."""
+    new_sentences = []
+    for ch in chunks:
         ss = [s.strip() for s in split_into_sentences(ch) if s.strip()]
-        sentences.extend(ss)
+        new_sentences.extend(ss)
+        sentence_index["sentences"].extend(ss)
+        sentence_index["offsets"].append(len(sentence_index["sentences"]))
+
+    if not new_sentences:
+        return
+    vectors = np.asarray(embed_texts(new_sentences), dtype="float32")
+    untrained = sentence_index.get("untrained")
+    if untrained is None:
+        sentence_index["index"].add(vectors)
+        return
+    untrained["vectors"].append(vectors)
+    if sum(len(v) for v in untrained["vectors"]) >= IVF_TRAIN_SIZE:
+        train_sentence_index(sentence_index)
+
+def train_sentence_index(sentence_index):
+    """Train a sentence index on the vectors it has held back, then add them (no-op once trained)."""
+    untrained = sentence_index.pop("untrained", None)
+    if untrained is None:
+        return
+    vectors = np.vstack(untrained["vectors"]) if untrained["vectors"] else np.empty((0, embedding_dim()), dtype="float32")
+    sentence_index["index"] = new_faiss_index(embedding_dim(), train_vectors=vectors, storage=untrained["storage"])
+    sentence_index["index"].add(vectors)
+
+def _concat_ids(a, b, shift=0):
+    return np.concatenate([np.asarray(a, dtype="int64"), np.asarray(b, dtype="int64") + shift])
+
+def merge_sentence_index(target, source):
+    """
+    Sentence index of target's chunks followed by source's, sharing both
+    (no re-embedding, no vector copies); neither input is modified.
+    """
+    return {
+        "index": IndexSequence([target["index"], source["index"]]),
+        "sentences": ChunkSequence([target["sentences"], source["sentences"]]),
+        "offsets": _concat_ids(target["offsets"], source["offsets"][1:], int(target["offsets"][-1])),
+    }
 
+def build_sentence_index(chunks, storage="float32"):
+    """Precompute sentence embeddings for every chunk (done once at ingest time)."""
+    sentence_index = new_sentence_index(storage)
+    add_to_sentence_index(sentence_index, chunks)
+    train_sentence_index(sentence_index)
+    return sentence_index
+
+def clone_index(index):
+    """
+    Independent copy of an index (None stays None). A memory-mapped index
+    stays mapped, read-only; a sequence is copied without its parts.
+    """
+    if isinstance(index, IndexSequence):
+        return index.copy()
+    return faiss.clone_index(index) if index is not None else None
+
+def copy_sentence_index(sentence_index):
+    """Copy of a sentence index sharing its (never modified) vectors, text and offsets."""
+    if sentence_index is None:
+        return None
+    return dict(sentence_index, index=clone_index(sentence_index["index"]))
+
+# Rows decoded per step when an index is rebuilt (bounds the float32 copy).
+SELECT_BATCH_ROWS = 65536
+
+def select_index_ranges(index, ranges, mode="flat", storage="float32"):
+    """
+    New in-memory index of the given mode and storage holding only the
+    vectors of the given (start, stop) row ranges, renumbered in order.
+    When it needs training, it is trained (and its IVF nlist sized) for the
+    selected rows, on up to IVF_TRAIN_SIZE of them (decoded vectors, so
+    approximate when index is quantized).
+    """
+    n = sum(stop - start for start, stop in ranges)
+    train_vectors = None
+    if needs_training(mode, storage) and n:
+        rows = np.concatenate([np.arange(start, stop) for start, stop in ranges])
+        if n > IVF_TRAIN_SIZE:
+            rows = np.sort(np.random.default_rng(0).choice(rows, IVF_TRAIN_SIZE, replace=False))
+        train_vectors = reconstruct_rows(index, rows)
+    selected = new_faiss_index(index.d, mode, train_vectors, nlist=ivf_nlist(n) if mode == "ivf" else None, storage=storage)
+    for start, stop in ranges:
+        for first in range(start, stop, SELECT_BATCH_ROWS):
+            selected.add(reconstruct_rows(index, np.arange(first, min(stop, first + SELECT_BATCH_ROWS))))
+    return selected
+
+def select_sentence_ranges(sentence_index, ranges, storage="float32"):
+    """
+    Sentence index of the chunks in the given (start, stop) chunk row
+    ranges, renumbered in order, rebuilt with the given storage.
+    """
+    offsets = np.asarray(sentence_index["offsets"], dtype="int64")
+    sentence_ranges = [(int(offsets[start]), int(offsets[stop])) for start, stop in ranges]
+    new_offsets = [np.zeros(1, dtype="int64")]
+    for (start, stop), (s_start, _) in zip(ranges, sentence_ranges):
+        new_offsets.append(offsets[start + 1:stop + 1] - s_start + new_offsets[-1][-1])
+    return {
+        "index": select_index_ranges(sentence_index["index"], sentence_ranges, storage=storage),
+        "sentences": ChunkSequence([sentence_index["sentences"]]).select(sentence_ranges),
+        "offsets": np.concatenate(new_offsets),
+    }
+
+def reconstruct_rows(index, rows):
+    """Stored vectors of the given rows (decoded, so approximate for quantized storage)."""
+    if not len(rows):
+        return np.empty((0, index.d), dtype="float32")
+    if isinstance(index, IndexSequence):
+        return index.reconstruct_rows(rows)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.no():
+        # indexes may be shared between snapshots: map a private copy, never the index itself
+        index = faiss.clone_index(index)
+        faiss.extract_index_ivf(index).make_direct_map()
+    return np.asarray(index.reconstruct_batch(np.asarray(rows, dtype="int64")), dtype="float32")
+
+def mmr_select(query_vector, vectors, n, diversity=0.3):
+    """
+    Maximal marginal relevance: positions of up to n vectors that are close
+    to the query but not to each other. diversity 0 = pure relevance order.
+    """
+    def unit(x):
+        x = np.asarray(x, dtype="float32")
+        return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+    vecs, q = unit(vectors), unit(query_vector).reshape(-1)
+    relevance = vecs @ q
+    selected = []
+    while len(selected) < min(n, len(vecs)):
+        scores = relevance.copy()
+        if selected:
+            redundancy = (vecs @ vecs[selected].T).max(axis=1)
+            scores = (1 - diversity) * relevance - diversity * redundancy
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return selected
+
+def _selector_params(index, rows):
+    """Search parameters restricting a search to rows, of the type the index expects."""
+    sel = faiss.IDSelectorBatch(np.asarray(rows, dtype="int64"))
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=sel, nprobe=ivf.nprobe)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=sel)
+
+def _exact_search_rows(index, q, k, rows):
+    """(distances, ids) as from index.search, by squared L2 over the decoded vectors of rows."""
+    rows = np.asarray(rows, dtype="int64")
+    vectors = reconstruct_rows(index, rows)
+    q = np.asarray(q, dtype="float32").reshape(-1, index.d)
+    dists = (q ** 2).sum(1)[:, None] - 2 * q @ vectors.T + (vectors ** 2).sum(1)[None, :]
+    order = np.argsort(dists, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(dists, order, axis=1).astype("float32"), rows[order]
+
+def _widened_params(index, rows):
+    """Selector search parameters that scan every IVF list / walk the HNSW graph wider."""
+    params = _selector_params(index, rows)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params.nprobe = ivf.nlist
+    elif hasattr(index, "hnsw"):
+        params.efSearch = max(index.hnsw.efSearch, min(len(rows), 16 * DEFAULT_EF_SEARCH))
+    return params
+
+def _search_rows(index, q, k, rows=None):
+    """
+    index.search, optionally restricted to the given row ids. Restricted
+    searches on IVF / HNSW are exact for small row sets and retried wider
+    when the approximate search returns fewer than k rows.
+    """
+    if isinstance(index, IndexSequence):
+        return index.search(q, k if rows is None else max(1, min(k, len(rows))), rows)
+    if rows is None:
+        return index.search(q, k)
+    k = max(1, min(k, len(rows)))
+    if index_mode(index) == "flat":
+        return index.search(q, k, params=_selector_params(index, rows))
+    if len(rows) <= EXACT_SEARCH_MAX_ROWS:
+        return _exact_search_rows(index, q, k, rows)
+    dists, idxs = index.search(q, k, params=_selector_params(index, rows))
+    if (idxs < 0).any():
+        metrics.count("search_widened")
+        dists, idxs = index.search(q, k, params=_widened_params(index, rows))
+    return dists, idxs
+
+def _best_precomputed_sentences(q, chunk_idxs, sentence_index, k_sentences):
+    """Rank the precomputed sentences of the retrieved chunks with a single search."""
+    offsets = sentence_index["offsets"]
+    rows = [r for ci in chunk_idxs if ci >= 0 for r in range(offsets[ci], offsets[ci + 1])]
+    if not rows:
+        return []
+
+    with metrics.span("sentence_search"):
+        _, sidx = _search_rows(sentence_index["index"], q, k_sentences, rows)
+    return [sentence_index["sentences"][i] for i in sidx[0] if i >= 0]
+
+def chunk_sentences(chunk_idxs, chunks, sentence_index=None):
+    """Sentences of the given chunks in order: stored in the sentence index, else split from the chunk text."""
+    if sentence_index is not None:
+        offsets, sentences = sentence_index["offsets"], sentence_index["sentences"]
+        return [sentences[r] for ci in chunk_idxs if ci >= 0 for r in range(offsets[ci], offsets[ci + 1])]
+    return [s.strip() for ci in chunk_idxs if ci >= 0 for s in split_into_sentences(chunks[ci]) if s.strip()]
+
+def best_sentences(q, chunk_idxs, chunks, k_sentences=3, sentence_index=None):
+    """
+    Sentence stage on its own: the sentences of the given chunk rows
+    closest to the encoded query q, from precomputed vectors when there is
+    a sentence_index, else embedded now.
+    """
+    if sentence_index is not None:
+        return _best_precomputed_sentences(q, chunk_idxs, sentence_index, k_sentences)
+
+    sentences = chunk_sentences(chunk_idxs, chunks)
     if not sentences:
         return []
 
-    sent_vecs = embed_texts(sentences)
+    metrics.count("sentences_encoded", len(sentences))
+    with metrics.span("sentence_embed"):
+        sent_vecs = embed_texts(sentences)
     dim = sent_vecs.shape[1]
     temp = faiss.IndexFlatL2(dim)
     temp.add(sent_vecs)
@@ -34,17 +485,133 @@ def search_best_sentences(query, index, chunks, k_chunks=3, k_sentences=3):
     best = [sentences[i] for i in sidx[0]]
     return best
 
+def search_chunks(query, index, k=3, rows=None, query_vector=None):
+    """Row ids of the k chunks nearest to query, nearest first (rows restricts the search)."""
+    q = embed_query(query) if query_vector is None else query_vector
+    with metrics.span("chunk_search"):
+        _, idxs = _search_rows(index, q, k, rows)
+    return [int(i) for i in idxs[0] if i >= 0]
+
+def search_best_sentences(query, index, chunks, k_chunks=3, k_sentences=3, sentence_index=None, rows=None,
+                          query_vector=None):
+    """
+    Two-stage retrieval: top chunks, then the sentences closest to the query.
+    With a sentence_index (see build_sentence_index) the sentence stage uses
+    precomputed vectors; without one, sentences are embedded per query.
+    rows optionally restricts the chunk search to those chunk rows
+    (e.g. the chunks of selected documents). query_vector skips re-encoding
+    a query that was already embedded (as returned by embed_query).
+    """
+    q = embed_query(query) if query_vector is None else query_vector
+    with metrics.span("chunk_search"):
+        _, idxs = _search_rows(index, q, k_chunks, rows)
+    metrics.count("chunks_retrieved", int((idxs[0] >= 0).sum()))
+    return best_sentences(q, idxs[0], chunks, k_sentences, sentence_index)
+
+def search_best_sentences_batch(queries, index, chunks, k_chunks=3, k_sentences=3, sentence_index=None, rows=None,
+                                query_vectors=None):
+    """
+    Batched search_best_sentences: one encode for all queries, one FAISS search
+    for their chunks and, in two-stage mode, one encode for the union of the
+    candidate sentences. Returns one sentence list per query, in order.
+    query_vectors optionally supplies the already-encoded queries.
+    """
+    if not queries:
+        return []
+
+    if query_vectors is None:
+        with metrics.span("embed_query"):
+            query_vectors = embed_texts(list(queries))
+    qs = query_vectors
+    with metrics.span("chunk_search"):
+        _, idxs = _search_rows(index, qs, k_chunks, rows)
+    metrics.count("chunks_retrieved", int((idxs >= 0).sum()))
+
+    if sentence_index is not None:
+        return [
+            _best_precomputed_sentences(qs[i:i + 1], idxs[i], sentence_index, k_sentences)
+            for i in range(len(queries))
+        ]
+
+    per_query = [chunk_sentences(row, chunks) for row in idxs]
+    unique = list(dict.fromkeys(s for ss in per_query for s in ss))
+    if not unique:
+        return [[] for _ in queries]
+
+    metrics.count("sentences_encoded", len(unique))
+    with metrics.span("sentence_embed"):
+        sent_vecs = embed_texts(unique)
+    row_of = {s: i for i, s in enumerate(unique)}
+
+    results = []
+    for qi, ss in enumerate(per_query):
+        if not ss:
+            results.append([])
+            continue
+        dists = ((sent_vecs[[row_of[s] for s in ss]] - qs[qi]) ** 2).sum(axis=1)
+        order = np.argsort(dists, kind="stable")[:k_sentences]
+        results.append([ss[j] for j in order])
+    return results
+
 # --- Cache helpers ---
+# Writes go to a temp file first so a crash never leaves a half-written cache.
 def save_index(index, path):
-    faiss.write_index(index, path)
+    tmp_path = f"{path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
 
-def load_index(path):
-    return faiss.read_index(path)
+# Memory-map the stored vectors (IndexFlatCodes storage, IVF lists) instead of reading them into RAM.
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_MMAP
+
+def load_index(path, mmap=True):
+    """
+    Read an index; with mmap, its vectors stay in the file and are paged in
+    by searches (falls back to a full read where FAISS cannot map the type).
+    A mapped index is read-only: clone_index it before adding vectors.
+    IVF indexes saved without a direct map (older caches) get one here,
+    before the index can be shared.
+    """
+    index = None
+    if mmap:
+        try:
+            index = faiss.read_index(path, MMAP_FLAGS)
+        except RuntimeError:
+            pass
+    if index is None:
+        index = faiss.read_index(path)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.no():
+        ivf.make_direct_map()
+    return index
 
 def save_chunks(chunks, path):
-    with open(path, "wb") as f:
-        pickle.dump(chunks, f)
+    write_chunk_store(path, chunks)
 
 def load_chunks(path):
-    with open(path, "rb") as f:
-        return pickle.load(f)
+    """Chunk texts of a chunk store, decoded lazily by row."""
+    return ChunkStore(path)
+
+def save_chunk_pages(chunk_pages, path):
+    """(first_page, last_page) per chunk as an int32 array (-1 = unknown)."""
+    pages = np.array([p if p is not None else (-1, -1) for p in chunk_pages], dtype="int32").reshape(-1, 2)
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, pages, allow_pickle=False)
+    os.replace(tmp_path, path)
+
+def load_chunk_pages(path):
+    pages = np.load(path, allow_pickle=False)
+    return [(int(a), int(b)) if a >= 0 else None for a, b in pages]
+
+def save_sentence_index(sentence_index, cache_base):
+    save_index(sentence_index["index"], f"{cache_base}.sent.faiss")
+    save_chunks(sentence_index["sentences"], f"{cache_base}.sent.chunks")
+    tmp_path = f"{cache_base}.sent.tmp.npz"
+    np.savez(tmp_path, offsets=np.asarray(sentence_index["offsets"], dtype="int64"))
+    os.replace(tmp_path, f"{cache_base}.sent.npz")
+
+def load_sentence_index(cache_base):
+    with np.load(f"{cache_base}.sent.npz", allow_pickle=False) as ids:
+        sentence_index = {"offsets": ids["offsets"]}
+    sentence_index["sentences"] = ChunkSequence([load_chunks(f"{cache_base}.sent.chunks")])
+    sentence_index["index"] = load_index(f"{cache_base}.sent.faiss")
+    return sentence_index